@@ -11,10 +11,6 @@ from pathlib import Path
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent / 'src'))
 
-from indexer import FileIndexer
-from vectordb import VectorDB
-from utils import load_config
-
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,6 +21,10 @@ logger = logging.getLogger(__name__)
 
 async def main():
     """Main function to index directory"""
+    # Not at module level: spawned index_directory workers re-run this file as __mp_main__
+    from indexer import FileIndexer
+    from vectordb import VectorDB
+    from utils import load_config
     
     if len(sys.argv) != 2:
         print("Usage: python index_directory.py <directory_path>")
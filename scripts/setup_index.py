@@ -21,8 +21,6 @@ import argparse
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 
-from indexer import FileIndexer
-from utils import load_config
 import logging
 
 level_name = os.getenv("LOGLEVEL", "INFO").upper()
@@ -33,6 +31,9 @@ logger = logging.getLogger(__name__)
 
 async def main():
     """Create initial index for specified or configured directories"""
+    # Not at module level: spawned index_directory workers re-run this file as __mp_main__
+    from indexer import FileIndexer
+    from utils import load_config
     
     parser = argparse.ArgumentParser(description="Initial index setup for MCP Local RAG")
     parser.add_argument("directories", nargs="*", help="Directories to index (optional; otherwise from config)")
@@ -19,15 +19,10 @@ from typing import Any, Dict, List, Optional
 # Add src to path for imports
 sys.path.insert(0, str(Path(__file__).parent / 'src'))
 
-from mcp.server import Server
-from mcp.server.stdio import stdio_server
-from mcp.types import Tool
-
-from indexer import FileIndexer
-from search import SearchEngine
-from vectordb import VectorDB
-from utils import load_config
-from discovery import resolve_project_config, effective_filters, discover_files
+try:
+    import uvloop  # optional speedup (libuv event loop): pip install ".[fast]"
+except ImportError:
+    uvloop = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,6 +30,17 @@ logger = logging.getLogger(__name__)
 
 async def main():
     """Main entry point for MCP server"""
+    # Imported here, not at module level: spawned index_directory workers re-run this
+    # file as __mp_main__ and would otherwise load chromadb and the embedding stack
+    from mcp.server import Server
+    from mcp.server.stdio import stdio_server
+    from mcp.types import Tool
+    
+    from indexer import FileIndexer
+    from search import SearchEngine
+    from vectordb import VectorDB, flush_file_indexes
+    from utils import load_config
+    from discovery import resolve_project_config, effective_filters, discover_files
     
     # Initialize server
     server = Server("mcp-local-rag")
@@ -139,13 +145,14 @@ async def main():
 
                         # Discover changed files using centralized discovery
                         delta = int(time.time() - timestamp_file.stat().st_mtime)
-                        changed_paths = discover_files(
+                        changed_paths = list(discover_files(
                             dir_path=dir_path,
                             enabled_extensions=dir_enabled_exts,
                             exclude_dirs=dir_excludes,
                             changed_within_seconds=delta,
                             since_timestamp_file=timestamp_file,
-                        )
+                            fast_mtime=bool(dir_config.get('fast_mtime', False)),
+                        ))
 
                         if changed_paths:
                             logger.info(f"Found {len(changed_paths)} changed files in {directory}")
@@ -673,8 +680,17 @@ async def main():
         if tasks:
             await asyncio.gather(*tasks, return_exceptions=True)
         
+        # Persist file indexes whose sidecar writes were deferred
+        try:
+            await flush_file_indexes()
+        except Exception as e:
+            logger.error(f"Error saving file indexes: {e}")
+        
         logger.info("Server stopped.")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -0,0 +1,198 @@
+"""
+Read, hash and chunk files for the indexer
+
+Kept free of chromadb/embeddings imports: spawned index_directory workers
+import this module to run _prepare_file.
+"""
+
+import hashlib
+import mmap
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import tiktoken
+
+try:
+    import blake3 as _blake3  # optional speedup: pip install ".[fast]"
+except ImportError:
+    _blake3 = None
+
+try:
+    from numba import njit  # optional JIT for the chunk boundary loop: pip install ".[jit]"
+except ImportError:
+    njit = None
+
+try:
+    from crc32c import crc32c as _crc32  # SSE4.2/ARMv8 CRC32C: pip install ".[fast]"
+except ImportError:
+    from zlib import crc32 as _crc32
+
+
+# BLAKE3 (SIMD) when installed, MD5 otherwise; stored as file_metadata "hash_alg" so that
+# installing or removing blake3 is not mistaken for every file having changed
+HASH_ALG = 'blake3' if _blake3 is not None else 'md5'
+
+
+def _hash_available(alg: str) -> bool:
+    """True if hashes of this algorithm can be computed here"""
+    return alg == 'md5' or (alg == 'blake3' and _blake3 is not None)
+
+
+def _new_hasher(alg: str = HASH_ALG):
+    """BLAKE3 or MD5 hasher"""
+    if alg == 'blake3':
+        return _blake3.blake3()
+    return hashlib.md5()
+
+
+def _hexdigest(hasher, alg: str = HASH_ALG) -> str:
+    """128-bit hex digest for a hasher from _new_hasher(alg)"""
+    if alg == 'blake3':
+        return hasher.hexdigest(length=16)
+    return hasher.hexdigest()
+
+
+def _digest(data: bytes, alg: str = HASH_ALG) -> str:
+    """128-bit hex digest of data"""
+    hasher = _new_hasher(alg)
+    hasher.update(data)
+    return _hexdigest(hasher, alg)
+
+
+# Below this size a plain read() is cheaper than setting up a mapping
+_MMAP_MIN_SIZE = 4096
+
+
+def _hash_file(file_path: str, alg: str = HASH_ALG) -> str:
+    """Hex digest of a file's bytes"""
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _MMAP_MIN_SIZE:  # also covers empty files, which cannot be mapped
+            return _digest(f.read(), alg)
+        # Hash straight from the page cache instead of copying the file into a bytes object
+        hasher = _new_hasher(alg)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            hasher.update(view)
+        return _hexdigest(hasher, alg)
+
+
+# Per-process tokenizer for _prepare_file running in pool workers
+_worker_tokenizer = None
+
+
+def _get_tokenizer():
+    global _worker_tokenizer
+    if _worker_tokenizer is None:
+        _worker_tokenizer = tiktoken.get_encoding("cl100k_base")
+    return _worker_tokenizer
+
+
+class FileChunk:
+    """Represents a chunk of a file"""
+    
+    def __init__(
+        self,
+        content: str,
+        file_path: str,
+        start_line: int,
+        end_line: int,
+        chunk_index: int,
+        metadata: Optional[Dict] = None
+    ):
+        self.content = content
+        self.file_path = file_path
+        self.start_line = start_line
+        self.end_line = end_line
+        self.chunk_index = chunk_index
+        self.metadata = metadata or {}
+        
+        # Generate unique ID (path + index already make it unique; the checksum only tags content)
+        self.id = f"{file_path}:{chunk_index}:{_crc32(content.encode()):08x}"
+    
+    def to_dict(self) -> Dict:
+        """Convert to dictionary for storage"""
+        return {
+            "id": self.id,
+            "content": self.content,
+            "file_path": self.file_path,
+            "start_line": self.start_line,
+            "end_line": self.end_line,
+            "chunk_index": self.chunk_index,
+            "metadata": self.metadata
+        }
+
+
+def _chunk_text(text: str, file_path: str, tokenizer, chunk_size: int, chunk_overlap: int) -> List[FileChunk]:
+    """Split text into chunks of at most chunk_size tokens, overlapping by up to chunk_overlap"""
+    lines = text.split('\n')
+    n = len(lines)
+    # Tokenize all lines in one call, then work on a prefix sum of per-line
+    # token counts: cum[k] = tokens in lines[:k]
+    token_counts = [len(t) for t in tokenizer.encode_ordinary_batch(lines)]
+    cum = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(token_counts, out=cum[1:])
+
+    bounds = _chunk_bounds(cum, chunk_size, chunk_overlap)
+    return [
+        FileChunk(
+            content='\n'.join(lines[start:end]),
+            file_path=file_path,
+            start_line=start + 1,
+            end_line=end,
+            chunk_index=chunk_index
+        )
+        for chunk_index, (start, end) in enumerate(bounds.tolist())
+    ]
+
+
+def _chunk_bounds(cum: np.ndarray, chunk_size: int, chunk_overlap: int) -> np.ndarray:
+    """(start, end) line ranges of each chunk, given cum[k] = tokens in lines[:k]"""
+    n = cum.shape[0] - 1
+    # Every chunk ends at least one line after the previous one, so n + 1 rows suffice
+    bounds = np.empty((n + 1, 2), dtype=np.int64)
+    start = 0       # first line of the current chunk (0-based)
+    last_cut = 0    # a chunk always ends at least one line after the previous cut
+    k = 0
+
+    while True:
+        # First line i whose addition pushes the chunk past chunk_size
+        over = np.searchsorted(cum, cum[start] + chunk_size, side='right')
+        cut = max(over - 1, last_cut + 1)
+        if cut >= n:
+            break
+
+        bounds[k, 0] = start
+        bounds[k, 1] = cut
+        k += 1
+
+        # Overlap: longest suffix of lines[start:cut] within chunk_overlap tokens
+        overlap_start = np.searchsorted(cum, cum[cut] - chunk_overlap, side='left')
+        start = max(overlap_start, start)
+        last_cut = cut
+
+    # Final chunk runs to the end of the file
+    bounds[k, 0] = start
+    bounds[k, 1] = n
+    return bounds[:k + 1]
+
+
+if njit is not None:
+    # cache=True keeps the compiled code on disk (NUMBA_CACHE_DIR) across runs and workers
+    _chunk_bounds = njit(cache=True)(_chunk_bounds)
+
+
+def _prepare_file(
+    file_path: str, chunk_size: int, chunk_overlap: int, tokenizer=None
+) -> Tuple[str, List[FileChunk]]:
+    """Read, hash and chunk one file; module-level so ProcessPoolExecutor can pickle it"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    file_hash = _digest(data)
+    # Same result as open(..., 'r', errors='ignore'): universal newlines
+    content = data.decode('utf-8', errors='ignore')
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    chunks = _chunk_text(content, file_path, tokenizer or _get_tokenizer(), chunk_size, chunk_overlap)
+    return file_hash, chunks
+
@@ -3,25 +3,59 @@ File discovery and filtering utilities for MCP Local RAG
 """
 
 import fnmatch
+import itertools
 import json
 import logging
+import os
+import re
 import shutil
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple, Any, Iterable, Sequence
+from typing import Dict, FrozenSet, Iterator, List, Optional, Set, Tuple, Any, Iterable, Sequence
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    # orjson is optional; stdlib json accepts the same bytes input
+    _json_loads = json.loads
 
 logger = logging.getLogger(__name__)
 
 
+# Parsed project configs keyed by path -> (st_mtime_ns, st_size, parsed)
+_project_config_cache: Dict[str, Tuple[int, int, Any]] = {}
+
+
+def _load_project_config(cfg_path: Path) -> Any:
+    """Parse a project config file, reusing the last parse while mtime/size are unchanged."""
+    key = str(cfg_path)
+    try:
+        st = cfg_path.stat()
+        stamp: Optional[Tuple[int, int]] = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        stamp = None
+    cached = _project_config_cache.get(key)
+    if stamp is not None and cached is not None and cached[:2] == stamp:
+        return cached[2]
+    with open(cfg_path, 'rb') as f:
+        project_cfg = _json_loads(f.read())
+    # 解析に失敗した場合は例外になるのでキャッシュされない
+    if stamp is not None:
+        _project_config_cache[key] = (stamp[0], stamp[1], project_cfg)
+    return project_cfg
+
+
 def resolve_project_config(base_config: Dict[str, Any], dir_path: Path) -> Dict[str, Any]:
     """Merge base_config with <dir_path>/.mcp-local-rag.json if present (shallow)."""
     cfg = dict(base_config)
     project_cfg_path = Path(dir_path) / ".mcp-local-rag.json"
     if project_cfg_path.exists():
         try:
-            with open(project_cfg_path) as f:
-                project_cfg = json.load(f)
+            project_cfg = _load_project_config(project_cfg_path)
             if isinstance(project_cfg, dict):
                 cfg.update(project_cfg)
         except Exception as e:
@@ -41,16 +75,196 @@ def effective_filters(config: Dict[str, Any], supported_extensions: Iterable[str
     return enabled, excludes
 
 
+@lru_cache(maxsize=None)
+def _which(cmd: str) -> Optional[str]:
+    """shutil.which() resolved once per process (PATH lookups are not free)."""
+    return shutil.which(cmd)
+
+
+@lru_cache(maxsize=32)
+def _ext_tuple(enabled: FrozenSet[str]) -> Tuple[str, ...]:
+    """Lower-cased extensions as a tuple for a single str.endswith() check."""
+    return tuple(sorted({e.lower() for e in enabled}, key=len, reverse=True))
+
+
+@lru_cache(maxsize=32)
+def _split_patterns(patterns: Tuple[str, ...]) -> Tuple[FrozenSet[str], Tuple["re.Pattern[str]", ...]]:
+    """Split patterns into literal names (set lookup) and compiled glob regexes."""
+    literals = frozenset(p for p in patterns if not any(c in p for c in '*?['))
+    globs = []
+    for pat in patterns:
+        if pat in literals:
+            continue
+        try:
+            globs.append(re.compile(fnmatch.translate(pat)))
+        except re.error:
+            continue
+    return literals, tuple(globs)
+
+
 def _is_excluded_parts(path: Path, exclude_dir_patterns: Sequence[str]) -> bool:
     """Check if any path component matches an exclude pattern."""
-    for part in path.parts:
-        for pat in exclude_dir_patterns:
-            try:
-                if fnmatch.fnmatch(part, pat):
-                    return True
-            except Exception:
-                continue
-    return False
+    parts = path.parts
+    literals, globs = _split_patterns(tuple(exclude_dir_patterns))
+    if not literals.isdisjoint(parts):
+        return True
+    return any(g.match(part) for g in globs for part in parts)
+
+
+# fast_mtime: allowance for clock skew / coarse mtime granularity (2 x typical skew)
+_FAST_MTIME_GRACE_SECONDS = 2
+
+# (literal names, compiled glob regexes) as returned by _split_patterns
+_NameFilter = Tuple[FrozenSet[str], Tuple["re.Pattern[str]", ...]]
+
+
+def _name_matches(name: str, name_filter: _NameFilter) -> bool:
+    """Check a single path component against a pre-split pattern set."""
+    literals, globs = name_filter
+    return name in literals or any(g.match(name) for g in globs)
+
+
+def _scandir_recursive(
+    path: str,
+    exclude_dirs: Tuple[str, ...],
+    ext_tuple: Tuple[str, ...],
+    cutoff: Optional[float] = None,
+    prune_before: Optional[float] = None,
+    exclude_files: Tuple[str, ...] = (),
+) -> Iterator[Path]:
+    """Walk path with os.scandir, pruning excluded directories before descending.
+
+    exclude_dirs is matched against directory names, exclude_files against file names.
+    When cutoff is given, only files with st_mtime >= cutoff are yielded.
+    When prune_before is given, subdirectories whose own st_mtime is older are not
+    descended into (best-effort: editing a file in place does not touch its directory).
+    """
+    yield from _walk_dir(
+        path, _split_patterns(tuple(exclude_dirs)), _split_patterns(tuple(exclude_files)),
+        ext_tuple, cutoff, prune_before,
+    )
+
+
+def _walk_dir(
+    path: str,
+    dir_filter: _NameFilter,
+    file_filter: _NameFilter,
+    ext_tuple: Tuple[str, ...],
+    cutoff: Optional[float],
+    prune_before: Optional[float],
+) -> Iterator[Path]:
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return
+    yield from _walk_entries(entries, dir_filter, file_filter, ext_tuple, cutoff, prune_before)
+
+
+def _walk_entries(
+    entries: Iterable["os.DirEntry[str]"],
+    dir_filter: _NameFilter,
+    file_filter: _NameFilter,
+    ext_tuple: Tuple[str, ...],
+    cutoff: Optional[float],
+    prune_before: Optional[float],
+) -> Iterator[Path]:
+    """Filter already-listed entries, recursing into the directories that survive pruning."""
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if _name_matches(entry.name, dir_filter):
+                    continue
+                if prune_before is not None and entry.stat(follow_symlinks=False).st_mtime < prune_before:
+                    continue
+                yield from _walk_dir(entry.path, dir_filter, file_filter, ext_tuple, cutoff, prune_before)
+            elif entry.is_file():
+                name = entry.name
+                if not (name.endswith(ext_tuple) or name.lower().endswith(ext_tuple)):
+                    continue
+                # A dotfile named just ".py" has no suffix (Path.suffix, the watcher's _wanted)
+                if name.rfind('.') <= 0:
+                    continue
+                if _name_matches(name, file_filter):
+                    continue
+                # DirEntry.stat() の結果を使い、別途 Path.stat() を呼ばない
+                if cutoff is None or entry.stat().st_mtime >= cutoff:
+                    yield Path(entry.path)
+        except OSError:
+            continue
+
+
+# Below this many top-level entries the thread pool costs more than it saves
+_PARALLEL_MIN_ENTRIES = 16
+_MAX_WALK_WORKERS = 8
+
+
+def _scandir_parallel(
+    path: str,
+    exclude_dirs: Tuple[str, ...],
+    ext_tuple: Tuple[str, ...],
+    cutoff: Optional[float] = None,
+    prune_before: Optional[float] = None,
+    exclude_files: Tuple[str, ...] = (),
+) -> Iterator[Path]:
+    """Like _scandir_recursive, but walks top-level subdirectories on a thread pool.
+
+    scandir/stat release the GIL, so I/O-bound walks overlap. Results from each
+    subtree are yielded as that subtree finishes (order is not deterministic).
+    """
+    dir_filter = _split_patterns(tuple(exclude_dirs))
+    file_filter = _split_patterns(tuple(exclude_files))
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return
+    if len(entries) < _PARALLEL_MIN_ENTRIES:
+        yield from _walk_entries(entries, dir_filter, file_filter, ext_tuple, cutoff, prune_before)
+        return
+
+    subdirs = []
+    others = []
+    for entry in entries:
+        try:
+            (subdirs if entry.is_dir(follow_symlinks=False) else others).append(entry)
+        except OSError:
+            continue
+
+    def collect(entry) -> List[Path]:
+        return list(_walk_entries([entry], dir_filter, file_filter, ext_tuple, cutoff, prune_before))
+
+    with ThreadPoolExecutor(max_workers=min(_MAX_WALK_WORKERS, max(1, len(subdirs)))) as pool:
+        futures = [pool.submit(collect, entry) for entry in subdirs]
+        yield from _walk_entries(others, dir_filter, file_filter, ext_tuple, cutoff, prune_before)
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def _iter_nul_separated(stream, block_size: int = 65536) -> Iterator[str]:
+    """Yield NUL-separated entries from a binary stream as they arrive."""
+    pending = b''
+    while True:
+        block = stream.read1(block_size)
+        if not block:
+            break
+        *items, pending = (pending + block).split(b'\0')
+        for item in items:
+            if item:
+                yield os.fsdecode(item)
+    if pending:
+        yield os.fsdecode(pending)
+
+
+def _iter_path_command(cmd: List[str]) -> Iterator[Path]:
+    """Run fd/find with NUL-separated output and yield paths while the command runs."""
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        for item in _iter_nul_separated(proc.stdout):
+            yield Path(item)
+    finally:
+        proc.stdout.close()
+        proc.wait()
 
 
 def discover_files(
@@ -59,120 +273,111 @@ def discover_files(
     exclude_dirs: Set[str],
     changed_within_seconds: Optional[int] = None,
     since_timestamp_file: Optional[Path] = None,
-) -> List[Path]:
+    fast_mtime: bool = False,
+) -> Iterator[Path]:
     """Discover files under dir_path using config filters.
 
-    - Full scans (changed_within_seconds is None) use Python rglob for deterministic tests.
+    Returns an iterator: paths are yielded while the walk (or fd/find) is still running;
+    wrap in list() when the full result is needed.
+
+    - Full scans (changed_within_seconds is None) walk the tree with os.scandir, skipping excluded directories.
+      Large trees walk top-level subdirectories in parallel threads.
     - Changed scans prefer fd (--changed-within). If unavailable and a timestamp file is provided, try find -newer.
-      Otherwise fall back to Python mtime filtering over extension-limited rglob.
+      Otherwise fall back to mtime filtering inside the same scandir walk.
+    - fast_mtime (opt-in) lets that fallback walk skip subdirectories whose own mtime predates
+      the cutoff. Best-effort only: files modified in place under an unchanged directory are missed.
     Always apply exclude patterns and extension filters.
     """
     dir_path = Path(dir_path)
     enabled = {e.lower() for e in enabled_extensions}
-    excludes = list(exclude_dirs)
+    ext_tuple = _ext_tuple(frozenset(enabled))
+    excludes = tuple(exclude_dirs)
     
     # Load ignore patterns from .mcp-local-rag-ignore if exists
     ignore_patterns = set()
     ignore_file = dir_path / '.mcp-local-rag-ignore'
     if ignore_file.exists():
-        with open(ignore_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    ignore_patterns.add(line)
-        logger.info(f"Loaded {len(ignore_patterns)} ignore patterns from {ignore_file}")
-
-    def finalize(paths: Iterable[Path]) -> List[Path]:
-        out: List[Path] = []
+        try:
+            with open(ignore_file, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        ignore_patterns.add(line)
+            logger.info(f"Loaded {len(ignore_patterns)} ignore patterns from {ignore_file}")
+        except OSError as e:
+            logger.warning(f"Could not read ignore file {ignore_file}: {e}")
+
+    # scandir walks apply the same rules per name while descending, so finalize() is only
+    # needed for fd/find output. Exclude/ignore patterns match any path component, so
+    # directories use both sets; file names additionally match the raw ignore patterns.
+    ignore_tuple = tuple(sorted(ignore_patterns))
+    walk_dirs = excludes + tuple(p.rstrip('/') for p in ignore_tuple)
+    walk_files = walk_dirs + ignore_tuple
+    part_filter = _split_patterns(walk_dirs)
+    name_filter = _split_patterns(walk_files)
+
+    def finalize(paths: Iterable[Path]) -> Iterator[Path]:
         for p in paths:
             try:
                 p = Path(p)
-                if _is_excluded_parts(p, excludes):
+                if not p.name.lower().endswith(ext_tuple) or p.name.rfind('.') <= 0:
                     continue
-                
-                # Check ignore patterns
-                should_ignore = False
-                if ignore_patterns:
-                    file_name = p.name
-                    for pattern in ignore_patterns:
-                        # Check filename match
-                        if fnmatch.fnmatch(file_name, pattern):
-                            should_ignore = True
-                            logger.debug(f"Ignoring {p.name} (matches pattern: {pattern})")
-                            break
-                        # Check path component match
-                        for part in p.parts:
-                            if fnmatch.fnmatch(part, pattern.rstrip('/')):
-                                should_ignore = True
-                                logger.debug(f"Ignoring {p} (path component matches: {pattern})")
-                                break
-                        if should_ignore:
-                            break
-                
-                if should_ignore:
+                if _name_matches(p.name, name_filter) or any(_name_matches(part, part_filter) for part in p.parts):
+                    logger.debug(f"Ignoring {p} (matches exclude/ignore pattern)")
                     continue
-                    
-                if p.suffix.lower() in enabled:
-                    out.append(p)
+                yield p
             except Exception:
                 continue
-        return out
+
+    def first_then_rest(paths: Iterator[Path]) -> Optional[Iterator[Path]]:
+        # 何も出力されなかった(失敗を含む)場合は None を返し、次の方法にフォールバックする
+        try:
+            first = next(paths, None)
+        except Exception:
+            return None
+        if first is None:
+            return None
+        return itertools.chain([first], paths)
+
+    root_excluded = _is_excluded_parts(dir_path, walk_dirs)
 
     if changed_within_seconds is None:
-        files: List[Path] = []
-        for ext in enabled:
-            try:
-                files.extend(dir_path.rglob(f"*{ext}"))
-            except Exception:
-                continue
-        return finalize(files)
+        if not root_excluded:
+            yield from _scandir_parallel(str(dir_path), walk_dirs, ext_tuple, exclude_files=walk_files)
+        return
 
     delta = int(changed_within_seconds)
     # Try fd first
-    if shutil.which('fd'):
+    if _which('fd'):
         names = sorted(e.lstrip('.') for e in enabled)
         pattern = f"*.{{{','.join(names)}}}" if names else '*'
-        cmd = ['fd', '--type', 'f', '--changed-within', f"{delta}s", '--glob', '--ignore-case']
+        cmd = ['fd', '--type', 'f', '--changed-within', f"{delta}s", '--glob', '--ignore-case', '-0']
         for exc in excludes:
             cmd.extend(['--exclude', str(exc)])
         cmd.extend([pattern, str(dir_path)])
-        try:
-            res = subprocess.run(cmd, capture_output=True, text=True, check=False)
-            if res.returncode == 0 and res.stdout:
-                return finalize(Path(line) for line in res.stdout.splitlines() if line)
-        except Exception:
-            pass
+        paths = first_then_rest(_iter_path_command(cmd))
+        if paths is not None:
+            yield from finalize(paths)
+            return
 
     # Try find with timestamp, if provided
-    if shutil.which('find') and since_timestamp_file and Path(since_timestamp_file).exists():
+    if _which('find') and since_timestamp_file and Path(since_timestamp_file).exists():
         cmd = ['find', str(dir_path), '-type', 'f', '-newer', str(since_timestamp_file)]
         if enabled:
             name_group: List[str] = []
             for ext in enabled:
-                name_group.extend(['-name', f"*{ext}", '-o'])
+                name_group.extend(['-iname', f"*{ext}", '-o'])
             if name_group:
                 name_group = name_group[:-1]
-                cmd.extend(['\('] + name_group + ['\)'])
-        try:
-            res = subprocess.run(cmd, capture_output=True, text=True, check=False)
-            if res.returncode == 0 and res.stdout:
-                return finalize(Path(line) for line in res.stdout.splitlines() if line)
-        except Exception:
-            pass
+                cmd.extend(['('] + name_group + [')'])
+        cmd.append('-print0')
+        paths = first_then_rest(_iter_path_command(cmd))
+        if paths is not None:
+            yield from finalize(paths)
+            return
 
-    # Fallback to Python mtime filter
-    now = time.time()
-    files: List[Path] = []
-    for ext in enabled:
-        try:
-            files.extend(dir_path.rglob(f"*{ext}"))
-        except Exception:
-            continue
-    recent = []
-    for p in files:
-        try:
-            if (now - Path(p).stat().st_mtime) <= delta:
-                recent.append(p)
-        except Exception:
-            continue
-    return finalize(recent)
\ No newline at end of file
+    # Fallback to Python mtime filter inside the scandir walk
+    cutoff = time.time() - delta
+    prune_before = cutoff - _FAST_MTIME_GRACE_SECONDS if fast_mtime else None
+    if not root_excluded:
+        yield from _scandir_parallel(str(dir_path), walk_dirs, ext_tuple, cutoff, prune_before, exclude_files=walk_files)
@@ -2,17 +2,113 @@
 Embedding generation for text chunks
 """
 
+import asyncio
+import contextlib
+import hashlib
 import logging
 import os
-from typing import Dict, List, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
 
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
 
-# Global cache for the model to avoid multiple loads
+# Global cache for the model to avoid multiple loads, keyed by (model_name, device, dtype)
 _model_cache = {}
+_model_cache_lock = threading.Lock()
+# OpenAIクライアントも共有し、httpxの接続プールをインスタンス間で使い回す
+_openai_client_cache: Dict[tuple, object] = {}
+
+
+def _detect_device() -> str:
+    """Pick the best available torch device for local inference"""
+    try:
+        import torch
+    except ImportError:
+        return 'cpu'
+    if torch.cuda.is_available():
+        return 'cuda'
+    mps = getattr(torch.backends, 'mps', None)
+    if mps is not None and mps.is_available():
+        return 'mps'
+    return 'cpu'
+
+
+def _inference_context():
+    """torch.inference_mode() when torch is available, otherwise a no-op"""
+    try:
+        import torch
+    except ImportError:
+        return contextlib.nullcontext()
+    return torch.inference_mode()
+
+
+class _LFUCache:
+    """Bounded least-frequently-used cache (O(1) get/put; LRU among equal counts)"""
+    
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._values: Dict[Hashable, object] = {}
+        self._counts: Dict[Hashable, int] = {}
+        # count -> keys with that count, oldest first
+        self._buckets: Dict[int, OrderedDict] = {}
+        self._min_count = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._values)
+    
+    def _touch(self, key: Hashable):
+        count = self._counts[key]
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+            if self._min_count == count:
+                self._min_count = count + 1
+        self._counts[key] = count + 1
+        self._buckets.setdefault(count + 1, OrderedDict())[key] = None
+    
+    def get(self, key: Hashable):
+        with self._lock:
+            if key not in self._values:
+                return None
+            self._touch(key)
+            return self._values[key]
+    
+    def put(self, key: Hashable, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if key in self._values:
+                self._values[key] = value
+                self._touch(key)
+                return
+            if len(self._values) >= self.maxsize:
+                evicted, _ = self._buckets[self._min_count].popitem(last=False)
+                if not self._buckets[self._min_count]:
+                    del self._buckets[self._min_count]
+                del self._values[evicted]
+                del self._counts[evicted]
+            self._values[key] = value
+            self._counts[key] = 1
+            self._buckets.setdefault(1, OrderedDict())[key] = None
+            self._min_count = 1
+    
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._counts.clear()
+            self._buckets.clear()
+            self._min_count = 0
+
+
+def _cache_key(text: str) -> bytes:
+    """Digest of the whitespace-trimmed chunk text"""
+    return hashlib.blake2b(text.strip().encode('utf-8', 'surrogatepass'), digest_size=16).digest()
 
 
 class EmbeddingGenerator:
@@ -21,6 +117,13 @@ class EmbeddingGenerator:
     def __init__(self, config: Dict):
         self.config = config
         self.model_type = config.get('embedding_model', 'local')
+        # Allow tuning batch size via config
+        self.batch_size = int(config.get('embedding_batch_size', 32))
+        # ライセンスヘッダやimport等の重複チャンクは再計算しない（0で無効）
+        cache_size = int(config.get('embedding_cache_size', 10000))
+        self._embedding_cache = _LFUCache(cache_size) if cache_size > 0 else None
+        # OpenAIモードではフォールバックが必要になるまでロードしない
+        self._local_model = None
         
         if self.model_type == 'openai':
             self._init_openai()
@@ -30,7 +133,7 @@ class EmbeddingGenerator:
     def _init_openai(self):
         """Initialize OpenAI embeddings"""
         try:
-            import openai
+            import httpx
             from openai import OpenAI
             
             api_key = self.config.get('openai_api_key') or os.getenv('OPENAI_API_KEY')
@@ -40,7 +143,21 @@ class EmbeddingGenerator:
                 self._init_local()
                 return
             
-            self.openai_client = OpenAI(api_key=api_key)
+            base_url = self.config.get('openai_base_url') or os.getenv('OPENAI_BASE_URL')
+            key = (api_key, base_url)
+            with _model_cache_lock:
+                client = _openai_client_cache.get(key)
+                if client is None:
+                    client = OpenAI(
+                        api_key=api_key,
+                        base_url=base_url,
+                        max_retries=2,
+                        http_client=httpx.Client(
+                            limits=httpx.Limits(max_connections=16, max_keepalive_connections=8)
+                        ),
+                    )
+                    _openai_client_cache[key] = client
+            self.openai_client = client
             self.embedding_model = self.config.get('openai_embedding_model', 'text-embedding-3-small')
             logger.info(f"Using OpenAI embeddings: {self.embedding_model}")
             
@@ -49,103 +166,160 @@ class EmbeddingGenerator:
             self.model_type = 'local'
             self._init_local()
     
+    @property
+    def local_model(self):
+        """Local SentenceTransformer, loaded on first use (e.g. an OpenAI fallback)"""
+        if self._local_model is None:
+            self._local_model = self._load_local_model()
+        return self._local_model
+    
+    @local_model.setter
+    def local_model(self, model):
+        self._local_model = model
+    
     def _init_local(self):
         """Initialize local sentence-transformers model (with caching)"""
-        global _model_cache
-        
+        self.local_model = self._load_local_model()
+        self.embedding_dimension = self.local_model.get_sentence_embedding_dimension()
+    
+    def _load_local_model(self):
+        """Load (or fetch from cache) the configured local model"""
         try:
             from sentence_transformers import SentenceTransformer
-            
-            model_name = self.config.get('local_embedding_model', 'all-MiniLM-L6-v2')
-            # Allow tuning batch size via config
-            self.batch_size = int(self.config.get('embedding_batch_size', 32))
-            
-            # Check cache first
-            if model_name not in _model_cache:
-                logger.info(f"Loading embedding model: {model_name}")
-                _model_cache[model_name] = SentenceTransformer(model_name)
-                logger.info(f"Model loaded and cached: {model_name}")
-            else:
-                logger.info(f"Using cached embedding model: {model_name}")
-            
-            self.local_model = _model_cache[model_name]
-            self.embedding_dimension = self.local_model.get_sentence_embedding_dimension()
-            
         except ImportError:
             raise ImportError(
                 "sentence-transformers not installed. "
                 "Please install with: pip install sentence-transformers"
             )
+        
+        model_name = self.config.get('local_embedding_model', 'all-MiniLM-L6-v2')
+        device = self.config.get('embedding_device') or _detect_device()
+        # GPU/MPSではFP16で推論（CPUのFP16は速くならないのでFP32のまま）
+        dtype = 'float32' if device == 'cpu' else 'float16'
+        key = (model_name, device, dtype)
+        
+        # Check cache first (lock so concurrent callers don't load the model twice)
+        with _model_cache_lock:
+            model = _model_cache.get(key)
+            if model is None:
+                logger.info(f"Loading embedding model: {model_name} ({device}, {dtype})")
+                model = SentenceTransformer(model_name, device=device)
+                if dtype == 'float16':
+                    model = model.half()
+                _model_cache[key] = model
+                logger.info(f"Model loaded and cached: {model_name}")
+            else:
+                logger.info(f"Using cached embedding model: {model_name}")
+        
+        return model
     
-    async def generate(self, text: str) -> List[float]:
+    async def generate(self, text: str) -> np.ndarray:
         """Generate embedding for text"""
         if self.model_type == 'openai':
             return await self._generate_openai(text)
         else:
             return await self._generate_local(text)
     
-    async def _generate_openai(self, text: str) -> List[float]:
+    async def _generate_openai(self, text: str) -> np.ndarray:
         """Generate embedding using OpenAI"""
         try:
-            response = self.openai_client.embeddings.create(
+            response = await asyncio.to_thread(
+                self.openai_client.embeddings.create,
                 model=self.embedding_model,
                 input=text
             )
-            return response.data[0].embedding
+            return np.asarray(response.data[0].embedding, dtype=np.float32)
         except Exception as e:
             logger.error(f"Error generating OpenAI embedding: {e}")
             # Fall back to local model
             return await self._generate_local(text)
     
-    async def _generate_local(self, text: str) -> List[float]:
+    def _encode_local(self, inputs, **kwargs) -> np.ndarray:
+        """Run SentenceTransformer.encode() without autograd bookkeeping"""
+        with _inference_context():
+            return self.local_model.encode(
+                inputs,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+                **kwargs
+            )
+    
+    async def _generate_local(self, text: str) -> np.ndarray:
         """Generate embedding using local model"""
-        # SentenceTransformer.encode() is synchronous
-        embedding = self.local_model.encode(
-            text,
-            convert_to_numpy=True,
-            show_progress_bar=False,
-        )
-        return embedding.tolist()
+        # SentenceTransformer.encode() is synchronous; keep it off the event loop
+        embedding = await asyncio.to_thread(self._encode_local, text)
+        return embedding.astype(np.float32, copy=False)
     
-    async def batch_generate(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts"""
-        if self.model_type == 'openai':
-            return await self._batch_generate_openai(texts)
-        else:
-            return await self._batch_generate_local(texts)
+    async def batch_generate(self, texts: List[str]) -> np.ndarray:
+        """Generate embeddings for multiple texts as an (n, dim) float32 array"""
+        cache = self._embedding_cache
+        if cache is None or not texts:
+            embeddings, _ = await self._batch_generate_uncached(texts)
+            return embeddings
+        
+        keys = [_cache_key(text) for text in texts]
+        rows: List[Optional[np.ndarray]] = [cache.get(key) for key in keys]
+        
+        # Embed each distinct uncached text once, even if it repeats within the batch
+        missing: Dict[bytes, List[int]] = {}
+        for i, row in enumerate(rows):
+            if row is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            positions = list(missing.values())
+            computed, fell_back = await self._batch_generate_uncached([texts[p[0]] for p in positions])
+            if fell_back:
+                # The local fallback has another model/dimension: never cache its rows or
+                # mix them with cached rows of the configured model
+                hits = len(texts) - sum(map(len, positions))
+                if hits:
+                    return await self._batch_generate_local(texts)
+                for indices, embedding in zip(positions, computed):
+                    for i in indices:
+                        rows[i] = embedding
+                return np.asarray(rows, dtype=np.float32)
+            for key, indices, embedding in zip(missing, positions, computed):
+                # Cache full-precision copies so a hit returns exactly what the miss did
+                cache.put(key, np.array(embedding, dtype=np.float32))
+                for i in indices:
+                    rows[i] = embedding
+            logger.debug(f"Embedding cache: {len(texts) - sum(map(len, positions))}/{len(texts)} hits")
+        
+        return np.asarray(rows, dtype=np.float32)
     
-    async def _batch_generate_openai(self, texts: List[str]) -> List[List[float]]:
-        """Batch generate embeddings using OpenAI"""
+    async def _batch_generate_uncached(self, texts: List[str]) -> Tuple[np.ndarray, bool]:
+        """Embed texts with the configured model; the flag is True if OpenAI fell back to local"""
+        if self.model_type != 'openai':
+            return await self._batch_generate_local(texts), False
         try:
-            response = self.openai_client.embeddings.create(
-                model=self.embedding_model,
-                input=texts
-            )
-            return [data.embedding for data in response.data]
+            return await self._request_openai_embeddings(texts), False
         except Exception as e:
             logger.error(f"Error generating OpenAI embeddings: {e}")
-            # Fall back to local model
-            return await self._batch_generate_local(texts)
+            return await self._batch_generate_local(texts), True
     
-    async def _batch_generate_local(self, texts: List[str]) -> List[List[float]]:
+    async def _request_openai_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Batch generate embeddings using OpenAI (raises on failure)"""
+        response = await asyncio.to_thread(
+            self.openai_client.embeddings.create,
+            model=self.embedding_model,
+            input=texts
+        )
+        return np.asarray([data.embedding for data in response.data], dtype=np.float32)
+    
+    async def _batch_generate_local(self, texts: List[str]) -> np.ndarray:
         """Batch generate embeddings using local model"""
         import time
         start = time.perf_counter()
         
-        batch_size = getattr(self, 'batch_size', 32)
+        batch_size = self.batch_size
         logger.debug(f"Encoding {len(texts)} texts with batch_size={batch_size}")
         
-        embeddings = self.local_model.encode(
-            texts,
-            convert_to_numpy=True,
-            batch_size=batch_size,
-            show_progress_bar=False,
-        )
+        embeddings = await asyncio.to_thread(self._encode_local, texts, batch_size=batch_size)
         
         elapsed = (time.perf_counter() - start) * 1000
         logger.debug(f"Encoded {len(texts)} texts in {elapsed:.1f}ms ({elapsed/len(texts):.1f}ms per text)")
         
-        return embeddings.tolist()
+        return embeddings.astype(np.float32, copy=False)
     
     def get_dimension(self) -> int:
         """Get embedding dimension"""
@@ -2,67 +2,68 @@
 File Indexer for RAG System
 """
 
-import hashlib
-import fnmatch
+import asyncio
 import json
 import logging
+import multiprocessing
 import os
 import shutil
 import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
 import tiktoken
-from watchdog.events import FileSystemEventHandler
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    DirMovedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+    FileSystemEventHandler,
+)
 from watchdog.observers import Observer
+from watchdog.observers.api import ObservedWatch
 
+try:
+    import orjson  # optional speedup: pip install ".[fast]"
+except ImportError:
+    orjson = None
+
+from chunking import HASH_ALG, FileChunk, _chunk_text, _hash_available, _hash_file, _prepare_file
 from embeddings import EmbeddingGenerator
-from vectordb import VectorDB
-from discovery import discover_files
+from vectordb import VectorDB, flush_file_indexes
+from discovery import discover_files, _is_excluded_parts
 
 logger = logging.getLogger(__name__)
 
+# Only these reach the handler; with watchdog>=4 the inotify mask is derived from
+# this list, so IN_ACCESS/IN_OPEN/IN_CLOSE_NOWRITE are never delivered at all.
+# Directory deletes/moves are included because a directory moved out of the tree
+# reports nothing for the files inside it
+WATCHED_EVENT_TYPES = (
+    FileModifiedEvent, FileCreatedEvent, FileDeletedEvent, FileMovedEvent,
+    DirDeletedEvent, DirMovedEvent,
+)
+# The non-recursive root watch also needs new top-level directories, so they get watched
+ROOT_WATCHED_EVENT_TYPES = WATCHED_EVENT_TYPES + (DirCreatedEvent,)
 
-class FileChunk:
-    """Represents a chunk of a file"""
-    
-    def __init__(
-        self,
-        content: str,
-        file_path: str,
-        start_line: int,
-        end_line: int,
-        chunk_index: int,
-        metadata: Optional[Dict] = None
-    ):
-        self.content = content
-        self.file_path = file_path
-        self.start_line = start_line
-        self.end_line = end_line
-        self.chunk_index = chunk_index
-        self.metadata = metadata or {}
-        
-        # Generate unique ID
-        content_hash = hashlib.md5(content.encode()).hexdigest()[:8]
-        self.id = f"{file_path}:{chunk_index}:{content_hash}"
-    
-    def to_dict(self) -> Dict:
-        """Convert to dictionary for storage"""
-        return {
-            "id": self.id,
-            "content": self.content,
-            "file_path": self.file_path,
-            "start_line": self.start_line,
-            "end_line": self.end_line,
-            "chunk_index": self.chunk_index,
-            "metadata": self.metadata
-        }
+
+# (path, hash, chunks, language, stat taken before the read) ready for _store_files
+_PreparedFile = Tuple[Path, str, List[FileChunk], str, os.stat_result]
 
 
 class FileIndexer:
     """Indexes files for RAG retrieval"""
     
+    # index_directory stores prepared files in batches of about this many chunks
+    INDEX_BATCH_CHUNKS = 256
+    
     SUPPORTED_EXTENSIONS = {
         '.py': 'python',
         '.js': 'javascript',
@@ -128,8 +129,26 @@ class FileIndexer:
         self.file_metadata_path = self.index_path / 'file_metadata.json'
         self.file_metadata = self._load_file_metadata()
         
+        # Worker processes for index_directory's read/hash/chunk stage; each spawned
+        # worker costs ~0.7 s startup and ~80 MB, so the default stays small
+        self.index_workers = int(config.get('index_workers', min(4, os.cpu_count() or 1)))
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        # Threads for hashing touched files during index_directory (read + hashlib release the GIL)
+        self._hash_pool: Optional[ThreadPoolExecutor] = None
+        
         # File watcher
         self.observer = None
+        self._event_handler = None
+        # Event loop that watcher batches are submitted to (set by start_watching)
+        self._loop = None
+        self._watch_root = None
+        # Top-level directory -> its recursive watch
+        self._subdir_watches: Dict[str, ObservedWatch] = {}
+        self._event_filter_supported = True
+        # Batches must not interleave (B1 delete, B2 delete, B1 add, B2 add leaves stale chunks):
+        # an asyncio.Lock for batches run on the server's loop, a thread lock for asyncio.run ones
+        self._apply_lock: Optional[asyncio.Lock] = None
+        self._apply_thread_lock = threading.Lock()
 
         # Exclude directory patterns from config (fallback to sensible defaults)
         default_excludes = {
@@ -143,108 +162,156 @@ class FileIndexer:
         config_exts = [e for e in config_exts if e.startswith('.')]
         enabled = [e for e in config_exts if e in self.SUPPORTED_EXTENSIONS]
         self.enabled_extensions = set(enabled if enabled else self.SUPPORTED_EXTENSIONS.keys())
+        # Lower-cased, immutable copy for the watcher's per-event check
+        self._ext_set = frozenset(e.lower() for e in self.enabled_extensions)
 
     def _is_excluded(self, path: Path) -> bool:
         """Return True if any path component matches an exclude pattern."""
-        for part in path.parts:
-            for pat in self.exclude_dir_patterns:
-                try:
-                    if fnmatch.fnmatch(part, pat):
-                        return True
-                except Exception:
-                    # In case of an invalid pattern, skip matching
-                    continue
-        return False
+        return _is_excluded_parts(path, self.exclude_dir_patterns)
     
     def _load_file_metadata(self) -> Dict:
         """Load file metadata cache"""
         if self.file_metadata_path.exists():
-            with open(self.file_metadata_path, 'r') as f:
-                return json.load(f)
+            with open(self.file_metadata_path, 'rb') as f:
+                data = f.read()
+            return orjson.loads(data) if orjson is not None else json.loads(data)
         return {}
     
     def _save_file_metadata(self):
-        """Save file metadata cache"""
-        with open(self.file_metadata_path, 'w') as f:
-            json.dump(self.file_metadata, f, indent=2)
+        """Save file metadata cache (write to a temp file, then atomically replace)"""
+        if orjson is not None:
+            data = orjson.dumps(self.file_metadata, option=orjson.OPT_INDENT_2)
+        else:
+            data = json.dumps(self.file_metadata, indent=2).encode('utf-8')
+        tmp_path = self.file_metadata_path.with_name(self.file_metadata_path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        # 書き込み途中でプロセスが落ちても既存のメタデータは壊れない
+        os.replace(tmp_path, self.file_metadata_path)
     
-    def _get_file_hash(self, file_path: str) -> str:
+    def _get_file_hash(self, file_path: str, alg: str = HASH_ALG) -> str:
         """Get hash of file content"""
-        with open(file_path, 'rb') as f:
-            return hashlib.md5(f.read()).hexdigest()
+        return _hash_file(file_path, alg)
+    
+    def _legacy_hash_alg(self, file_path: str) -> Optional[str]:
+        """Algorithm of the stored hash when it is not HASH_ALG but can still be computed"""
+        entry = self.file_metadata.get(file_path)
+        if entry is None:
+            return None
+        # Entries written before hash_alg was recorded are MD5
+        alg = entry.get('hash_alg', 'md5')
+        if alg == HASH_ALG or not _hash_available(alg):
+            return None
+        return alg
+    
+    def _content_unchanged(self, file_path: str, st: Optional[os.stat_result]) -> bool:
+        """Hash file_path and compare it with the stored hash"""
+        legacy_alg = self._legacy_hash_alg(file_path)
+        legacy_hash = self._get_file_hash(file_path, legacy_alg) if legacy_alg else None
+        return self._hash_unchanged(file_path, self._get_file_hash(file_path), st, legacy_hash)
+    
+    def _should_index_file(self, file_path: str, force: bool = False, st: Optional[os.stat_result] = None) -> bool:
+        """Check if file should be indexed (st: the caller's stat of file_path, if it has one)"""
+        if st is None and not force and file_path in self.file_metadata:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                st = None
+        decision = self._stat_decision(file_path, force, st)
+        if decision is not None:
+            return decision
+        return not self._content_unchanged(file_path, st)
     
-    def _should_index_file(self, file_path: str, force: bool = False) -> bool:
-        """Check if file should be indexed"""
+    def _stat_decision(self, file_path: str, force: bool, st: Optional[os.stat_result]) -> Optional[bool]:
+        """Index (True) or skip (False) from metadata and stat alone; None = compare content hashes"""
         if force:
             return True
         
-        if file_path not in self.file_metadata:
+        entry = self.file_metadata.get(file_path)
+        if entry is None:
             return True
         
-        current_hash = self._get_file_hash(file_path)
-        stored_hash = self.file_metadata[file_path].get('hash')
-        
-        return current_hash != stored_hash
+        # mtime/サイズが前回と同じならハッシュ計算（ファイル全読み）を省略
+        if st is not None and entry.get('mtime_ns') == st.st_mtime_ns and entry.get('size') == st.st_size:
+            return False
+        return None
+    
+    def _hash_unchanged(
+        self, file_path: str, current_hash: str, st: Optional[os.stat_result], legacy_hash: Optional[str] = None
+    ) -> bool:
+        """True if current_hash (HASH_ALG) or legacy_hash (the entry's older algorithm) matches the stored hash"""
+        entry = self.file_metadata.get(file_path)
+        if entry is None:
+            return False
+        if entry.get('hash_alg', 'md5') == HASH_ALG:
+            if current_hash != entry.get('hash'):
+                return False
+        elif legacy_hash is None or legacy_hash != entry.get('hash'):
+            # The old algorithm is unavailable (e.g. blake3 uninstalled) or the content changed
+            return False
+        else:
+            # Same content under the old hasher: switch the entry over without re-embedding
+            entry['hash'] = current_hash
+            entry['hash_alg'] = HASH_ALG
+        if st is not None:
+            # Touched but unchanged: remember the new stat so the next check is free
+            entry['mtime_ns'] = st.st_mtime_ns
+            entry['size'] = st.st_size
+            entry['ino'] = st.st_ino
+        return True
     
     def _chunk_text(self, text: str, file_path: str) -> List[FileChunk]:
         """Split text into overlapping chunks"""
-        lines = text.split('\n')
-        chunks = []
+        return _chunk_text(text, file_path, self.tokenizer, self.chunk_size, self.chunk_overlap)
+    
+    def _check_indexable(self, path: Path, force_reindex: bool = False) -> Optional[Tuple[str, os.stat_result]]:
+        """Return (language, stat) if the file should be (re)indexed, else None"""
+        checked = self._precheck(path, force_reindex)
+        if checked is None:
+            return None
+        language, st, needs_hash = checked
         
-        current_chunk = []
-        current_tokens = 0
-        start_line = 0
-        chunk_index = 0
+        if needs_hash:
+            hash_start = time.perf_counter()
+            unchanged = self._content_unchanged(str(path), st)
+            logger.debug(f"Hash check for {path.name}: {(time.perf_counter() - hash_start)*1000:.1f}ms")
+            if unchanged:
+                logger.debug(f"Skipping unchanged file: {path}")
+                return None
         
-        for i, line in enumerate(lines):
-            line_tokens = len(self.tokenizer.encode(line))
-            
-            if current_tokens + line_tokens > self.chunk_size and current_chunk:
-                # Create chunk
-                chunk_content = '\n'.join(current_chunk)
-                chunks.append(FileChunk(
-                    content=chunk_content,
-                    file_path=file_path,
-                    start_line=start_line + 1,
-                    end_line=i,
-                    chunk_index=chunk_index
-                ))
-                
-                # Start new chunk with overlap
-                overlap_lines = []
-                overlap_tokens = 0
-                for j in range(len(current_chunk) - 1, -1, -1):
-                    line_tokens = len(self.tokenizer.encode(current_chunk[j]))
-                    if overlap_tokens + line_tokens <= self.chunk_overlap:
-                        overlap_lines.insert(0, current_chunk[j])
-                        overlap_tokens += line_tokens
-                    else:
-                        break
-                
-                current_chunk = overlap_lines
-                current_tokens = overlap_tokens
-                start_line = i - len(overlap_lines) + 1
-                chunk_index += 1
-            
-            current_chunk.append(line)
-            current_tokens += line_tokens
+        return language, st
+    
+    def _precheck(self, path: Path, force_reindex: bool) -> Optional[Tuple[str, os.stat_result, bool]]:
+        """Checks that need no file read: (language, stat, needs_hash) or None to skip"""
+        # Get file extension and language
+        ext = path.suffix.lower()
+        # Respect config-enabled extensions (subset of supported)
+        if ext not in self.enabled_extensions:
+            logger.warning(f"Unsupported or disabled file type: {ext}")
+            return None
         
-        # Add final chunk
-        if current_chunk:
-            chunk_content = '\n'.join(current_chunk)
-            chunks.append(FileChunk(
-                content=chunk_content,
-                file_path=file_path,
-                start_line=start_line + 1,
-                end_line=len(lines),
-                chunk_index=chunk_index
-            ))
+        # One stat per file, shared by the change check, the size limit and the stored metadata
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            logger.error(f"Error reading {path}: {e}")
+            return None
+        
+        decision = self._stat_decision(str(path), force_reindex, st)
+        if decision is False:
+            logger.debug(f"Skipping unchanged file: {path}")
+            return None
         
-        return chunks
+        # Check file size
+        file_size = st.st_size
+        if file_size > self.max_file_size:
+            logger.warning(f"Skipping large file {path.name}: {file_size / 1024 / 1024:.1f}MB > {self.max_file_size / 1024 / 1024:.1f}MB limit")
+            return None
+        
+        return self.SUPPORTED_EXTENSIONS[ext], st, decision is None
     
     async def index_file(self, file_path: str, force_reindex: bool = False, collection_name: Optional[str] = None) -> int:
         """Index a single file"""
-        import time
         file_start = time.perf_counter()
         
         path = Path(file_path)
@@ -253,109 +320,130 @@ class FileIndexer:
         if collection_name:
             self.vectordb.switch_collection(collection_name)
         
-        # Check if file should be indexed
-        hash_start = time.perf_counter()
-        should_index = self._should_index_file(str(path), force_reindex)
-        logger.debug(f"Hash check for {path.name}: {(time.perf_counter() - hash_start)*1000:.1f}ms")
-        
-        if not should_index:
-            logger.debug(f"Skipping unchanged file: {path}")
+        indexable = self._check_indexable(path, force_reindex)
+        if indexable is None:
             return 0
-        
-        # Check file size
-        file_size = path.stat().st_size
-        if file_size > self.max_file_size:
-            logger.warning(f"Skipping large file {path.name}: {file_size / 1024 / 1024:.1f}MB > {self.max_file_size / 1024 / 1024:.1f}MB limit")
-            return 0
-        
-        # Get file extension and language
-        ext = path.suffix.lower()
-        # Respect config-enabled extensions (subset of supported)
-        if ext not in self.enabled_extensions:
-            logger.warning(f"Unsupported or disabled file type: {ext}")
-            return 0
-        
-        language = self.SUPPORTED_EXTENSIONS[ext]
+        language, st = indexable
         
         try:
-            # Read file content
-            read_start = time.perf_counter()
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            logger.debug(f"Read {path.name} ({len(content)} chars): {(time.perf_counter() - read_start)*1000:.1f}ms")
-            
-            # Create chunks
-            chunk_start = time.perf_counter()
-            chunks = self._chunk_text(content, str(path))
-            logger.debug(f"Chunked {path.name} into {len(chunks)} chunks: {(time.perf_counter() - chunk_start)*1000:.1f}ms")
-
-            # Batch-generate embeddings for all chunks of this file
-            texts = [chunk.content for chunk in chunks]
-            embeddings_out: List[List[float]] = []
-            if texts:
-                embed_start = time.perf_counter()
-                embeddings_out = await self.embeddings.batch_generate(texts)
-                logger.debug(f"Generated {len(embeddings_out)} embeddings for {path.name}: {(time.perf_counter() - embed_start)*1000:.1f}ms")
-
-            # Prepare for storage
-            documents = []
-            embeddings_list = []
-            metadatas = []
-            ids = []
-
-            for chunk, embedding in zip(chunks, embeddings_out):
-                documents.append(chunk.content)
-                embeddings_list.append(embedding)
-                ids.append(chunk.id)
-                metadatas.append({
-                    "file_path": chunk.file_path,
-                    "start_line": chunk.start_line,
-                    "end_line": chunk.end_line,
-                    "chunk_index": chunk.chunk_index,
-                    "language": language,
-                    "file_size": path.stat().st_size,
-                    "modified_at": datetime.fromtimestamp(
-                        path.stat().st_mtime
-                    ).isoformat()
-                })
-            
-            # If updating existing file, delete old chunks first
-            if str(path) in self.file_metadata:
-                logger.info(f"Deleting old chunks for {path}")
-                await self.vectordb.delete_by_file(str(path))
-            
-            # Store in vector database
-            docs_to_add = []
-            for i in range(len(documents)):
+            # Read, hash and chunk in one pass over the file
+            prepare_start = time.perf_counter()
+            # Off the event loop so reads overlap with embedding and DB work
+            file_hash, chunks = await asyncio.to_thread(
+                _prepare_file, str(path), self.chunk_size, self.chunk_overlap, self.tokenizer
+            )
+            logger.debug(f"Read and chunked {path.name} into {len(chunks)} chunks: {(time.perf_counter() - prepare_start)*1000:.1f}ms")
+            return await self._store_file(path, file_hash, chunks, language, st, file_start)
+        except Exception as e:
+            logger.error(f"Error indexing file {path}: {e}")
+            return 0
+    
+    async def _store_file(
+        self,
+        path: Path,
+        file_hash: str,
+        chunks: List[FileChunk],
+        language: str,
+        st: os.stat_result,
+        file_start: float,
+    ) -> int:
+        """Embed prepared chunks, replace the file's old chunks and record its metadata"""
+        await self._store_files([(path, file_hash, chunks, language, st)])
+
+        total_time = (time.perf_counter() - file_start) * 1000
+        logger.info(f"Indexed {path}: {len(chunks)} chunks in {total_time:.1f}ms")
+        if total_time > 1000:  # 1秒以上かかったファイルを警告
+            logger.warning(f"Slow file: {path.name} took {total_time:.1f}ms")
+        return len(chunks)
+
+    async def _store_files(self, batch: List[_PreparedFile]) -> List[int]:
+        """Store prepared (path, hash, chunks, language, stat) entries with one embed call and one DB write"""
+        # Batch-generate embeddings for all chunks in the batch
+        texts = [chunk.content for _, _, chunks, _, _ in batch for chunk in chunks]
+        embeddings_out: Sequence[Sequence[float]] = []
+        if texts:
+            embed_start = time.perf_counter()
+            embeddings_out = await self.embeddings.batch_generate(texts)
+            logger.debug(f"Generated {len(embeddings_out)} embeddings for {len(batch)} files: {(time.perf_counter() - embed_start)*1000:.1f}ms")
+
+        # Prepare for storage
+        docs_to_add = []
+        embedding_iter = iter(embeddings_out)
+        # st was taken before the read, so a write racing the read is caught by the next check
+        for path, _, chunks, language, st in batch:
+            modified_at = datetime.fromtimestamp(st.st_mtime).isoformat()
+            for chunk, embedding in zip(chunks, embedding_iter):
                 docs_to_add.append({
-                    'id': ids[i],
-                    'content': documents[i],
-                    'embedding': embeddings_list[i],
-                    'metadata': metadatas[i]
+                    'id': chunk.id,
+                    'content': chunk.content,
+                    'embedding': embedding,
+                    'metadata': {
+                        "file_path": chunk.file_path,
+                        "start_line": chunk.start_line,
+                        "end_line": chunk.end_line,
+                        "chunk_index": chunk.chunk_index,
+                        "language": language,
+                        "file_size": st.st_size,
+                        "modified_at": modified_at
+                    }
                 })
-            
-            db_start = time.perf_counter()
-            await self.vectordb.add_documents(docs_to_add)
-            logger.debug(f"Stored {len(docs_to_add)} chunks in DB for {path.name}: {(time.perf_counter() - db_start)*1000:.1f}ms")
-            
-            # Update file metadata
+
+        # If updating existing files, delete their old chunks first
+        reindexed = [str(path) for path, _, _, _, _ in batch if str(path) in self.file_metadata]
+        if reindexed:
+            logger.info(f"Deleting old chunks for {len(reindexed)} file(s), e.g. {reindexed[0]}")
+            await self.vectordb.delete_by_files(reindexed)
+
+        db_start = time.perf_counter()
+        # 初回インデックスのファイルだけならIDが既存と衝突しないので存在確認を省略
+        await self.vectordb.add_documents(docs_to_add, assume_new=not reindexed)
+        logger.debug(f"Stored {len(docs_to_add)} chunks in DB for {len(batch)} files: {(time.perf_counter() - db_start)*1000:.1f}ms")
+
+        # Update file metadata (mtime_ns/size let _should_index_file skip hashing, ino pairs up renames)
+        indexed_at = datetime.now().isoformat()
+        for path, file_hash, chunks, language, st in batch:
             self.file_metadata[str(path)] = {
-                "hash": self._get_file_hash(str(path)),
+                "hash": file_hash,
+                "hash_alg": HASH_ALG,
+                "mtime_ns": st.st_mtime_ns,
+                "size": st.st_size,
+                "ino": st.st_ino,
                 "chunks": len(chunks),
                 "language": language,
-                "indexed_at": datetime.now().isoformat()
+                "indexed_at": indexed_at
             }
-            self._save_file_metadata()
-            
-            total_time = (time.perf_counter() - file_start) * 1000
-            logger.info(f"Indexed {path}: {len(chunks)} chunks in {total_time:.1f}ms")
-            if total_time > 1000:  # 1秒以上かかったファイルを警告
-                logger.warning(f"Slow file: {path.name} took {total_time:.1f}ms")
-            return len(chunks)
-            
-        except Exception as e:
-            logger.error(f"Error indexing file {path}: {e}")
-            return 0
+        self._save_file_metadata()
+        return [len(chunks) for _, _, chunks, _, _ in batch]
+
+    def _get_process_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Worker pool for read/hash/chunk during index_directory (None = in-process)"""
+        if self.index_workers <= 1:
+            return None
+        if self._process_pool is None:
+            # spawn: the server process holds threads (watchdog, torch), which fork does not survive safely
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.index_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self._process_pool
+    
+    def _get_hash_pool(self) -> ThreadPoolExecutor:
+        """Shared thread pool for content-hash checks"""
+        if self._hash_pool is None:
+            self._hash_pool = ThreadPoolExecutor(
+                max_workers=min(32, (os.cpu_count() or 4) * 4), thread_name_prefix='hash'
+            )
+        return self._hash_pool
+    
+    def close_pools(self):
+        """Shut down the index_directory worker pools (recreated on next use)"""
+        pool, self._process_pool = self._process_pool, None
+        if pool is not None:
+            # Nothing is queued after a normal run; a cancelled one drops what is left
+            pool.shutdown(wait=False, cancel_futures=True)
+        hash_pool, self._hash_pool = self._hash_pool, None
+        if hash_pool is not None:
+            hash_pool.shutdown(wait=False, cancel_futures=True)
     
     async def index_directory(
         self,
@@ -364,6 +452,18 @@ class FileIndexer:
         force_reindex: bool = False
     ) -> Dict[str, int]:
         """Index all files in a directory"""
+        try:
+            return await self._index_directory(directory, extensions, force_reindex)
+        finally:
+            # Don't keep spawned workers around between (infrequent) full indexing runs
+            self.close_pools()
+    
+    async def _index_directory(
+        self,
+        directory: str,
+        extensions: Optional[List[str]],
+        force_reindex: bool
+    ) -> Dict[str, int]:
         stats = {
             "files_processed": 0,
             "files_skipped": 0,
@@ -394,7 +494,8 @@ class FileIndexer:
             # Default to config-enabled extensions
             valid_extensions = list(self.enabled_extensions)
         
-        # Discover files (full scan uses Python rglob inside utils.discover_files)
+        # Discover files (full scan walks with os.scandir inside discovery.discover_files).
+        # The walk is consumed lazily so indexing starts before discovery finishes.
         files_to_index = discover_files(
             dir_path=path,
             enabled_extensions=set(valid_extensions),
@@ -403,20 +504,99 @@ class FileIndexer:
             since_timestamp_file=None,
         )
         
-        logger.info(f"Found {len(files_to_index)} files to process")
+        def record(chunks: int):
+            if chunks > 0:
+                stats["files_processed"] += 1
+                stats["chunks_created"] += chunks
+            else:
+                stats["files_skipped"] += 1
         
+        # Read/hash/chunk runs in worker processes (or the default thread pool when
+        # index_workers <= 1); embedding and DB writes stay on the event loop
+        pool = self._get_process_pool()
+        loop = asyncio.get_running_loop()
+        in_flight: Dict[asyncio.Future, Tuple[Path, str, os.stat_result]] = {}
+        if pool is None:
+            max_in_flight = min(32, (os.cpu_count() or 1) * 4)
+            # tiktoken releases the GIL, so threads can share the parent's tokenizer
+            prepare_args: Tuple = (self.chunk_size, self.chunk_overlap, self.tokenizer)
+        else:
+            max_in_flight = self.index_workers * 4
+            prepare_args = (self.chunk_size, self.chunk_overlap)
+
+        # Prepared files are stored together once INDEX_BATCH_CHUNKS chunks have accumulated
+        pending: List[_PreparedFile] = []
+        pending_chunks = 0
+
+        async def flush():
+            nonlocal pending, pending_chunks
+            batch, pending, pending_chunks = pending, [], 0
+            if not batch:
+                return
+            try:
+                for chunks in await self._store_files(batch):
+                    record(chunks)
+            except Exception as e:
+                logger.error(f"Error storing {len(batch)} files: {e}")
+                for _ in batch:
+                    record(0)
+
+        async def add_prepared(
+            file_path: Path, language: str, st: os.stat_result, file_hash: str, chunks: List[FileChunk]
+        ):
+            nonlocal pending_chunks
+            pending.append((file_path, file_hash, chunks, language, st))
+            pending_chunks += len(chunks)
+            if pending_chunks >= self.INDEX_BATCH_CHUNKS:
+                await flush()
+
+        async def verify_then_prepare(file_path: Path, st: os.stat_result):
+            # Touched files: hash on the shared thread pool so reads overlap, then
+            # prepare only if the content really changed (None = unchanged)
+            hash_pool = self._get_hash_pool()
+            file_hash = await loop.run_in_executor(hash_pool, _hash_file, str(file_path))
+            legacy_alg = self._legacy_hash_alg(str(file_path))
+            legacy_hash = None
+            if legacy_alg is not None:
+                legacy_hash = await loop.run_in_executor(hash_pool, _hash_file, str(file_path), legacy_alg)
+            if self._hash_unchanged(str(file_path), file_hash, st, legacy_hash):
+                logger.debug(f"Skipping unchanged file: {file_path}")
+                return None
+            return await loop.run_in_executor(pool, _prepare_file, str(file_path), *prepare_args)
+
+        async def drain(return_when):
+            done, _ = await asyncio.wait(list(in_flight), return_when=return_when)
+            for future in done:
+                file_path, language, st = in_flight.pop(future)
+                try:
+                    prepared = future.result()
+                except Exception as e:
+                    logger.error(f"Error indexing file {file_path}: {e}")
+                    record(0)
+                    continue
+                if prepared is None:
+                    record(0)
+                    continue
+                file_hash, chunks = prepared
+                await add_prepared(file_path, language, st, file_hash, chunks)
+
         # Index each file
-        import time
         batch_start = time.perf_counter()
-        total = len(files_to_index)
+        i = 0
         for i, file_path in enumerate(files_to_index, start=1):
             try:
-                chunks = await self.index_file(str(file_path), force_reindex)
-                if chunks > 0:
-                    stats["files_processed"] += 1
-                    stats["chunks_created"] += chunks
+                checked = self._precheck(file_path, force_reindex)
+                if checked is None:
+                    record(0)
                 else:
-                    stats["files_skipped"] += 1
+                    language, st, needs_hash = checked
+                    if needs_hash:
+                        future = asyncio.ensure_future(verify_then_prepare(file_path, st))
+                    else:
+                        future = loop.run_in_executor(pool, _prepare_file, str(file_path), *prepare_args)
+                    in_flight[future] = (file_path, language, st)
+                    if len(in_flight) >= max_in_flight:
+                        await drain(asyncio.FIRST_COMPLETED)
             except Exception as e:
                 logger.error(f"Error processing {file_path}: {e}")
                 stats["errors"] += 1
@@ -425,73 +605,362 @@ class FileIndexer:
                 elapsed = (time.perf_counter() - batch_start)
                 rate = i / elapsed if elapsed > 0 else 0
                 logger.info(
-                    f"Progress: {i}/{total} files ({rate:.1f} files/sec), "
+                    f"Progress: {i} files ({rate:.1f} files/sec), "
                     f"processed={stats['files_processed']}, "
                     f"skipped={stats['files_skipped']}, errors={stats['errors']}, "
                     f"chunks={stats['chunks_created']}"
                 )
         
-        logger.info(f"Indexing complete: {stats}")
+        if in_flight:
+            await drain(asyncio.ALL_COMPLETED)
+        await flush()
+        # Sidecar writes are throttled during the run; persist the final file index once
+        await flush_file_indexes()
+        
+        logger.info(f"Indexing complete ({i} files found): {stats}")
         return stats
     
+    def batch_update(self, items: Iterable[Tuple[str, str]]):
+        """Apply coalesced watcher events [(path, event_type), ...]"""
+        items = list(items)
+        # Per-event traces are debug-level; one summary line per batch
+        logger.info(f"Applying {len(items)} file change(s)")
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            # Called from the watchdog thread: hand the batch to the server's loop
+            asyncio.run_coroutine_threadsafe(self._apply_updates_serialized(items), loop)
+        else:
+            # Each debounce Timer thread would otherwise run its own loop concurrently
+            with self._apply_thread_lock:
+                asyncio.run(self._apply_updates(items))
+
+    async def _apply_updates_serialized(self, items: List[Tuple[str, str]]):
+        """Run one batch on the server's loop, after any batch already in progress"""
+        if self._apply_lock is None:
+            self._apply_lock = asyncio.Lock()
+        # asyncio.Lock wakes waiters FIFO, so batches still apply in submission order
+        async with self._apply_lock:
+            await self._apply_updates(items)
+    
+    async def _apply_updates(self, items: List[Tuple[str, str]]):
+        """Reindex or remove files for one batch of watcher events"""
+        moved = await self._apply_moves(items)
+        metadata_changed = bool(moved)
+        for path, event_type in items:
+            if path in moved:
+                continue
+            try:
+                if event_type == 'deleted':
+                    if path in self.file_metadata:
+                        await self.vectordb.delete_by_file(path)
+                        del self.file_metadata[path]
+                        metadata_changed = True
+                else:
+                    await self.index_file(path)
+            except Exception as e:
+                logger.error(f"Error applying {event_type} event for {path}: {e}")
+        if metadata_changed:
+            self._save_file_metadata()
+    
+    async def _apply_moves(self, items: List[Tuple[str, str]]) -> Set[str]:
+        """Turn deleted+created pairs of one file (same inode, mtime and size) into renames
+
+        The existing chunks are moved to the new path instead of being deleted and
+        embedded again. Returns the paths (old and new) that were handled.
+        """
+        deleted_by_ino = {}
+        for path, event_type in items:
+            entry = self.file_metadata.get(path)
+            if event_type == 'deleted' and entry and 'ino' in entry:
+                deleted_by_ino[entry['ino']] = path
+        if not deleted_by_ino:
+            return set()
+        
+        handled: Set[str] = set()
+        for path, event_type in items:
+            if event_type == 'deleted' or path in self.file_metadata:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            old_path = deleted_by_ino.get(st.st_ino)
+            if old_path is None or old_path in handled:
+                continue
+            entry = self.file_metadata[old_path]
+            if entry.get('mtime_ns') != st.st_mtime_ns or entry.get('size') != st.st_size:
+                continue  # inode reused by a different file
+            if not await self.vectordb.rename_file(old_path, path):
+                continue  # nothing to move; fall back to delete + index
+            self.file_metadata[path] = {**self.file_metadata.pop(old_path), "indexed_at": datetime.now().isoformat()}
+            handled.update((old_path, path))
+        return handled
+    
     def start_watching(self, directory: str):
         """Start watching directory for changes"""
         if self.observer:
             self.observer.stop()
         
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+        
         event_handler = FileChangeHandler(self)
+        self._event_handler = event_handler
         self.observer = Observer()
-        self.observer.schedule(event_handler, directory, recursive=True)
+        self._watch_root = directory
+        self._subdir_watches = {}
+        self._event_filter_supported = True
+        
+        try:
+            with os.scandir(directory) as it:
+                subdirs = [
+                    entry.path for entry in it
+                    if entry.is_dir(follow_symlinks=False) and not self._is_excluded(Path(entry.name))
+                ]
+        except OSError as e:
+            logger.error(f"Error listing {directory}, watching it recursively: {e}")
+            self._schedule_watch(directory, recursive=True)
+        else:
+            # Excluded sub-directories (.git, node_modules, ...) are never watched, so
+            # their churn is not delivered at all; the root itself only for top-level files
+            self._schedule_watch(directory, recursive=False, event_types=ROOT_WATCHED_EVENT_TYPES)
+            for subdir in subdirs:
+                self._subdir_watches[subdir] = self._schedule_watch(subdir, recursive=True)
         self.observer.start()
         logger.info(f"Started watching directory: {directory}")
     
+    def _schedule_watch(self, path: str, recursive: bool, event_types: tuple = WATCHED_EVENT_TYPES) -> ObservedWatch:
+        """Schedule the event handler on one path, filtering events in the observer when possible"""
+        handler = self._event_handler
+        if self._event_filter_supported:
+            try:
+                return self.observer.schedule(handler, path, recursive=recursive, event_filter=list(event_types))
+            except TypeError:
+                # watchdog<4 has no event_filter; drop unwanted events in Python instead
+                self._event_filter_supported = False
+                handler.event_types = ROOT_WATCHED_EVENT_TYPES
+        return self.observer.schedule(handler, path, recursive=recursive)
+    
+    def _watch_new_directory(self, path: str):
+        """Start watching a directory created directly under the watched root"""
+        if self.observer is None or self._watch_root is None:
+            return
+        new_dir = Path(path)
+        if new_dir.parent != Path(self._watch_root) or self._is_excluded(Path(new_dir.name)):
+            return
+        self._subdir_watches[path] = self._schedule_watch(path, recursive=True)
+        logger.info(f"Started watching new directory: {path}")
+        
+        # Files that landed before the watch was in place (e.g. git checkout, mv of a tree)
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = [d for d in dirnames if not self._is_excluded(Path(d))]
+            for name in filenames:
+                self._event_handler.on_created(FileCreatedEvent(os.path.join(dirpath, name)))
+    
+    def _unwatch_directory(self, path: str):
+        """Drop the watch of a top-level directory that was deleted or renamed
+
+        Its recursive watch follows the inode, so after a rename it would keep
+        reporting events under the old path.
+        """
+        watch = self._subdir_watches.pop(path, None)
+        if watch is None or self.observer is None:
+            return
+        try:
+            self.observer.unschedule(watch)
+        except Exception as e:
+            # The emitter may already be gone along with the directory
+            logger.debug(f"Error unscheduling watch for {path}: {e}")
+        logger.info(f"Stopped watching directory: {path}")
+    
+    def _indexed_files_under(self, directory: str) -> List[str]:
+        """Indexed file paths below a directory"""
+        prefix = directory.rstrip(os.sep) + os.sep
+        # list() first: batches may update file_metadata on the loop thread meanwhile
+        return [p for p in list(self.file_metadata) if p.startswith(prefix)]
+    
     def stop_watching(self):
         """Stop watching directory"""
         if self.observer:
             self.observer.stop()
             self.observer.join()
             logger.info("Stopped watching directory")
+        if self._event_handler:
+            self._event_handler.close()
+            self._event_handler = None
+        self._subdir_watches = {}
+
+
+def _coalesce_event(previous: Optional[str], event_type: str) -> Optional[str]:
+    """Merge a new event into the pending one for the same path (None = nothing to do)"""
+    if previous == 'created':
+        if event_type == 'deleted':
+            return None  # created then deleted within the window: no-op
+        return 'created'
+    if previous == 'deleted' and event_type == 'created':
+        return 'modified'  # replaced (e.g. editor save via rename)
+    return event_type
 
 
 class FileChangeHandler(FileSystemEventHandler):
     """Handle file system events for auto-indexing"""
     
-    def __init__(self, indexer: FileIndexer):
-        self.indexer = indexer
+    # Quiet window before pending events are flushed, and the cap on how long
+    # a continuous burst can delay them
+    DEBOUNCE_SECONDS = 0.25
+    MAX_LATENCY_SECONDS = 0.5
+    # Paths whose exclude decision is remembered (oldest dropped first)
+    EXCLUDE_CACHE_SIZE = 10000
     
-    def on_modified(self, event):
-        if not event.is_directory:
-            file_path = Path(event.src_path)
-            # Skip excluded directories
-            if self.indexer._is_excluded(file_path):
-                return
-            # Allowed extensions from indexer (config-aware) or fallback to supported
-            ext = file_path.suffix.lower()
-            allowed = getattr(self.indexer, 'enabled_extensions', None)
+    def __init__(self, indexer: FileIndexer, timer_factory=threading.Timer):
+        self.indexer = indexer
+        self._timer_factory = timer_factory
+        self._lock = threading.Lock()
+        self._pending: Dict[str, str] = {}
+        self._timer = None
+        self._timer_generation = 0
+        self._burst_start = 0.0
+        # Python-side event filter, only used when the observer cannot filter
+        self.event_types: Optional[tuple] = None
+        # Allowed extensions, captured once (fallback to supported for indexer stand-ins)
+        ext_set = getattr(indexer, '_ext_set', None)
+        if ext_set is None:
+            allowed = getattr(indexer, 'enabled_extensions', None)
             if allowed is None:
                 allowed = getattr(FileIndexer, 'SUPPORTED_EXTENSIONS', {})
-            allowed_set = set(allowed.keys()) if isinstance(allowed, dict) else set(allowed)
-            if ext in allowed_set:
-                logger.info(f"File modified: {file_path}")
-                # Schedule reindexing (in production, use async task queue)
-                # asyncio.create_task(self.indexer.index_file(str(file_path)))
+            ext_set = frozenset(e.lower() for e in allowed)
+        self._ext_set = ext_set
+        # src_path -> excluded; only touched from the observer thread
+        self._excluded_cache: Dict[str, bool] = {}
+    
+    def dispatch(self, event):
+        if self.event_types is not None and not isinstance(event, self.event_types):
+            return
+        super().dispatch(event)
+    
+    def _record(self, path: str, event_type: str):
+        """Merge an event into the pending batch (caller holds the lock)"""
+        merged = _coalesce_event(self._pending.get(path), event_type)
+        if merged is None:
+            self._pending.pop(path, None)
+        else:
+            self._pending[path] = merged
+    
+    def _enqueue(self, path: str, event_type: str):
+        """Record an event; the first of a burst is flushed at once, the rest after a quiet window"""
+        flush_now = False
+        with self._lock:
+            self._record(path, event_type)
+            
+            now = time.monotonic()
+            if self._timer is None:
+                self._burst_start = now
+                # 削除は直後の作成（リネーム・移動）と同じバッチで扱えるよう静止期間まで待つ
+                flush_now = event_type != 'deleted'
+            elif now - self._burst_start >= self.MAX_LATENCY_SECONDS:
+                flush_now = True
+                self._burst_start = now
+            else:
+                self._timer.cancel()
+            
+            self._timer_generation += 1
+            self._timer = self._timer_factory(
+                self.DEBOUNCE_SECONDS, self._on_quiet, args=(self._timer_generation,)
+            )
+            self._timer.daemon = True
+            self._timer.start()
+        
+        if flush_now:
+            self.flush()
+    
+    def _on_quiet(self, generation: int):
+        with self._lock:
+            if generation != self._timer_generation:
+                return  # superseded by a newer timer
+            self._timer = None
+        self.flush()
+    
+    def flush(self):
+        """Hand all pending events to the indexer as one batch"""
+        with self._lock:
+            items, self._pending = self._pending, {}
+        if items:
+            self.indexer.batch_update(list(items.items()))
+    
+    def close(self):
+        """Cancel the pending timer and flush what is left"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._timer_generation += 1
+        self.flush()
+    
+    def _wanted(self, src_path: str) -> bool:
+        """Extension + exclude check without building a Path for filtered-out events"""
+        name_start = src_path.rfind(os.sep) + 1
+        dot = src_path.rfind('.', name_start)
+        # dot == name_start is a dotfile with no suffix (same as Path.suffix)
+        ext = src_path[dot:].lower() if dot > name_start else ''
+        if ext not in self._ext_set:
+            return False
+        # 同じファイルへの連続イベントでPathを毎回作らない
+        excluded = self._excluded_cache.get(src_path)
+        if excluded is None:
+            excluded = bool(self.indexer._is_excluded(Path(src_path)))
+            if len(self._excluded_cache) >= self.EXCLUDE_CACHE_SIZE:
+                del self._excluded_cache[next(iter(self._excluded_cache))]
+            self._excluded_cache[src_path] = excluded
+        return not excluded
+    
+    def on_modified(self, event):
+        if not event.is_directory and self._wanted(event.src_path):
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"File modified: {event.src_path}")
+            self._enqueue(event.src_path, 'modified')
     
     def on_created(self, event):
-        if not event.is_directory:
-            file_path = Path(event.src_path)
-            if self.indexer._is_excluded(file_path):
-                return
-            ext = file_path.suffix.lower()
-            allowed = getattr(self.indexer, 'enabled_extensions', None)
-            if allowed is None:
-                allowed = getattr(FileIndexer, 'SUPPORTED_EXTENSIONS', {})
-            allowed_set = set(allowed.keys()) if isinstance(allowed, dict) else set(allowed)
-            if ext in allowed_set:
-                logger.info(f"File created: {file_path}")
-                # Schedule indexing
+        if event.is_directory:
+            self.indexer._watch_new_directory(event.src_path)
+            return
+        if self._wanted(event.src_path):
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"File created: {event.src_path}")
+            self._enqueue(event.src_path, 'created')
+    
+    def _directory_removed(self, path: str):
+        """Queue every indexed file under a vanished directory as deleted"""
+        for indexed in self.indexer._indexed_files_under(path):
+            self._enqueue(indexed, 'deleted')
     
     def on_deleted(self, event):
-        if not event.is_directory:
-            file_path = Path(event.src_path)
-            logger.info(f"File deleted: {file_path}")
-            # Remove from index
+        if event.is_directory:
+            self.indexer._unwatch_directory(event.src_path)
+            self._directory_removed(event.src_path)
+            return
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"File deleted: {event.src_path}")
+        # Remove from index
+        self._enqueue(event.src_path, 'deleted')
+    
+    def on_moved(self, event):
+        if event.is_directory:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Directory moved: {event.src_path} -> {event.dest_path}")
+            self.indexer._unwatch_directory(event.src_path)
+            # Deletes wait for the quiet window, so the creates queued while the new
+            # path is walked land in the same batch and are applied as renames
+            self._directory_removed(event.src_path)
+            self.indexer._watch_new_directory(event.dest_path)
+            return
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"File moved: {event.src_path} -> {event.dest_path}")
+        if not self._wanted(event.dest_path):
+            self._enqueue(event.src_path, 'deleted')
+            return
+        # Both halves go into the same batch so the indexer can pair them up
+        with self._lock:
+            self._record(event.src_path, 'deleted')
+        self._enqueue(event.dest_path, 'created')
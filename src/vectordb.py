@@ -2,16 +2,160 @@
 Vector Database management using ChromaDB
 """
 
+import asyncio
+import functools
+import hashlib
+import json
 import logging
+import os
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, List, Optional, Any, Set, Tuple
 
+import numpy as np
 import chromadb
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
 
 logger = logging.getLogger(__name__)
 
+# Search result cache shared by every VectorDB in the process
+# (the indexer and the search engine each hold their own instance): key -> (stored at, results).
+# Writes from another process on the same index_path are not seen, so entries also expire
+_query_cache: "OrderedDict[tuple, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+# Bumped on every invalidation so a search that overlapped a write does not cache its result
+_query_cache_generation = 0
+
+
+def _copy_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Copies of search results (and their metadata) that callers may mutate freely"""
+    return [
+        dict(r, metadata=dict(r['metadata'])) if r['metadata'] is not None else dict(r)
+        for r in results
+    ]
+
+
+def _invalidate_query_cache() -> None:
+    """Drop cached search results after any write"""
+    global _query_cache_generation
+    _query_cache_generation += 1
+    _query_cache.clear()
+
+
+async def _offload_write(func, *args, **kwargs):
+    """Run a blocking Chroma write in a worker thread, then drop cached searches"""
+    try:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    finally:
+        _invalidate_query_cache()
+
+
+# file_path -> chunk ids per (index_path, collection), shared the same way
+_file_indexes: Dict[tuple, Dict[str, Set[str]]] = {}
+# Indexes changed since their sidecar was written. A dirty index has no sidecar on disk,
+# so a crash before the next flush makes the next load rebuild from Chroma
+_dirty_file_indexes: Set[tuple] = set()
+_file_index_flushed_at: Dict[tuple, float] = {}
+# Writes that found a file index unloaded; a load that overlapped one is redone
+_file_index_misses: Dict[tuple, int] = {}
+# Sidecar (st_mtime_ns, st_size, st_ino) as this process last left it (None = removed). Another
+# process indexing the same index_path changes it, which makes the in-memory index untrusted
+_sidecar_states: Dict[tuple, Optional[tuple]] = {}
+# Sidecars this process is writing right now (their state is not settled yet)
+_sidecar_writes: Set[tuple] = set()
+_FILE_INDEX_LOAD_ATTEMPTS = 3
+
+# Minimum seconds between sidecar rewrites triggered by writes (flush_file_indexes forces one)
+_FILE_INDEX_FLUSH_INTERVAL = 30.0
+
+
+def _sidecar_path(key: tuple) -> Path:
+    """Sidecar file holding the file_path -> ids index of (index_path, collection)"""
+    index_path, collection_name = key
+    return Path(index_path) / f"file_index.{collection_name}.json"
+
+
+def _sidecar_state(key: tuple) -> Optional[tuple]:
+    """(st_mtime_ns, st_size, st_ino) of a sidecar, None if there is none"""
+    try:
+        st = os.stat(_sidecar_path(key))
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _write_sidecar(key: tuple, snapshot: Dict[str, Iterable[str]]) -> Optional[tuple]:
+    """Write a file index snapshot (write to a temp file, then atomically replace); returns its state"""
+    path = _sidecar_path(key)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({file_path: sorted(ids) for file_path, ids in snapshot.items()}, f)
+    os.replace(tmp_path, path)
+    return _sidecar_state(key)
+
+
+def _remove_sidecar(key: tuple) -> None:
+    _sidecar_path(key).unlink(missing_ok=True)
+    _sidecar_states[key] = None
+
+
+def _file_index_missed(key: tuple) -> None:
+    """Record a write to a collection whose file index is not loaded"""
+    _file_index_misses[key] = _file_index_misses.get(key, 0) + 1
+    # The next load must rebuild from Chroma instead of trusting the now stale sidecar
+    _remove_sidecar(key)
+
+
+async def _persist_file_index(key: tuple, force: bool = False) -> None:
+    """Write a dirty file index off the event loop (at most once per flush interval unless forced)"""
+    if key not in _dirty_file_indexes:
+        return
+    now = time.monotonic()
+    if not force and now - _file_index_flushed_at.get(key, float('-inf')) < _FILE_INDEX_FLUSH_INTERVAL:
+        return
+    index = _file_indexes.get(key)
+    _dirty_file_indexes.discard(key)
+    if index is None:
+        return
+    _file_index_flushed_at[key] = now
+    # Copy on the loop thread; sorting and serializing happen in the worker
+    snapshot = {file_path: tuple(ids) for file_path, ids in index.items()}
+    _sidecar_writes.add(key)
+    try:
+        _sidecar_states[key] = await asyncio.to_thread(_write_sidecar, key, snapshot)
+    except Exception as e:
+        logger.warning(f"Could not save file index for {key[1]}: {e}")
+        _dirty_file_indexes.add(key)
+        return
+    finally:
+        _sidecar_writes.discard(key)
+    if key in _dirty_file_indexes:
+        # Changed again while writing: the new sidecar is already stale
+        _remove_sidecar(key)
+
+
+async def flush_file_indexes() -> None:
+    """Write every dirty file index (call on shutdown)"""
+    for key in list(_dirty_file_indexes):
+        await _persist_file_index(key, force=True)
+
+
+@functools.lru_cache(maxsize=2048)
+def _file_where(file_path: str) -> Dict[str, str]:
+    """Shared where-filter for one file (Chroma only reads it; never mutate the result)"""
+    return {"file_path": file_path}
+
+
+# Page size used when rebuilding the file index from Chroma
+_FILE_INDEX_PAGE_SIZE = 5000
+
+# Result count from which distance -> score conversion runs in NumPy
+_VECTORIZED_SCORE_MIN = 256
+
+# Rows per add/upsert when the client cannot report its limit (Chroma's SQLite default)
+_DEFAULT_MAX_BATCH_SIZE = 5461
+
 
 class VectorDB:
     """Vector database for storing and searching embeddings"""
@@ -34,6 +178,9 @@ class VectorDB:
         self.collection_name = collection_name or config.get('collection_name', 'codebase')
         self._init_collection()
         self.collections_cache = {}
+        self.query_cache_size = int(config.get('query_cache_size', 256))
+        self.query_cache_ttl = float(config.get('query_cache_ttl', 30.0))
+        self._max_batch_size: Optional[int] = None
     
     def _init_collection(self):
         """Initialize or get existing collection"""
@@ -59,8 +206,9 @@ class VectorDB:
     
     def get_or_create_collection(self, collection_name: str):
         """Get or create a collection by name"""
-        if collection_name in self.collections_cache:
-            return self.collections_cache[collection_name]
+        cached = self.collections_cache.get(collection_name)
+        if cached is not None:
+            return cached
         
         try:
             collection = self.client.get_collection(name=collection_name)
@@ -75,6 +223,115 @@ class VectorDB:
         self.collections_cache[collection_name] = collection
         return collection
     
+    def _file_index_key(self, collection_name: str) -> tuple:
+        return (str(self.index_path), collection_name)
+    
+    def _file_index_path(self, collection_name: str) -> Path:
+        """Sidecar file holding the file_path -> ids index of a collection"""
+        return _sidecar_path(self._file_index_key(collection_name))
+    
+    async def _get_file_index(self, collection, collection_name: str) -> Dict[str, Set[str]]:
+        """Get the file_path -> ids index, loading or rebuilding it in a worker thread
+
+        A loaded index is checked against collection.count() and the sidecar on each
+        use, so writes from another process make it reload instead of deleting stale ids.
+        """
+        key = self._file_index_key(collection_name)
+        for _ in range(_FILE_INDEX_LOAD_ATTEMPTS):
+            index = _file_indexes.get(key)
+            if index is not None:
+                if key in _sidecar_writes:
+                    return index
+                state, count = await asyncio.to_thread(
+                    lambda: (_sidecar_state(key), collection.count())
+                )
+                if _file_indexes.get(key) is not index:
+                    continue  # dropped or reloaded meanwhile
+                if state == _sidecar_states.get(key) and count == sum(map(len, index.values())):
+                    return index
+                logger.info(f"File index of {collection_name} changed outside this process; reloading")
+                _file_indexes.pop(key, None)
+                _dirty_file_indexes.discard(key)
+                continue
+            
+            misses = _file_index_misses.get(key, 0)
+            loaded, state = await asyncio.to_thread(self._load_file_index, collection, collection_name)
+            if key in _file_indexes:
+                # A concurrent load finished first; keep the index others already mutate
+                continue
+            if _file_index_misses.get(key, 0) != misses:
+                continue  # a write landed during the load, which may not have seen it
+            _file_indexes[key] = loaded
+            _sidecar_states[key] = state
+            return loaded
+        # Still racing writes: an uncached empty index makes callers delete by filter
+        return {}
+    
+    def _load_file_index(self, collection, collection_name: str) -> Tuple[Dict[str, Set[str]], Optional[tuple]]:
+        """Read the sidecar, or rebuild the index from Chroma (blocking; see _get_file_index)
+
+        Returns the index and the state of the sidecar it was read from or written to.
+        """
+        index = {}
+        key = self._file_index_key(collection_name)
+        state = _sidecar_state(key)
+        if state is not None:
+            sidecar = self._file_index_path(collection_name)
+            try:
+                with open(sidecar, 'r') as f:
+                    index = {path: set(ids) for path, ids in json.load(f).items()}
+                # 件数が合わなければ別プロセスで更新されたとみなして作り直す
+                if sum(len(ids) for ids in index.values()) != collection.count():
+                    index = {}
+            except Exception as e:
+                logger.debug(f"Ignoring unreadable file index {sidecar}: {e}")
+                index = {}
+        
+        if not index:
+            offset = 0
+            while True:
+                page = collection.get(include=['metadatas'], limit=_FILE_INDEX_PAGE_SIZE, offset=offset)
+                ids = page['ids'] or []
+                for doc_id, metadata in zip(ids, page['metadatas'] or []):
+                    if metadata and 'file_path' in metadata:
+                        index.setdefault(metadata['file_path'], set()).add(doc_id)
+                if len(ids) < _FILE_INDEX_PAGE_SIZE:
+                    break
+                offset += len(ids)
+            try:
+                state = _write_sidecar(key, index)
+            except Exception as e:
+                logger.warning(f"Could not save file index for {collection_name}: {e}")
+                state = None
+        
+        return index, state
+    
+    async def _file_index_changed(self, collection_name: str) -> None:
+        """Mark a collection's file index dirty and persist it if the flush interval has passed"""
+        key = self._file_index_key(collection_name)
+        if key not in _dirty_file_indexes:
+            _dirty_file_indexes.add(key)
+            _remove_sidecar(key)
+        await _persist_file_index(key)
+    
+    def _drop_file_index(self, collection_name: str) -> None:
+        """Forget the file index of a collection (memory and sidecar)"""
+        key = self._file_index_key(collection_name)
+        _file_indexes.pop(key, None)
+        _dirty_file_indexes.discard(key)
+        _remove_sidecar(key)
+    
+    def _get_max_batch_size(self) -> int:
+        """Largest number of rows Chroma accepts in one add/upsert (queried once)"""
+        if self._max_batch_size is None:
+            try:
+                size = self.client.get_max_batch_size()
+            except Exception as e:
+                logger.debug(f"Could not get max batch size from Chroma: {e}")
+                size = None
+            self._max_batch_size = size if isinstance(size, int) and size > 0 else _DEFAULT_MAX_BATCH_SIZE
+        return self._max_batch_size
+    
     def list_collections(self) -> List[str]:
         """List all available collections"""
         collections = self.client.list_collections()
@@ -83,10 +340,17 @@ class VectorDB:
     async def add_documents(
         self,
         documents: List[Dict[str, Any]],
-        collection_name: Optional[str] = None
+        collection_name: Optional[str] = None,
+        assume_new: bool = False
     ) -> None:
-        """Add documents with embeddings to the database"""
-        import time
+        """Add documents with embeddings to the database
+
+        Existing ids are overwritten via upsert; assume_new=True uses a plain add
+        when the caller knows every id is new.
+        """
+        if not documents:
+            return
+        _invalidate_query_cache()
         try:
             start = time.perf_counter()
             
@@ -96,19 +360,43 @@ class VectorDB:
             # Extract data from documents
             ids = [doc['id'] for doc in documents]
             contents = [doc['content'] for doc in documents]
-            embeddings = [doc['embedding'] for doc in documents]
+            # float32の連続配列にまとめて渡す（要素ごとのfloat変換を避ける）
+            # ChromaDBのHNSWはfloat32しか保持しないため、float16/int8に落としても省メモリにならない
+            embeddings = np.ascontiguousarray(
+                [doc['embedding'] for doc in documents], dtype=np.float32
+            )
             metadatas = [doc.get('metadata', {}) for doc in documents]
             
-            # Add to collection
             add_start = time.perf_counter()
-            collection.add(
-                ids=ids,
-                documents=contents,
-                embeddings=embeddings,
-                metadatas=metadatas
-            )
+            # 既存IDの更新と新規追加を upsert で処理する（新規のみなら add）
+            write = collection.add if assume_new else collection.upsert
+            # Chroma rejects writes above its max batch size, so split only when needed
+            batch_size = self._get_max_batch_size()
+            
+            def write_batches():
+                for i in range(0, len(ids), batch_size):
+                    write(
+                        ids=ids[i:i + batch_size],
+                        documents=contents[i:i + batch_size],
+                        embeddings=embeddings[i:i + batch_size],
+                        metadatas=metadatas[i:i + batch_size]
+                    )
+            
+            # Blocking Chroma I/O runs off the event loop, one thread hop for all batches
+            await _offload_write(write_batches)
             add_time = (time.perf_counter() - add_start) * 1000
             
+            # Keep the file index in sync (if it is not loaded yet, a load in progress is redone)
+            target_name = collection_name or self.collection_name
+            index = _file_indexes.get(self._file_index_key(target_name))
+            if index is None:
+                _file_index_missed(self._file_index_key(target_name))
+            else:
+                for doc_id, metadata in zip(ids, metadatas):
+                    if metadata and 'file_path' in metadata:
+                        index.setdefault(metadata['file_path'], set()).add(doc_id)
+                await self._file_index_changed(target_name)
+            
             total_time = (time.perf_counter() - start) * 1000
             logger.info(f"Added {len(documents)} documents to collection in {total_time:.1f}ms (DB write: {add_time:.1f}ms)")
             
@@ -121,7 +409,7 @@ class VectorDB:
     
     async def search(
         self,
-        query_embedding: List[float],
+        query_embedding: Any,
         limit: int = 10,
         filter: Optional[Dict] = None,
         collection_name: Optional[str] = None
@@ -131,24 +419,56 @@ class VectorDB:
             # Get the target collection
             collection = self.get_or_create_collection(collection_name) if collection_name else self.collection
             
+            query_embeddings = np.ascontiguousarray([query_embedding], dtype=np.float32)
+            cache_key = (
+                str(self.index_path),
+                collection_name or self.collection_name,
+                hashlib.blake2b(query_embeddings.tobytes(), digest_size=16).digest(),
+                limit,
+                json.dumps(filter, sort_keys=True, default=str),
+            )
+            cached = _query_cache.get(cache_key)
+            if cached is not None:
+                stored_at, cached_results = cached
+                if time.monotonic() - stored_at < self.query_cache_ttl:
+                    _query_cache.move_to_end(cache_key)
+                    return _copy_results(cached_results)
+                del _query_cache[cache_key]
+            
             # Perform search
-            results = collection.query(
-                query_embeddings=[query_embedding],
+            generation = _query_cache_generation
+            results = await asyncio.to_thread(
+                collection.query,
+                query_embeddings=query_embeddings,
                 n_results=limit,
                 where=filter
             )
             
-            # Format results
+            # Format results (one query, so each field holds a single row)
             formatted_results = []
             
             if results['ids'] and results['ids'][0]:
-                for i in range(len(results['ids'][0])):
-                    formatted_results.append({
-                        'id': results['ids'][0][i],
-                        'content': results['documents'][0][i] if results['documents'] else '',
-                        'metadata': results['metadatas'][0][i] if results['metadatas'] else {},
-                        'score': 1 - results['distances'][0][i] if results['distances'] else 0
-                    })
+                ids = results['ids'][0]
+                docs = results['documents'][0] if results['documents'] else [''] * len(ids)
+                metas = results['metadatas'][0] if results['metadatas'] else [{} for _ in ids]
+                if not results['distances']:
+                    scores = [0] * len(ids)
+                elif len(ids) >= _VECTORIZED_SCORE_MIN:
+                    # float64 so scores match the scalar path exactly
+                    scores = (1.0 - np.asarray(results['distances'][0], dtype=np.float64)).tolist()
+                else:
+                    scores = [1 - distance for distance in results['distances'][0]]
+                formatted_results = [
+                    {'id': doc_id, 'content': doc, 'metadata': metadata, 'score': score}
+                    for doc_id, doc, metadata, score in zip(ids, docs, metas, scores)
+                ]
+            
+            if self.query_cache_size > 0 and generation == _query_cache_generation:
+                # The caller gets its own copies, so enriching them cannot change the cached entry
+                _query_cache[cache_key] = (time.monotonic(), formatted_results)
+                while len(_query_cache) > self.query_cache_size:
+                    _query_cache.popitem(last=False)
+                return _copy_results(formatted_results)
             
             return formatted_results
             
@@ -159,7 +479,7 @@ class VectorDB:
     async def get_document_by_id(self, doc_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific document by ID"""
         try:
-            results = self.collection.get(ids=[doc_id])
+            results = await asyncio.to_thread(self.collection.get, ids=[doc_id])
             
             if results['ids']:
                 return {
@@ -175,8 +495,19 @@ class VectorDB:
     
     async def delete_documents(self, ids: List[str]) -> bool:
         """Delete documents by IDs"""
+        _invalidate_query_cache()
         try:
-            self.collection.delete(ids=ids)
+            await _offload_write(self.collection.delete, ids=ids)
+            index = _file_indexes.get(self._file_index_key(self.collection_name))
+            if index is None:
+                _file_index_missed(self._file_index_key(self.collection_name))
+            else:
+                removed = set(ids)
+                for path in list(index):
+                    index[path] -= removed
+                    if not index[path]:
+                        del index[path]
+                await self._file_index_changed(self.collection_name)
             logger.info(f"Deleted {len(ids)} documents")
             return True
         except Exception as e:
@@ -185,21 +516,88 @@ class VectorDB:
     
     async def delete_by_file(self, file_path: str, collection_name: Optional[str] = None) -> int:
         """Delete all chunks from a specific file"""
+        return await self.delete_by_files([file_path], collection_name)
+    
+    async def delete_by_files(self, file_paths: Iterable[str], collection_name: Optional[str] = None) -> int:
+        """Delete all chunks from several files (one delete by id, one by filter for unknown files)"""
+        file_paths = list(file_paths)
+        if not file_paths:
+            return 0
+        _invalidate_query_cache()
         try:
-            # Get the target collection
             collection = self.get_or_create_collection(collection_name) if collection_name else self.collection
             
-            # Delete by metadata filter
-            collection.delete(
-                where={"file_path": file_path}
-            )
-            logger.info(f"Deleted chunks from {file_path}")
+            target_name = collection_name or self.collection_name
+            index = await self._get_file_index(collection, target_name)
+            ids: List[str] = []
+            unknown: List[str] = []
+            for file_path in file_paths:
+                known = index.pop(file_path, None)
+                if known:
+                    ids.extend(known)
+                else:
+                    unknown.append(file_path)
+            if ids:
+                await _offload_write(collection.delete, ids=ids)
+                await self._file_index_changed(target_name)
+            if len(unknown) == 1:
+                await _offload_write(collection.delete, where=_file_where(unknown[0]))
+            elif unknown:
+                await _offload_write(collection.delete, where={"file_path": {"$in": unknown}})
+            if len(file_paths) == 1:
+                logger.info(f"Deleted chunks from {file_paths[0]}")
+            else:
+                logger.info(f"Deleted chunks from {len(file_paths)} files")
             return 0  # ChromaDB doesn't return delete count
             
         except Exception as e:
             logger.error(f"Error deleting file chunks: {e}")
             return 0
     
+    async def rename_file(self, old_path: str, new_path: str, collection_name: Optional[str] = None) -> int:
+        """Move a file's chunks to a new path, keeping their embeddings (returns chunks moved)"""
+        _invalidate_query_cache()
+        try:
+            collection = self.get_or_create_collection(collection_name) if collection_name else self.collection
+            target_name = collection_name or self.collection_name
+            index = await self._get_file_index(collection, target_name)
+            
+            include = ['documents', 'embeddings', 'metadatas']
+            known = index.get(old_path)
+            if known:
+                chunks = await asyncio.to_thread(collection.get, ids=list(known), include=include)
+            else:
+                chunks = await asyncio.to_thread(collection.get, where=_file_where(old_path), include=include)
+            old_ids = chunks['ids'] or []
+            if not old_ids:
+                return 0
+            
+            # Chunk ids start with the file path, so the moved chunks get new ids
+            prefix = f"{old_path}:"
+            new_ids = [
+                new_path + doc_id[len(old_path):] if doc_id.startswith(prefix) else f"{new_path}:{doc_id}"
+                for doc_id in old_ids
+            ]
+            metadatas = [{**(metadata or {}), "file_path": new_path} for metadata in chunks['metadatas']]
+            await _offload_write(
+                collection.upsert,
+                ids=new_ids,
+                documents=chunks['documents'],
+                embeddings=chunks['embeddings'],
+                metadatas=metadatas
+            )
+            await _offload_write(collection.delete, ids=old_ids)
+            
+            index.pop(old_path, None)
+            index[new_path] = set(new_ids)
+            await self._file_index_changed(target_name)
+            logger.info(f"Moved {len(old_ids)} chunks from {old_path} to {new_path}")
+            return len(old_ids)
+            
+        except Exception as e:
+            logger.error(f"Error moving file chunks: {e}")
+            return 0
+    
     async def get_all_files(self, collection_name: Optional[str] = None) -> List[str]:
         """Get all unique file paths in the collection"""
         try:
@@ -207,16 +605,14 @@ class VectorDB:
             collection = self.get_or_create_collection(collection_name) if collection_name else self.collection
             
             # Get all documents' metadata
-            results = collection.get()
-            
-            # Extract unique file paths
-            file_paths = set()
-            if results['metadatas']:
-                for metadata in results['metadatas']:
-                    if metadata and 'file_path' in metadata:
-                        file_paths.add(metadata['file_path'])
+            results = await asyncio.to_thread(collection.get)
             
-            return list(file_paths)
+            # Extract unique file paths in one pass
+            return list({
+                metadata['file_path']
+                for metadata in results['metadatas'] or ()
+                if metadata and 'file_path' in metadata
+            })
             
         except Exception as e:
             logger.error(f"Error getting all files: {e}")
@@ -224,15 +620,17 @@ class VectorDB:
     
     async def clear(self, collection_name: Optional[str] = None) -> None:
         """Clear all documents from the collection"""
+        _invalidate_query_cache()
         try:
             collection_name = collection_name or self.collection_name
             
             # Delete the collection
-            self.client.delete_collection(name=collection_name)
+            await _offload_write(self.client.delete_collection, name=collection_name)
+            self._drop_file_index(collection_name)
             logger.info(f"Deleted collection: {collection_name}")
             
             # Recreate it
-            self._init_collection()
+            await asyncio.to_thread(self._init_collection)
             logger.info(f"Recreated collection: {collection_name}")
             
         except Exception as e:
@@ -243,10 +641,10 @@ class VectorDB:
         """Get statistics about the collection"""
         try:
             # Get total document count
-            count = self.collection.count()
+            count = await asyncio.to_thread(self.collection.count)
             
             # Get sample of documents to analyze
-            sample = self.collection.get(limit=100)
+            sample = await asyncio.to_thread(self.collection.get, limit=100)
             
             # Analyze file types
             file_types = {}
@@ -273,8 +671,10 @@ class VectorDB:
     
     def reset_collection(self) -> bool:
         """Reset (delete and recreate) the collection"""
+        _invalidate_query_cache()
         try:
             self.client.delete_collection(name=self.collection_name)
+            self._drop_file_index(self.collection_name)
             self._init_collection()
             logger.info(f"Reset collection: {self.collection_name}")
             return True
@@ -284,8 +684,10 @@ class VectorDB:
     
     async def update_metadata(self, doc_id: str, metadata: Dict) -> bool:
         """Update metadata for a document"""
+        _invalidate_query_cache()
         try:
-            self.collection.update(
+            await _offload_write(
+                self.collection.update,
                 ids=[doc_id],
                 metadatas=[metadata]
             )
@@ -0,0 +1,11 @@
+"""
+pytest configuration shared by all test modules
+"""
+
+import sys
+from pathlib import Path
+
+# Make src/ importable once per session (idempotent if a test module already added it)
+_SRC = str(Path(__file__).resolve().parent.parent / 'src')
+if _SRC not in sys.path:
+    sys.path.insert(0, _SRC)
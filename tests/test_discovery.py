@@ -3,6 +3,7 @@
 Unit tests for discovery module
 """
 
+import io
 import json
 import tempfile
 import unittest
@@ -18,7 +19,12 @@ from discovery import (
     resolve_project_config,
     effective_filters,
     discover_files,
-    _is_excluded_parts
+    _is_excluded_parts,
+    _split_patterns,
+    _which,
+    _scandir_recursive,
+    _scandir_parallel,
+    _PARALLEL_MIN_ENTRIES
 )
 
 
@@ -79,6 +85,31 @@ class TestResolveProjectConfig(unittest.TestCase):
         self.assertEqual(result, base_config)
 
 
+    def test_project_config_parse_is_cached(self):
+        """Test that an unchanged project config is not re-read"""
+        import builtins
+        import os
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+        cfg_path = Path(temp_dir) / ".mcp-local-rag.json"
+        cfg_path.write_text(json.dumps({"chunk_size": 2000}))
+        
+        with patch('builtins.open', wraps=builtins.open) as mock_file:
+            first = resolve_project_config({"chunk_size": 1000}, Path(temp_dir))
+            second = resolve_project_config({"chunk_size": 1000}, Path(temp_dir))
+        
+        self.assertEqual(first["chunk_size"], 2000)
+        self.assertEqual(second["chunk_size"], 2000)
+        self.assertEqual(mock_file.call_count, 1)
+        
+        # Changing the file invalidates the cached parse
+        cfg_path.write_text(json.dumps({"chunk_size": 3000, "x": 1}))
+        st = cfg_path.stat()
+        os.utime(cfg_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        third = resolve_project_config({"chunk_size": 1000}, Path(temp_dir))
+        self.assertEqual(third["chunk_size"], 3000)
+
+
 class TestEffectiveFilters(unittest.TestCase):
     """Test effective_filters function"""
     
@@ -183,6 +214,15 @@ class TestIsExcludedParts(unittest.TestCase):
         self.assertTrue(result)
 
 
+    def test_split_patterns(self):
+        """Test that literal names and glob patterns are separated"""
+        literals, globs = _split_patterns(("node_modules", ".*_cache", "build?"))
+        
+        self.assertEqual(literals, frozenset({"node_modules"}))
+        self.assertEqual(len(globs), 2)
+        self.assertTrue(any(g.match(".mypy_cache") for g in globs))
+
+
 class TestDiscoverFiles(unittest.TestCase):
     """Test discover_files function"""
     
@@ -190,6 +230,9 @@ class TestDiscoverFiles(unittest.TestCase):
         """Set up test fixtures"""
         self.temp_dir = tempfile.mkdtemp()
         self.test_path = Path(self.temp_dir)
+        # shutil.which is patched per test; don't reuse a resolution cached elsewhere
+        _which.cache_clear()
+        self.addCleanup(_which.cache_clear)
         
         # Create test file structure with old timestamps
         import time
@@ -222,12 +265,12 @@ class TestDiscoverFiles(unittest.TestCase):
     
     def test_full_scan_with_filters(self):
         """Test full scan with extension and exclude filters"""
-        files = discover_files(
+        files = list(discover_files(
             dir_path=self.test_path,
             enabled_extensions={".py", ".js"},
             exclude_dirs={"node_modules", ".git"},
             changed_within_seconds=None
-        )
+        ))
         
         # Convert to relative paths for easier assertion
         rel_files = sorted(str(f.relative_to(self.test_path)) for f in files)
@@ -240,12 +283,12 @@ class TestDiscoverFiles(unittest.TestCase):
     
     def test_full_scan_all_extensions(self):
         """Test full scan with all extensions"""
-        files = discover_files(
+        files = list(discover_files(
             dir_path=self.test_path,
             enabled_extensions={".py", ".js", ".txt", ".md"},
             exclude_dirs={"node_modules", ".git"},
             changed_within_seconds=None
-        )
+        ))
         
         rel_files = sorted(str(f.relative_to(self.test_path)) for f in files)
         
@@ -256,6 +299,88 @@ class TestDiscoverFiles(unittest.TestCase):
         self.assertIn("src/test.txt", rel_files)
         self.assertIn("README.md", rel_files)
     
+    def test_full_scan_skips_suffix_only_dotfiles(self):
+        """Test a file named just ".py" is not indexed (no suffix, as for the watcher)"""
+        (self.test_path / "src" / ".py").touch()
+        (self.test_path / "src" / ".hidden.py").touch()
+        
+        files = list(discover_files(
+            dir_path=self.test_path,
+            enabled_extensions={".py"},
+            exclude_dirs={"node_modules", ".git"},
+            changed_within_seconds=None
+        ))
+        
+        rel_files = sorted(str(f.relative_to(self.test_path)) for f in files)
+        self.assertEqual(rel_files, ["src/.hidden.py", "src/main.py"])
+    
+    def test_full_scan_prunes_excluded_directories(self):
+        """Test that excluded directories are never descended into"""
+        import os
+        with patch('discovery.os.scandir', wraps=os.scandir) as mock_scandir:
+            files = list(discover_files(
+                dir_path=self.test_path,
+                enabled_extensions={".py", ".js"},
+                exclude_dirs={"node_modules", ".git"},
+                changed_within_seconds=None
+            ))
+        
+        self.assertEqual(len(files), 2)
+        scanned = [str(c.args[0]) for c in mock_scandir.call_args_list]
+        self.assertFalse(any("node_modules" in p for p in scanned))
+        self.assertFalse(any(".git" in p for p in scanned))
+    
+    def test_full_scan_applies_ignore_file_while_walking(self):
+        """Test .mcp-local-rag-ignore patterns prune directories and skip files"""
+        import os
+        (self.test_path / "generated").mkdir()
+        (self.test_path / "generated" / "out.py").touch()
+        (self.test_path / "src" / "main_test.py").touch()
+        (self.test_path / ".mcp-local-rag-ignore").write_text("# comment\ngenerated/\n*_test.py\n")
+        
+        with patch('discovery.os.scandir', wraps=os.scandir) as mock_scandir:
+            files = list(discover_files(
+                dir_path=self.test_path,
+                enabled_extensions={".py"},
+                exclude_dirs={"node_modules", ".git"},
+                changed_within_seconds=None
+            ))
+        
+        rel_files = sorted(str(f.relative_to(self.test_path)) for f in files)
+        self.assertEqual(rel_files, ["src/main.py"])
+        scanned = [str(c.args[0]) for c in mock_scandir.call_args_list]
+        self.assertFalse(any("generated" in p for p in scanned))
+    
+    def test_parallel_walk_matches_serial_walk(self):
+        """Test the threaded walk finds the same files with the same scandir calls"""
+        import os
+        import threading
+        for i in range(_PARALLEL_MIN_ENTRIES + 4):
+            sub = self.test_path / f"pkg{i}" / "inner"
+            sub.mkdir(parents=True)
+            (sub / f"mod{i}.py").touch()
+        
+        real_scandir = os.scandir
+        lock = threading.Lock()
+        calls = []
+        
+        def counting_scandir(path):
+            with lock:
+                calls.append(str(path))
+            return real_scandir(path)
+        
+        args = (str(self.test_path), ("node_modules", ".git"), (".py",))
+        with patch('discovery.os.scandir', side_effect=counting_scandir):
+            serial = sorted(_scandir_recursive(*args))
+            serial_calls = sorted(calls)
+            calls.clear()
+            parallel = sorted(_scandir_parallel(*args))
+            parallel_calls = sorted(calls)
+        
+        self.assertEqual(len(serial), _PARALLEL_MIN_ENTRIES + 5)
+        self.assertEqual(parallel, serial)
+        self.assertEqual(parallel_calls, serial_calls)
+    
     def test_changed_scan_with_mtime(self):
         """Test changed scan with Python mtime fallback"""
         import time
@@ -265,12 +390,12 @@ class TestDiscoverFiles(unittest.TestCase):
         
         # Mock fd and find not available
         with patch('shutil.which', return_value=None):
-            files = discover_files(
+            files = list(discover_files(
                 dir_path=self.test_path,
                 enabled_extensions={".py"},
                 exclude_dirs={"node_modules"},
                 changed_within_seconds=5  # Only files changed in last 5 seconds
-            )
+            ))
         
         rel_files = sorted(str(f.relative_to(self.test_path)) for f in files)
         
@@ -280,39 +405,68 @@ class TestDiscoverFiles(unittest.TestCase):
         # Old files should not be included
         self.assertNotIn("src/main.py", rel_files)
     
-    @patch('subprocess.run')
+    def test_fast_mtime_skips_old_subtree(self):
+        """Test fast_mtime prunes directories with old mtimes (known caveat: in-place edits are missed)"""
+        import os
+        import time
+        # New file inside a directory whose own mtime is old
+        new_file = self.test_path / "src" / "edited.py"
+        new_file.touch()
+        old_time = time.time() - 3600
+        os.utime(self.test_path / "src", (old_time, old_time))
+        
+        with patch('shutil.which', return_value=None):
+            default_files = list(discover_files(
+                dir_path=self.test_path,
+                enabled_extensions={".py"},
+                exclude_dirs=set(),
+                changed_within_seconds=5
+            ))
+            fast_files = list(discover_files(
+                dir_path=self.test_path,
+                enabled_extensions={".py"},
+                exclude_dirs=set(),
+                changed_within_seconds=5,
+                fast_mtime=True
+            ))
+        
+        self.assertIn(new_file, default_files)
+        self.assertNotIn(new_file, fast_files)
+    
+    @patch('subprocess.Popen')
     @patch('shutil.which')
-    def test_changed_scan_with_fd(self, mock_which, mock_run):
+    def test_changed_scan_with_fd(self, mock_which, mock_popen):
         """Test changed scan using fd command"""
         # Mock fd is available
         mock_which.side_effect = lambda cmd: '/usr/bin/fd' if cmd == 'fd' else None
         
-        # Mock fd output
-        mock_result = MagicMock()
-        mock_result.returncode = 0
-        mock_result.stdout = f"{self.test_path}/src/main.py\n{self.test_path}/src/utils.js"
-        mock_run.return_value = mock_result
+        # Mock fd output (NUL-separated)
+        mock_popen.return_value.stdout = io.BytesIO(
+            f"{self.test_path}/src/main.py\0{self.test_path}/src/utils.js\0{self.test_path}/src/.py\0".encode()
+        )
+        mock_popen.return_value.wait.return_value = 0
         
-        files = discover_files(
+        files = list(discover_files(
             dir_path=self.test_path,
             enabled_extensions={".py", ".js"},
             exclude_dirs={"node_modules"},
             changed_within_seconds=3600
-        )
+        ))
         
-        # Should return files from fd output
+        # Should return files from fd output (not the suffix-only dotfile)
         self.assertEqual(len(files), 2)
         
         # Check fd was called with correct arguments
-        mock_run.assert_called_once()
-        call_args = mock_run.call_args[0][0]
+        mock_popen.assert_called_once()
+        call_args = mock_popen.call_args[0][0]
         self.assertEqual(call_args[0], 'fd')
         self.assertIn('--changed-within', call_args)
         self.assertIn('3600s', call_args)
+        self.assertIn('-0', call_args)
     
-    @patch('subprocess.run')
+    @patch('subprocess.Popen')
     @patch('shutil.which')
-    def test_changed_scan_with_find(self, mock_which, mock_run):
+    def test_changed_scan_with_find(self, mock_which, mock_popen):
         """Test changed scan using find command with timestamp file"""
         # Mock only find is available
         mock_which.side_effect = lambda cmd: '/usr/bin/find' if cmd == 'find' else None
@@ -321,52 +475,51 @@ class TestDiscoverFiles(unittest.TestCase):
         timestamp_file = self.test_path / "timestamp"
         timestamp_file.touch()
         
-        # Mock find output
-        mock_result = MagicMock()
-        mock_result.returncode = 0
-        mock_result.stdout = f"{self.test_path}/src/main.py"
-        mock_run.return_value = mock_result
+        # Mock find output (NUL-separated)
+        mock_popen.return_value.stdout = io.BytesIO(f"{self.test_path}/src/main.py\0".encode())
+        mock_popen.return_value.wait.return_value = 0
         
-        files = discover_files(
+        files = list(discover_files(
             dir_path=self.test_path,
             enabled_extensions={".py"},
             exclude_dirs={"node_modules"},
             changed_within_seconds=3600,
             since_timestamp_file=timestamp_file
-        )
+        ))
         
         # Should return files from find output
         self.assertEqual(len(files), 1)
         
         # Check find was called with -newer
-        mock_run.assert_called_once()
-        call_args = mock_run.call_args[0][0]
+        mock_popen.assert_called_once()
+        call_args = mock_popen.call_args[0][0]
         self.assertEqual(call_args[0], 'find')
         self.assertIn('-newer', call_args)
         self.assertIn(str(timestamp_file), call_args)
+        self.assertIn('-print0', call_args)
     
     def test_empty_directory(self):
         """Test with empty directory"""
         empty_dir = self.test_path / "empty"
         empty_dir.mkdir()
         
-        files = discover_files(
+        files = list(discover_files(
             dir_path=empty_dir,
             enabled_extensions={".py"},
             exclude_dirs=set(),
             changed_within_seconds=None
-        )
+        ))
         
         self.assertEqual(len(files), 0)
     
     def test_nonexistent_directory(self):
         """Test with non-existent directory"""
-        files = discover_files(
+        files = list(discover_files(
             dir_path=Path("/nonexistent/directory"),
             enabled_extensions={".py"},
             exclude_dirs=set(),
             changed_within_seconds=None
-        )
+        ))
         
         # Should return empty list without error
         self.assertEqual(len(files), 0)
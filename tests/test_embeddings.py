@@ -14,7 +14,9 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 
 import embeddings
-from embeddings import EmbeddingGenerator, _model_cache
+from embeddings import (
+    EmbeddingGenerator, _LFUCache, _model_cache, _openai_client_cache
+)
 
 
 class TestEmbeddingGenerator(unittest.TestCase):
@@ -25,6 +27,7 @@ class TestEmbeddingGenerator(unittest.TestCase):
         # Clear model cache before each test
         global _model_cache
         _model_cache.clear()
+        _openai_client_cache.clear()
         
         self.config = {
             "embedding_model": "local",
@@ -46,7 +49,7 @@ class TestEmbeddingGenerator(unittest.TestCase):
         self.assertEqual(generator.embedding_dimension, 384)
         
         # Should load model
-        mock_st.assert_called_once_with("all-MiniLM-L6-v2")
+        mock_st.assert_called_once_with("all-MiniLM-L6-v2", device="cpu")
     
     @patch('sentence_transformers.SentenceTransformer')
     def test_model_caching(self, mock_st):
@@ -62,11 +65,39 @@ class TestEmbeddingGenerator(unittest.TestCase):
         generator2 = EmbeddingGenerator(self.config)
         
         # Should only load model once due to caching
-        mock_st.assert_called_once_with("all-MiniLM-L6-v2")
+        mock_st.assert_called_once_with("all-MiniLM-L6-v2", device="cpu")
         
         # Both should use same model instance
         self.assertEqual(generator1.local_model, generator2.local_model)
     
+    @patch('sentence_transformers.SentenceTransformer')
+    def test_initialization_local_gpu_uses_fp16(self, mock_st):
+        """Test that the model is loaded on the GPU in half precision"""
+        mock_model = MagicMock()
+        mock_model.half.return_value.get_sentence_embedding_dimension.return_value = 384
+        mock_st.return_value = mock_model
+        
+        with patch('embeddings._detect_device', return_value='cuda'):
+            generator = EmbeddingGenerator(self.config)
+        
+        mock_st.assert_called_once_with("all-MiniLM-L6-v2", device="cuda")
+        mock_model.half.assert_called_once()
+        self.assertEqual(generator.local_model, mock_model.half.return_value)
+    
+    @patch('sentence_transformers.SentenceTransformer')
+    def test_model_caching_distinct_devices(self, mock_st):
+        """Test that the same model on different devices is cached separately"""
+        mock_st.side_effect = lambda *args, **kwargs: MagicMock()
+        
+        cpu_generator = EmbeddingGenerator(dict(self.config, embedding_device="cpu"))
+        gpu_generator = EmbeddingGenerator(dict(self.config, embedding_device="cuda"))
+        EmbeddingGenerator(dict(self.config, embedding_device="cuda"))
+        
+        self.assertEqual(mock_st.call_count, 2)
+        self.assertIn(("all-MiniLM-L6-v2", "cpu", "float32"), _model_cache)
+        self.assertIn(("all-MiniLM-L6-v2", "cuda", "float16"), _model_cache)
+        self.assertIsNot(cpu_generator.local_model, gpu_generator.local_model)
+    
     def test_initialization_openai(self):
         """Test OpenAI model initialization"""
         config = {
@@ -89,6 +120,23 @@ class TestEmbeddingGenerator(unittest.TestCase):
             self.assertEqual(generator.openai_client, mock_client)
             self.assertEqual(generator.embedding_model, "text-embedding-3-small")
     
+    def test_openai_client_reused(self):
+        """Test OpenAI clients are shared per (api_key, base_url)"""
+        config = {
+            "embedding_model": "openai",
+            "openai_api_key": "test-key"
+        }
+        
+        with patch('openai.OpenAI') as mock_openai_class:
+            mock_openai_class.side_effect = lambda **kwargs: MagicMock()
+            generator1 = EmbeddingGenerator(config)
+            generator2 = EmbeddingGenerator(config)
+            generator3 = EmbeddingGenerator({**config, "openai_api_key": "other-key"})
+        
+        self.assertIs(generator1.openai_client, generator2.openai_client)
+        self.assertIsNot(generator1.openai_client, generator3.openai_client)
+        self.assertEqual(mock_openai_class.call_count, 2)
+    
     @patch('sentence_transformers.SentenceTransformer')
     def test_openai_fallback_no_key(self, mock_st):
         """Test fallback to local when OpenAI key missing"""
@@ -170,6 +218,31 @@ class TestEmbeddingGenerator(unittest.TestCase):
                 self.assertEqual(dimension, expected_dim, f"Failed for model {model_name}")
 
 
+class TestLFUCache(unittest.TestCase):
+    """Test the embedding LFU cache"""
+    
+    def test_evicts_least_frequently_used(self):
+        cache = _LFUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)  # a: 2 uses, b: 1
+        cache.put("c", 3)
+        
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+    
+    def test_ties_evict_oldest(self):
+        cache = _LFUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.put("c", 3)
+        
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+
+
 class TestEmbeddingGeneratorAsync(unittest.TestCase):
     """Test async methods of EmbeddingGenerator"""
     
@@ -177,6 +250,7 @@ class TestEmbeddingGeneratorAsync(unittest.TestCase):
         """Set up test fixtures"""
         global _model_cache
         _model_cache.clear()
+        _openai_client_cache.clear()
         
         self.config = {
             "embedding_model": "local",
@@ -198,8 +272,9 @@ class TestEmbeddingGeneratorAsync(unittest.TestCase):
                 # Should call encode
                 mock_model.encode.assert_called_once_with("test text", convert_to_numpy=True, show_progress_bar=False)
                 
-                # Should return list
-                self.assertEqual(embedding, [0.1, 0.2, 0.3])
+                # Should return a float32 array
+                self.assertEqual(embedding.dtype, np.float32)
+                np.testing.assert_array_equal(embedding, np.array([0.1, 0.2, 0.3], dtype=np.float32))
         
         asyncio.run(run_test())
     
@@ -239,7 +314,7 @@ class TestEmbeddingGeneratorAsync(unittest.TestCase):
                     self.assertEqual(call_args[1]['input'], "test text")
                     
                     # Should return embedding
-                    self.assertEqual(embedding, [0.4, 0.5, 0.6])
+                    np.testing.assert_array_equal(embedding, np.array([0.4, 0.5, 0.6], dtype=np.float32))
         
         asyncio.run(run_test())
     
@@ -272,7 +347,31 @@ class TestEmbeddingGeneratorAsync(unittest.TestCase):
                 
                 # Should fall back to local
                 mock_model.encode.assert_called_once()
-                self.assertEqual(embedding, [0.7, 0.8, 0.9])
+                np.testing.assert_array_equal(embedding, np.array([0.7, 0.8, 0.9], dtype=np.float32))
+        
+        asyncio.run(run_test())
+    
+    def test_openai_happy_path_does_not_load_local(self):
+        """Test OpenAI embeddings never load the local fallback model"""
+        async def run_test():
+            config = {
+                "embedding_model": "openai",
+                "openai_api_key": "test-key"
+            }
+            
+            with patch('sentence_transformers.SentenceTransformer') as mock_st, \
+                 patch('openai.OpenAI') as mock_openai_class:
+                mock_client = mock_openai_class.return_value
+                mock_response = MagicMock()
+                mock_response.data = [MagicMock(embedding=[0.4, 0.5, 0.6])]
+                mock_client.embeddings.create.return_value = mock_response
+                
+                generator = EmbeddingGenerator(config)
+                embedding = await generator.generate("test text")
+                
+                mock_st.assert_not_called()
+                self.assertIsNone(generator._local_model)
+                np.testing.assert_array_equal(embedding, np.array([0.4, 0.5, 0.6], dtype=np.float32))
         
         asyncio.run(run_test())
     
@@ -294,12 +393,75 @@ class TestEmbeddingGeneratorAsync(unittest.TestCase):
                 
                 # Should call encode with all texts
                 mock_model.encode.assert_called_once()
+                self.assertEqual(mock_model.encode.call_args[0][0], ["text1", "text2", "text3"])
+                self.assertIn('batch_size', mock_model.encode.call_args[1])
                 
-                # Should return list of lists
-                self.assertEqual(len(embeddings), 3)
-                self.assertEqual(embeddings[0], [0.1, 0.2, 0.3])
-                self.assertEqual(embeddings[1], [0.4, 0.5, 0.6])
-                self.assertEqual(embeddings[2], [0.7, 0.8, 0.9])
+                # Should return an (n, dim) array
+                self.assertEqual(embeddings.shape, (3, 3))
+                np.testing.assert_array_equal(embeddings, np.array([
+                    [0.1, 0.2, 0.3],
+                    [0.4, 0.5, 0.6],
+                    [0.7, 0.8, 0.9]
+                ], dtype=np.float32))
+        
+        asyncio.run(run_test())
+    
+    def test_batch_generate_uses_cache(self):
+        """Test repeated chunks are embedded once and served from the cache afterwards"""
+        async def run_test():
+            with patch('sentence_transformers.SentenceTransformer') as mock_st:
+                mock_model = MagicMock()
+                mock_model.get_sentence_embedding_dimension.return_value = 384
+                mock_model.encode.side_effect = lambda texts, **kwargs: np.array(
+                    [[float(len(t)), 1.0] for t in texts]
+                )
+                mock_st.return_value = mock_model
+                
+                generator = EmbeddingGenerator(self.config)
+                first = await generator.batch_generate(["# License", "a", "# License\n"])
+                # Duplicates (after trimming whitespace) are embedded once
+                self.assertEqual(mock_model.encode.call_args[0][0], ["# License", "a"])
+                np.testing.assert_array_equal(first[0], first[2])
+                
+                second = await generator.batch_generate(["a", "b"])
+                self.assertEqual(mock_model.encode.call_count, 2)
+                self.assertEqual(mock_model.encode.call_args[0][0], ["b"])
+                self.assertEqual(second.dtype, np.float32)
+                np.testing.assert_array_equal(second, np.array([[1.0, 1.0], [1.0, 1.0]], dtype=np.float32))
+        
+        asyncio.run(run_test())
+    
+    def test_batch_generate_cache_hit_matches_miss(self):
+        """Test a cache hit returns exactly the embedding the miss returned"""
+        async def run_test():
+            with patch('sentence_transformers.SentenceTransformer') as mock_st:
+                mock_model = MagicMock()
+                mock_model.get_sentence_embedding_dimension.return_value = 384
+                # Values float16 cannot represent exactly
+                mock_model.encode.return_value = np.array([[0.1, 0.2, 1e-5]], dtype=np.float32)
+                mock_st.return_value = mock_model
+                
+                generator = EmbeddingGenerator(self.config)
+                miss = await generator.batch_generate(["text"])
+                hit = await generator.batch_generate(["text"])
+                mock_model.encode.assert_called_once()
+                np.testing.assert_array_equal(hit, miss)
+        
+        asyncio.run(run_test())
+    
+    def test_batch_generate_cache_disabled(self):
+        """Test embedding_cache_size=0 always calls the model"""
+        async def run_test():
+            with patch('sentence_transformers.SentenceTransformer') as mock_st:
+                mock_model = MagicMock()
+                mock_model.get_sentence_embedding_dimension.return_value = 384
+                mock_model.encode.return_value = np.array([[0.1, 0.2]])
+                mock_st.return_value = mock_model
+                
+                generator = EmbeddingGenerator({**self.config, "embedding_cache_size": 0})
+                await generator.batch_generate(["text"])
+                await generator.batch_generate(["text"])
+                self.assertEqual(mock_model.encode.call_count, 2)
         
         asyncio.run(run_test())
     
@@ -343,10 +505,11 @@ class TestEmbeddingGeneratorAsync(unittest.TestCase):
                     self.assertEqual(call_args[1]['input'], ["text1", "text2", "text3"])
                     
                     # Should return embeddings
-                    self.assertEqual(len(embeddings_result), 3)
-                    self.assertEqual(embeddings_result[0], [0.1, 0.2])
-                    self.assertEqual(embeddings_result[1], [0.3, 0.4])
-                    self.assertEqual(embeddings_result[2], [0.5, 0.6])
+                    self.assertEqual(embeddings_result.shape, (3, 2))
+                    np.testing.assert_array_equal(
+                        embeddings_result,
+                        np.array([[0.1, 0.2], [0.3, 0.4], [0.5, 0.6]], dtype=np.float32)
+                    )
         
         asyncio.run(run_test())
     
@@ -379,7 +542,42 @@ class TestEmbeddingGeneratorAsync(unittest.TestCase):
                 
                 # Should fall back to local batch
                 mock_model.encode.assert_called_once()
-                self.assertEqual(embeddings, [[0.1, 0.2], [0.3, 0.4]])
+                np.testing.assert_array_equal(embeddings, np.array([[0.1, 0.2], [0.3, 0.4]], dtype=np.float32))
+        
+        asyncio.run(run_test())
+
+    
+    def test_batch_generate_openai_fallback_not_cached(self):
+        """Test local fallback rows are neither cached nor mixed with cached OpenAI rows"""
+        async def run_test():
+            config = {
+                "embedding_model": "openai",
+                "openai_api_key": "test-key"
+            }
+            
+            mock_model = MagicMock()
+            mock_model.get_sentence_embedding_dimension.return_value = 2
+            mock_model.encode.side_effect = lambda texts, **kwargs: np.full((len(texts), 2), 0.5)
+            
+            with patch('sentence_transformers.SentenceTransformer', return_value=mock_model):
+                generator = EmbeddingGenerator(config)
+                generator.model_type = 'openai'
+                generator.local_model = mock_model
+                
+                ok = MagicMock()
+                ok.data = [MagicMock(embedding=[0.1, 0.2, 0.3])]
+                mock_client = MagicMock()
+                mock_client.embeddings.create.side_effect = [ok, Exception("Outage"), Exception("Outage")]
+                generator.openai_client = mock_client
+                
+                await generator.batch_generate(["a"])  # cached OpenAI row
+                outage = await generator.batch_generate(["b"])  # local fallback, not cached
+                mixed = await generator.batch_generate(["a", "b"])
+                
+                self.assertEqual(outage.shape, (1, 2))
+                # "a" is cached but "b" falls back again, so the whole batch is local
+                self.assertEqual(mixed.shape, (2, 2))
+                self.assertEqual(mock_client.embeddings.create.call_count, 3)
         
         asyncio.run(run_test())
 
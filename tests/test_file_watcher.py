@@ -3,15 +3,46 @@
 Unit tests for FileChangeHandler (file watcher) class
 """
 
+import asyncio
+import os
 import tempfile
+import threading
 from pathlib import Path
-from unittest.mock import MagicMock, patch, Mock
+from unittest.mock import AsyncMock, MagicMock, call, patch, Mock
 import unittest
 
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 
-from indexer import FileChangeHandler, FileIndexer
+from watchdog.events import (
+    DirCreatedEvent, DirDeletedEvent, DirMovedEvent, FileClosedNoWriteEvent, FileModifiedEvent,
+)
+
+from indexer import FileChangeHandler, FileIndexer, ROOT_WATCHED_EVENT_TYPES, WATCHED_EVENT_TYPES
+
+
+class FakeTimer:
+    """threading.Timer stand-in that only fires when the test says so"""
+    
+    instances = []
+    
+    def __init__(self, interval, function, args=()):
+        self.interval = interval
+        self.function = function
+        self.args = args
+        self.cancelled = False
+        self.daemon = False
+        FakeTimer.instances.append(self)
+    
+    def start(self):
+        pass
+    
+    def cancel(self):
+        self.cancelled = True
+    
+    def fire(self):
+        if not self.cancelled:
+            self.function(*self.args)
 
 
 class TestFileChangeHandler(unittest.TestCase):
@@ -36,7 +67,8 @@ class TestFileChangeHandler(unittest.TestCase):
         self.mock_indexer._is_excluded = MagicMock(return_value=False)
         
         # Create handler
-        self.handler = FileChangeHandler(self.mock_indexer)
+        FakeTimer.instances = []
+        self.handler = FileChangeHandler(self.mock_indexer, timer_factory=FakeTimer)
     
     def test_initialization(self):
         """Test FileChangeHandler initialization"""
@@ -53,11 +85,25 @@ class TestFileChangeHandler(unittest.TestCase):
             self.handler.on_modified(mock_event)
             
             # Should log the modification
-            mock_logger.info.assert_called_once()
-            log_message = mock_logger.info.call_args[0][0]
+            mock_logger.debug.assert_called_once()
+            log_message = mock_logger.debug.call_args[0][0]
             self.assertIn("File modified", log_message)
             self.assertIn("main.py", log_message)
     
+    def test_exclude_check_cached_per_path(self):
+        """Test repeated events on a path reuse its exclude decision, within the cache bound"""
+        self.handler.EXCLUDE_CACHE_SIZE = 2
+        
+        for _ in range(3):
+            self.assertTrue(self.handler._wanted("/test/project/main.py"))
+        self.mock_indexer._is_excluded.assert_called_once_with(Path("/test/project/main.py"))
+        
+        self.handler._wanted("/test/project/a.py")
+        self.handler._wanted("/test/project/b.py")
+        # main.py was the oldest entry and has been dropped
+        self.assertNotIn("/test/project/main.py", self.handler._excluded_cache)
+        self.assertEqual(len(self.handler._excluded_cache), 2)
+    
     def test_on_modified_unsupported_file(self):
         """Test handling modification of unsupported file"""
         # Create mock event for unsupported file
@@ -69,7 +115,7 @@ class TestFileChangeHandler(unittest.TestCase):
             self.handler.on_modified(mock_event)
             
             # Should not log anything for unsupported files
-            mock_logger.info.assert_not_called()
+            mock_logger.debug.assert_not_called()
     
     def test_on_modified_directory(self):
         """Test handling modification of directory"""
@@ -82,7 +128,7 @@ class TestFileChangeHandler(unittest.TestCase):
             self.handler.on_modified(mock_event)
             
             # Should not process directories
-            mock_logger.info.assert_not_called()
+            mock_logger.debug.assert_not_called()
     
     def test_on_created_supported_file(self):
         """Test handling creation of supported file"""
@@ -95,8 +141,8 @@ class TestFileChangeHandler(unittest.TestCase):
             self.handler.on_created(mock_event)
             
             # Should log the creation
-            mock_logger.info.assert_called_once()
-            log_message = mock_logger.info.call_args[0][0]
+            mock_logger.debug.assert_called_once()
+            log_message = mock_logger.debug.call_args[0][0]
             self.assertIn("File created", log_message)
             self.assertIn("app.js", log_message)
     
@@ -111,7 +157,7 @@ class TestFileChangeHandler(unittest.TestCase):
             self.handler.on_created(mock_event)
             
             # Should not log anything for unsupported files
-            mock_logger.info.assert_not_called()
+            mock_logger.debug.assert_not_called()
     
     def test_on_created_directory(self):
         """Test handling creation of directory"""
@@ -124,7 +170,7 @@ class TestFileChangeHandler(unittest.TestCase):
             self.handler.on_created(mock_event)
             
             # Should not process directories
-            mock_logger.info.assert_not_called()
+            mock_logger.debug.assert_not_called()
     
     def test_on_deleted_file(self):
         """Test handling deletion of file"""
@@ -137,8 +183,8 @@ class TestFileChangeHandler(unittest.TestCase):
             self.handler.on_deleted(mock_event)
             
             # Should log the deletion
-            mock_logger.info.assert_called_once()
-            log_message = mock_logger.info.call_args[0][0]
+            mock_logger.debug.assert_called_once()
+            log_message = mock_logger.debug.call_args[0][0]
             self.assertIn("File deleted", log_message)
             self.assertIn("old.py", log_message)
     
@@ -153,7 +199,7 @@ class TestFileChangeHandler(unittest.TestCase):
             self.handler.on_deleted(mock_event)
             
             # Should not process directories
-            mock_logger.info.assert_not_called()
+            mock_logger.debug.assert_not_called()
     
     def test_supported_extensions_check(self):
         """Test that handler correctly checks supported extensions"""
@@ -174,6 +220,8 @@ class TestFileChangeHandler(unittest.TestCase):
             ("/test/file.exe", False),
             ("/test/file.bin", False),
             ("/test/file", False),  # No extension
+            ("/test/v1.2/README", False),  # Dot in directory, not in name
+            ("/test/.config/app.json", True),
         ]
         
         for file_path, should_process in test_files:
@@ -185,9 +233,9 @@ class TestFileChangeHandler(unittest.TestCase):
                 self.handler.on_modified(mock_event)
                 
                 if should_process:
-                    mock_logger.info.assert_called_once()
+                    mock_logger.debug.assert_called_once()
                 else:
-                    mock_logger.info.assert_not_called()
+                    mock_logger.debug.assert_not_called()
     
     def test_multiple_events_handling(self):
         """Test handling multiple file events in sequence"""
@@ -207,12 +255,92 @@ class TestFileChangeHandler(unittest.TestCase):
                 handler_method(mock_event)
                 
                 # Check that appropriate message was logged
-                last_log = mock_logger.info.call_args[0][0]
+                last_log = mock_logger.debug.call_args[0][0]
                 self.assertIn(expected_message, last_log)
                 self.assertIn(Path(file_path).name, last_log)
             
             # Should have logged all 4 events
-            self.assertEqual(mock_logger.info.call_count, 4)
+            self.assertEqual(mock_logger.debug.call_count, 4)
+
+
+    def _event(self, src_path):
+        mock_event = Mock()
+        mock_event.is_directory = False
+        mock_event.src_path = src_path
+        return mock_event
+    
+    def test_first_event_flushed_immediately(self):
+        """Test the first event of a burst reaches the indexer without waiting"""
+        self.handler.on_created(self._event("/test/project/app.js"))
+        
+        self.mock_indexer.batch_update.assert_called_once_with([("/test/project/app.js", "created")])
+    
+    def test_burst_coalesced_into_one_batch(self):
+        """Test events after the first are collapsed per path and flushed once"""
+        self.handler.on_modified(self._event("/test/project/a.py"))
+        self.mock_indexer.batch_update.reset_mock()
+        
+        self.handler.on_modified(self._event("/test/project/b.py"))
+        self.handler.on_modified(self._event("/test/project/b.py"))
+        self.handler.on_modified(self._event("/test/project/c.py"))
+        self.mock_indexer.batch_update.assert_not_called()
+        
+        # Only the latest timer survives the quiet window
+        self.assertTrue(all(t.cancelled for t in FakeTimer.instances[:-1]))
+        FakeTimer.instances[-1].fire()
+        
+        self.mock_indexer.batch_update.assert_called_once_with([
+            ("/test/project/b.py", "modified"),
+            ("/test/project/c.py", "modified"),
+        ])
+    
+    def test_create_then_delete_is_noop(self):
+        """Test a file created and deleted within one window is never indexed"""
+        self.handler.on_modified(self._event("/test/project/a.py"))
+        self.mock_indexer.batch_update.reset_mock()
+        
+        self.handler.on_created(self._event("/test/project/tmp.py"))
+        self.handler.on_deleted(self._event("/test/project/tmp.py"))
+        FakeTimer.instances[-1].fire()
+        
+        self.mock_indexer.batch_update.assert_not_called()
+    
+    def test_delete_waits_for_following_create(self):
+        """Test a leading delete is held for the quiet window so a re-create joins its batch"""
+        self.handler.on_deleted(self._event("/test/project/a.py"))
+        self.mock_indexer.batch_update.assert_not_called()
+        
+        self.handler.on_created(self._event("/test/project/b.py"))
+        FakeTimer.instances[-1].fire()
+        
+        self.mock_indexer.batch_update.assert_called_once_with([
+            ("/test/project/a.py", "deleted"),
+            ("/test/project/b.py", "created"),
+        ])
+    
+    def test_on_moved_queues_both_paths(self):
+        """Test a rename becomes a delete of the old path and a create of the new one"""
+        event = Mock(is_directory=False, src_path="/test/project/old.py", dest_path="/test/project/new.py")
+        self.handler.on_moved(event)
+        FakeTimer.instances[-1].fire()
+        
+        self.mock_indexer.batch_update.assert_called_once_with([
+            ("/test/project/old.py", "deleted"),
+            ("/test/project/new.py", "created"),
+        ])
+    
+    def test_max_latency_forces_flush(self):
+        """Test a continuous burst is flushed once the max latency is exceeded"""
+        with patch('indexer.time.monotonic', side_effect=[0.0, 0.1, 0.6]):
+            self.handler.on_modified(self._event("/test/project/a.py"))
+            self.handler.on_modified(self._event("/test/project/b.py"))
+            self.handler.on_modified(self._event("/test/project/c.py"))
+        
+        self.assertEqual(self.mock_indexer.batch_update.call_count, 2)
+        self.mock_indexer.batch_update.assert_called_with([
+            ("/test/project/b.py", "modified"),
+            ("/test/project/c.py", "modified"),
+        ])
 
 
 class TestFileIndexerWatching(unittest.TestCase):
@@ -245,33 +373,332 @@ class TestFileIndexerWatching(unittest.TestCase):
         
         indexer = FileIndexer(self.config)
         
-        # Watch a directory
-        test_dir = "/test/project"
-        indexer.start_watching(test_dir)
+        with tempfile.TemporaryDirectory() as test_dir:
+            for name in (".git", "src", "docs"):
+                os.mkdir(Path(test_dir) / name)
+            (Path(test_dir) / "main.py").write_text("print('hi')")
+            
+            # Watch a directory
+            indexer.start_watching(test_dir)
         
         # Should create observer
         mock_observer_class.assert_called_once()
         
-        # Should schedule handler
-        mock_observer.schedule.assert_called_once()
-        call_args = mock_observer.schedule.call_args
+        calls = mock_observer.schedule.call_args_list
+        watched = {}
+        for call in calls:
+            handler, path = call[0]
+            # Check handler type
+            self.assertIsInstance(handler, FileChangeHandler)
+            self.assertEqual(handler.indexer, indexer)
+            watched[path] = call[1]
+        
+        # Root is watched non-recursively, non-excluded sub-directories recursively
+        self.assertEqual(set(watched), {test_dir, str(Path(test_dir) / "src"), str(Path(test_dir) / "docs")})
+        self.assertNotIn(str(Path(test_dir) / ".git"), watched)
+        self.assertFalse(watched[test_dir]['recursive'])
+        self.assertEqual(watched[test_dir]['event_filter'], list(ROOT_WATCHED_EVENT_TYPES))
+        for name in ("src", "docs"):
+            kwargs = watched[str(Path(test_dir) / name)]
+            self.assertTrue(kwargs['recursive'])
+            # Kernel-level filter for the events the handler cares about
+            self.assertEqual(kwargs['event_filter'], list(WATCHED_EVENT_TYPES))
+            # Nested directories moved out of the tree report nothing for their files
+            self.assertIn(DirDeletedEvent, kwargs['event_filter'])
+            self.assertIn(DirMovedEvent, kwargs['event_filter'])
+        self.assertIsNone(calls[0][0][0].event_types)
+        
+        # Should start observer
+        mock_observer.start.assert_called_once()
+    
+    @patch('pathlib.Path.mkdir')
+    @patch('indexer.Observer')
+    @patch('indexer.VectorDB')
+    @patch('indexer.EmbeddingGenerator')
+    def test_watch_directory_without_event_filter_support(self, mock_embedding_gen, mock_vectordb, mock_observer_class, mock_mkdir):
+        """Test fallback to a Python-side filter on watchdog versions without event_filter"""
+        mock_vectordb.return_value = self.mock_vectordb
+        mock_embedding_gen.return_value = self.mock_embedding_gen
+        
+        def schedule(handler, path, recursive=False, **kwargs):
+            if 'event_filter' in kwargs:
+                raise TypeError("unexpected keyword argument 'event_filter'")
         
-        # Check handler type
-        handler = call_args[0][0]
-        self.assertIsInstance(handler, FileChangeHandler)
-        self.assertEqual(handler.indexer, indexer)
+        mock_observer = MagicMock()
+        mock_observer.schedule.side_effect = schedule
+        mock_observer_class.return_value = mock_observer
         
-        # Check watched path
-        watched_path = call_args[0][1]
-        self.assertEqual(watched_path, test_dir)
+        indexer = FileIndexer(self.config)
+        with tempfile.TemporaryDirectory() as test_dir:
+            os.mkdir(Path(test_dir) / "src")
+            indexer.start_watching(test_dir)
         
-        # Check recursive flag
-        recursive = call_args[1].get('recursive', False)
-        self.assertTrue(recursive)
+        # One failed attempt, then plain schedules for the root and src
+        self.assertEqual(mock_observer.schedule.call_count, 3)
+        self.assertNotIn('event_filter', mock_observer.schedule.call_args_list[1][1])
+        self.assertNotIn('event_filter', mock_observer.schedule.call_args_list[2][1])
+        handler = mock_observer.schedule.call_args[0][0]
+        self.assertEqual(handler.event_types, ROOT_WATCHED_EVENT_TYPES)
         
-        # Should start observer
+        with patch.object(handler, 'on_modified') as mock_on_modified, \
+             patch.object(handler, 'on_closed_no_write') as mock_on_closed:
+            handler.dispatch(FileClosedNoWriteEvent("/test/project/main.py"))
+            handler.dispatch(FileModifiedEvent("/test/project/main.py"))
+        mock_on_closed.assert_not_called()
+        mock_on_modified.assert_called_once()
         mock_observer.start.assert_called_once()
     
+    @patch('pathlib.Path.mkdir')
+    @patch('indexer.VectorDB')
+    @patch('indexer.EmbeddingGenerator')
+    def test_batch_update_moves_renamed_file(self, mock_embedding_gen, mock_vectordb, mock_mkdir):
+        """Test a delete+create pair of the same file moves its chunks instead of re-embedding"""
+        self.mock_vectordb.delete_by_file = AsyncMock()
+        self.mock_vectordb.rename_file = AsyncMock(return_value=2)
+        mock_vectordb.return_value = self.mock_vectordb
+        mock_embedding_gen.return_value = self.mock_embedding_gen
+        
+        indexer = FileIndexer(self.config)
+        with tempfile.TemporaryDirectory() as test_dir:
+            old_path = os.path.join(test_dir, "old.py")
+            new_path = os.path.join(test_dir, "new.py")
+            with open(new_path, "w") as f:
+                f.write("x = 1\n")
+            st = os.stat(new_path)
+            indexer.file_metadata = {
+                old_path: {"hash": "abc", "mtime_ns": st.st_mtime_ns, "size": st.st_size, "ino": st.st_ino}
+            }
+            
+            with patch.object(indexer, 'index_file', new_callable=AsyncMock) as mock_index_file, \
+                 patch.object(indexer, '_save_file_metadata') as mock_save:
+                indexer.batch_update([(old_path, "deleted"), (new_path, "created")])
+        
+        self.mock_vectordb.rename_file.assert_awaited_once_with(old_path, new_path)
+        self.mock_vectordb.delete_by_file.assert_not_called()
+        mock_index_file.assert_not_called()
+        self.assertNotIn(old_path, indexer.file_metadata)
+        self.assertEqual(indexer.file_metadata[new_path]["hash"], "abc")
+        mock_save.assert_called_once()
+    
+    @patch('pathlib.Path.mkdir')
+    @patch('indexer.Observer')
+    @patch('indexer.VectorDB')
+    @patch('indexer.EmbeddingGenerator')
+    def test_new_top_level_directory_is_watched(self, mock_embedding_gen, mock_vectordb, mock_observer_class, mock_mkdir):
+        """Test a directory created under the root gets its own watch and its files are picked up"""
+        mock_vectordb.return_value = self.mock_vectordb
+        mock_embedding_gen.return_value = self.mock_embedding_gen
+        mock_observer = MagicMock()
+        mock_observer_class.return_value = mock_observer
+        
+        indexer = FileIndexer(self.config)
+        with tempfile.TemporaryDirectory() as test_dir:
+            indexer.start_watching(test_dir)
+            handler = indexer._event_handler
+            mock_observer.schedule.reset_mock()
+            
+            new_dir = Path(test_dir) / "lib"
+            os.mkdir(new_dir)
+            (new_dir / "util.py").write_text("x = 1")
+            os.mkdir(Path(test_dir) / ".git")
+            
+            with patch.object(handler, '_enqueue') as mock_enqueue:
+                handler.dispatch(DirCreatedEvent(str(new_dir)))
+                handler.dispatch(DirCreatedEvent(str(Path(test_dir) / ".git")))
+            
+            mock_observer.schedule.assert_called_once()
+            self.assertEqual(mock_observer.schedule.call_args[0][1], str(new_dir))
+            mock_enqueue.assert_called_once_with(str(new_dir / "util.py"), 'created')
+    
+    @patch('pathlib.Path.mkdir')
+    @patch('indexer.Observer')
+    @patch('indexer.VectorDB')
+    @patch('indexer.EmbeddingGenerator')
+    def test_renamed_top_level_directory_is_rewatched(self, mock_embedding_gen, mock_vectordb, mock_observer_class, mock_mkdir):
+        """Test renaming a directory under the root moves its watch and its indexed files"""
+        mock_vectordb.return_value = self.mock_vectordb
+        mock_embedding_gen.return_value = self.mock_embedding_gen
+        mock_observer = MagicMock()
+        mock_observer.schedule.side_effect = lambda handler, path, **kwargs: ("watch", path)
+        mock_observer_class.return_value = mock_observer
+        
+        indexer = FileIndexer(self.config)
+        with tempfile.TemporaryDirectory() as test_dir:
+            old_dir = Path(test_dir) / "a"
+            new_dir = Path(test_dir) / "b"
+            os.mkdir(old_dir)
+            (old_dir / "util.py").write_text("x = 1")
+            indexer.file_metadata = {str(old_dir / "util.py"): {"hash": "abc"}}
+            indexer.start_watching(test_dir)
+            handler = indexer._event_handler
+            mock_observer.schedule.reset_mock()
+            
+            os.rename(old_dir, new_dir)
+            with patch.object(handler, '_enqueue') as mock_enqueue:
+                handler.dispatch(DirMovedEvent(str(old_dir), str(new_dir)))
+            
+            # The stale watch (still reporting old paths) is dropped, the new path watched
+            mock_observer.unschedule.assert_called_once_with(("watch", str(old_dir)))
+            mock_observer.schedule.assert_called_once()
+            self.assertEqual(mock_observer.schedule.call_args[0][1], str(new_dir))
+            self.assertEqual(set(indexer._subdir_watches), {str(new_dir)})
+            # Deleted + created of the same file in one batch is applied as a rename
+            self.assertEqual(mock_enqueue.call_args_list, [
+                call(str(old_dir / "util.py"), 'deleted'),
+                call(str(new_dir / "util.py"), 'created'),
+            ])
+    
+    @patch('pathlib.Path.mkdir')
+    @patch('indexer.Observer')
+    @patch('indexer.VectorDB')
+    @patch('indexer.EmbeddingGenerator')
+    def test_deleted_top_level_directory_is_unwatched(self, mock_embedding_gen, mock_vectordb, mock_observer_class, mock_mkdir):
+        """Test deleting a directory under the root drops its watch and its indexed files"""
+        mock_vectordb.return_value = self.mock_vectordb
+        mock_embedding_gen.return_value = self.mock_embedding_gen
+        mock_observer = MagicMock()
+        mock_observer.schedule.side_effect = lambda handler, path, **kwargs: ("watch", path)
+        mock_observer_class.return_value = mock_observer
+        
+        indexer = FileIndexer(self.config)
+        with tempfile.TemporaryDirectory() as test_dir:
+            old_dir = Path(test_dir) / "a"
+            os.mkdir(old_dir)
+            indexer.file_metadata = {
+                str(old_dir / "util.py"): {"hash": "abc"},
+                str(Path(test_dir) / "ab.py"): {"hash": "def"},
+            }
+            indexer.start_watching(test_dir)
+            handler = indexer._event_handler
+            
+            os.rmdir(old_dir)
+            with patch.object(handler, '_enqueue') as mock_enqueue:
+                handler.dispatch(DirDeletedEvent(str(old_dir)))
+            
+            mock_observer.unschedule.assert_called_once_with(("watch", str(old_dir)))
+            self.assertEqual(indexer._subdir_watches, {})
+            mock_enqueue.assert_called_once_with(str(old_dir / "util.py"), 'deleted')
+    
+    @patch('pathlib.Path.mkdir')
+    @patch('indexer.Observer')
+    @patch('indexer.VectorDB')
+    @patch('indexer.EmbeddingGenerator')
+    def test_nested_directory_moved_out_drops_its_files(self, mock_embedding_gen, mock_vectordb, mock_observer_class, mock_mkdir):
+        """Test moving a nested directory out of the tree removes its indexed files"""
+        mock_vectordb.return_value = self.mock_vectordb
+        mock_embedding_gen.return_value = self.mock_embedding_gen
+        mock_observer = MagicMock()
+        mock_observer.schedule.side_effect = lambda handler, path, **kwargs: ("watch", path)
+        mock_observer_class.return_value = mock_observer
+        
+        indexer = FileIndexer(self.config)
+        with tempfile.TemporaryDirectory() as test_dir, tempfile.TemporaryDirectory() as outside:
+            nested = Path(test_dir) / "src" / "pkg"
+            os.makedirs(nested)
+            indexer.file_metadata = {
+                str(nested / "a.py"): {"hash": "abc"},
+                str(nested / "sub" / "b.py"): {"hash": "def"},
+                str(Path(test_dir) / "src" / "pkg2.py"): {"hash": "ghi"},
+            }
+            indexer.start_watching(test_dir)
+            handler = indexer._event_handler
+            mock_observer.schedule.reset_mock()
+            
+            moved = Path(outside) / "pkg"
+            os.rename(nested, moved)
+            with patch.object(handler, '_enqueue') as mock_enqueue:
+                handler.dispatch(DirMovedEvent(str(nested), str(moved)))
+            
+            # Covered by the recursive watch of src: nothing to (un)schedule
+            mock_observer.unschedule.assert_not_called()
+            mock_observer.schedule.assert_not_called()
+            self.assertEqual(sorted(mock_enqueue.call_args_list), [
+                call(str(nested / "a.py"), 'deleted'),
+                call(str(nested / "sub" / "b.py"), 'deleted'),
+            ])
+    
+    @patch('pathlib.Path.mkdir')
+    @patch('indexer.VectorDB')
+    @patch('indexer.EmbeddingGenerator')
+    def test_batch_update_applies_events(self, mock_embedding_gen, mock_vectordb, mock_mkdir):
+        """Test batch_update reindexes changed files and drops deleted ones"""
+        self.mock_vectordb.delete_by_file = AsyncMock()
+        mock_vectordb.return_value = self.mock_vectordb
+        mock_embedding_gen.return_value = self.mock_embedding_gen
+        
+        indexer = FileIndexer(self.config)
+        indexer.file_metadata = {"/test/project/old.py": {"hash": "abc"}}
+        
+        with patch.object(indexer, 'index_file', new_callable=AsyncMock) as mock_index_file, \
+             patch.object(indexer, '_save_file_metadata') as mock_save:
+            indexer.batch_update([
+                ("/test/project/old.py", "deleted"),
+                ("/test/project/new.py", "created"),
+                ("/test/project/never_indexed.py", "deleted"),
+            ])
+        
+        self.mock_vectordb.delete_by_file.assert_awaited_once_with("/test/project/old.py")
+        mock_index_file.assert_awaited_once_with("/test/project/new.py")
+        self.assertNotIn("/test/project/old.py", indexer.file_metadata)
+        mock_save.assert_called_once()
+    
+    def _recording_indexer(self, calls):
+        """FileIndexer whose reindex yields between deleting old chunks and adding new ones"""
+        async def index_file(path):
+            calls.append(("delete", path))
+            await asyncio.sleep(0.01)
+            calls.append(("add", path))
+            return True
+        
+        indexer = FileIndexer(self.config)
+        indexer.file_metadata = {"/test/project/a.py": {"hash": "abc"}}
+        indexer.index_file = index_file
+        indexer._save_file_metadata = MagicMock()
+        return indexer
+    
+    @patch('pathlib.Path.mkdir')
+    @patch('indexer.VectorDB')
+    @patch('indexer.EmbeddingGenerator')
+    def test_batches_on_loop_do_not_interleave(self, mock_embedding_gen, mock_vectordb, mock_mkdir):
+        """Test two batches submitted to the server's loop apply one after the other"""
+        mock_vectordb.return_value = self.mock_vectordb
+        mock_embedding_gen.return_value = self.mock_embedding_gen
+        calls = []
+        indexer = self._recording_indexer(calls)
+        batch = [("/test/project/a.py", "modified")]
+        
+        async def run():
+            indexer._loop = asyncio.get_running_loop()
+            # batch_update is called from the watchdog thread
+            await asyncio.gather(
+                asyncio.to_thread(indexer.batch_update, batch),
+                asyncio.to_thread(indexer.batch_update, batch),
+            )
+            while len(calls) < 4:
+                await asyncio.sleep(0.01)
+        
+        asyncio.run(run())
+        self.assertEqual([c[0] for c in calls], ["delete", "add", "delete", "add"])
+    
+    @patch('pathlib.Path.mkdir')
+    @patch('indexer.VectorDB')
+    @patch('indexer.EmbeddingGenerator')
+    def test_batches_without_loop_do_not_interleave(self, mock_embedding_gen, mock_vectordb, mock_mkdir):
+        """Test concurrent Timer-thread batches (no server loop) apply one after the other"""
+        mock_vectordb.return_value = self.mock_vectordb
+        mock_embedding_gen.return_value = self.mock_embedding_gen
+        calls = []
+        indexer = self._recording_indexer(calls)
+        batch = [("/test/project/a.py", "modified")]
+        
+        threads = [threading.Thread(target=indexer.batch_update, args=(batch,)) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        self.assertEqual([c[0] for c in calls], ["delete", "add", "delete", "add"])
+    
     @patch('pathlib.Path.mkdir')
     @patch('indexer.Observer')
     @patch('indexer.VectorDB')
@@ -5,14 +5,19 @@ Unit tests for FileIndexer and FileChunk classes
 
 import asyncio
 import json
+import os
+import subprocess
 import tempfile
 from pathlib import Path
 from unittest.mock import MagicMock, patch, mock_open
 import unittest
 
+import numpy as np
+
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 
+from chunking import HASH_ALG, _chunk_bounds, _digest, _MMAP_MIN_SIZE, _prepare_file
 from indexer import FileIndexer, FileChunk
 
 
@@ -134,6 +139,60 @@ class TestFileIndexer(unittest.TestCase):
             # Should index if forced
             self.assertTrue(self.indexer._should_index_file("/test/existing.py", force=True))
     
+    def test_hash_algorithm_switch_is_not_a_change(self):
+        """Test entries hashed with another (available) algorithm are compared with it and migrated"""
+        import hashlib
+        with tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.py') as f:
+            f.write(b"print('hi')\n")
+            temp_path = f.name
+        
+        try:
+            md5 = hashlib.md5(b"print('hi')\n").hexdigest()
+            # Written before hash_alg was recorded (MD5); now running with blake3 installed
+            self.indexer.file_metadata[temp_path] = {"hash": md5}
+            hashes = {'md5': md5, 'blake3': 'b3_hash'}
+            with patch('indexer.HASH_ALG', 'blake3'), \
+                 patch.object(self.indexer, '_get_file_hash', side_effect=lambda path, alg='blake3': hashes[alg]):
+                self.assertFalse(self.indexer._should_index_file(temp_path))
+                entry = self.indexer.file_metadata[temp_path]
+                self.assertEqual((entry["hash"], entry["hash_alg"]), ('b3_hash', 'blake3'))
+                
+                # Content changed: the old algorithm no longer matches either
+                hashes['md5'] = 'other'
+                self.indexer.file_metadata[temp_path] = {"hash": md5, "hash_alg": "md5"}
+                self.assertTrue(self.indexer._should_index_file(temp_path))
+            
+            # Stored with blake3 but it is not installed: cannot compare, reindex
+            self.indexer.file_metadata[temp_path] = {"hash": "b3_hash", "hash_alg": "blake3"}
+            with patch('indexer._hash_available', return_value=False):
+                self.assertTrue(self.indexer._should_index_file(temp_path))
+        finally:
+            Path(temp_path).unlink()
+    
+    def test_should_index_file_skips_hash_when_stat_unchanged(self):
+        """Test unchanged mtime/size short-circuits the hash check"""
+        import os
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.py') as f:
+            f.write("print('hi')\n")
+            temp_path = f.name
+        
+        try:
+            st = os.stat(temp_path)
+            self.indexer.file_metadata[temp_path] = {
+                "hash": "stored_hash", "hash_alg": HASH_ALG, "mtime_ns": st.st_mtime_ns, "size": st.st_size
+            }
+            with patch.object(self.indexer, '_get_file_hash', return_value='stored_hash') as mock_hash:
+                self.assertFalse(self.indexer._should_index_file(temp_path))
+                mock_hash.assert_not_called()
+                
+                # Touched file with identical content: hashed once, then the new stat is reused
+                os.utime(temp_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+                self.assertFalse(self.indexer._should_index_file(temp_path))
+                self.assertFalse(self.indexer._should_index_file(temp_path))
+                mock_hash.assert_called_once_with(temp_path)
+        finally:
+            Path(temp_path).unlink()
+    
     def test_compute_file_hash(self):
         """Test file hash computation"""
         with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
@@ -155,6 +214,18 @@ class TestFileIndexer(unittest.TestCase):
         finally:
             Path(temp_path).unlink()
     
+    def test_compute_file_hash_large_file(self):
+        """Test mmap hashing of large files matches hashing the bytes"""
+        data = b"x = 1\n" * (_MMAP_MIN_SIZE // 3)
+        with tempfile.NamedTemporaryFile(mode='wb', delete=False) as f:
+            f.write(data)
+            temp_path = f.name
+        
+        try:
+            self.assertEqual(self.indexer._get_file_hash(temp_path), _digest(data))
+        finally:
+            Path(temp_path).unlink()
+    
     def test_split_into_chunks_small_file(self):
         """Test chunking for small files"""
         content = "Line 1\nLine 2\nLine 3\nLine 4\nLine 5"
@@ -202,6 +273,29 @@ class TestFileIndexer(unittest.TestCase):
             second_chunk_start = chunks[1].start_line
             self.assertLessEqual(second_chunk_start, first_chunk_end)
     
+    def test_chunk_line_numbers_match_content(self):
+        """Test start_line/end_line point at the lines each chunk contains"""
+        lines = [f"Line {i}: " + "x" * 20 for i in range(1, 41)]
+        content = "\n".join(lines)
+        
+        chunks = self.indexer._chunk_text(content, "/test/large.py")
+        
+        self.assertGreater(len(chunks), 2)
+        for chunk in chunks:
+            expected = "\n".join(lines[chunk.start_line - 1:chunk.end_line])
+            self.assertEqual(chunk.content, expected)
+        self.assertEqual(chunks[-1].end_line, len(lines))
+    
+    def test_chunk_bounds(self):
+        """Test chunk line ranges computed from a token prefix sum"""
+        # Four lines of three tokens each
+        cum = np.array([0, 3, 6, 9, 12], dtype=np.int64)
+        
+        bounds = _chunk_bounds(cum, 6, 3)
+        
+        self.assertEqual(bounds.tolist(), [[0, 2], [1, 3], [2, 4]])
+        self.assertEqual(_chunk_bounds(cum, 100, 0).tolist(), [[0, 4]])
+    
     def test_process_file(self):
         """Test processing a single file"""
         # This method doesn't exist in the current implementation
@@ -241,12 +335,17 @@ class TestFileIndexer(unittest.TestCase):
         self.indexer.file_metadata = test_metadata
         
         mock_file = mock_open()
-        with patch('builtins.open', mock_file):
+        with patch('builtins.open', mock_file), patch('indexer.os.replace') as mock_replace:
             self.indexer._save_file_metadata()
         
-        # Check that json.dump was called with correct data
+        # Written to a temp file, then moved over the real one
+        tmp_path = mock_file.call_args[0][0]
+        self.assertEqual(mock_file.call_args[0][1], 'wb')
+        mock_replace.assert_called_once_with(tmp_path, self.indexer.file_metadata_path)
+        
+        # Check that the serialized data is correct
         handle = mock_file()
-        written_content = ''.join(call.args[0] for call in handle.write.call_args_list)
+        written_content = b''.join(call.args[0] for call in handle.write.call_args_list)
         written_data = json.loads(written_content)
         
         self.assertEqual(written_data["/test/file.py"]["hash"], "test_hash")
@@ -312,6 +411,8 @@ class TestFileIndexerAsync(unittest.TestCase):
             self.mock_vectordb.delete_by_file = AsyncMock(return_value=None)
             self.mock_vectordb.switch_collection = MagicMock()
             
+            self.mock_vectordb.delete_by_files = AsyncMock(return_value=0)
+            
             # Set up existing metadata
             self.indexer.file_metadata = {
                 "/test/file1.py": {
@@ -334,6 +435,189 @@ class TestFileIndexerAsync(unittest.TestCase):
         
         asyncio.run(run_test())
 
+    
+    def test_index_directory_parallel_prepare(self):
+        """Test files are prepared on the worker pool and stored in one batch from the event loop"""
+        import pickle
+        import numpy as np
+        from concurrent.futures import ThreadPoolExecutor
+        from unittest.mock import AsyncMock
+        
+        # Worker entry point must be picklable for ProcessPoolExecutor
+        self.assertIs(pickle.loads(pickle.dumps(_prepare_file)), _prepare_file)
+        
+        async def run_test():
+            self.mock_vectordb.add_documents = AsyncMock(return_value=None)
+            self.mock_vectordb.delete_by_files = AsyncMock(return_value=0)
+            self.mock_vectordb.switch_collection = MagicMock()
+            self.mock_embedding_gen.batch_generate = AsyncMock(
+                side_effect=lambda texts: np.zeros((len(texts), 3), dtype=np.float32)
+            )
+            
+            with tempfile.TemporaryDirectory() as temp_dir:
+                (Path(temp_dir) / "a.py").write_text("def a():\n    return 1\n")
+                (Path(temp_dir) / "b.py").write_text("def b():\n    return 2\n")
+                # a.py was indexed before with different content
+                old_path = str(Path(temp_dir).resolve() / "a.py")
+                self.indexer.file_metadata = {old_path: {"hash": "old_hash"}}
+                
+                self.indexer.index_workers = 2
+                with ThreadPoolExecutor(max_workers=2) as pool, \
+                     patch.object(self.indexer, '_get_process_pool', return_value=pool), \
+                     patch.object(self.indexer, '_save_file_metadata'):
+                    stats = await self.indexer.index_directory(temp_dir)
+                
+                self.assertEqual(stats["files_processed"], 2)
+                self.assertEqual(stats["errors"], 0)
+                # One embedding call, one delete and one write for the whole batch
+                self.mock_embedding_gen.batch_generate.assert_awaited_once()
+                self.mock_vectordb.delete_by_files.assert_awaited_once_with([old_path])
+                self.mock_vectordb.add_documents.assert_awaited_once()
+                docs = self.mock_vectordb.add_documents.await_args.args[0]
+                self.assertFalse(self.mock_vectordb.add_documents.await_args.kwargs['assume_new'])
+                stored = {doc['metadata']['file_path'] for doc in docs}
+                self.assertEqual(stored, {str(Path(temp_dir).resolve() / "a.py"), str(Path(temp_dir).resolve() / "b.py")})
+                for path in stored:
+                    self.assertEqual(self.indexer.file_metadata[path]["hash"], _digest(Path(path).read_bytes()))
+                    self.assertEqual(self.indexer.file_metadata[path]["hash_alg"], HASH_ALG)
+        
+        asyncio.run(run_test())
+    
+    def test_index_file_stats_file_once(self):
+        """Test one stat is shared by the change check, size limit and stored metadata"""
+        import numpy as np
+        from unittest.mock import AsyncMock
+        
+        async def run_test():
+            self.mock_vectordb.add_documents = AsyncMock(return_value=None)
+            self.mock_vectordb.delete_by_files = AsyncMock(return_value=0)
+            self.mock_embedding_gen.batch_generate = AsyncMock(
+                side_effect=lambda texts: np.zeros((len(texts), 3), dtype=np.float32)
+            )
+            
+            with tempfile.TemporaryDirectory() as temp_dir:
+                file_path = Path(temp_dir) / "a.py"
+                file_path.write_text("def a():\n    return 1\n")
+                self.indexer.file_metadata = {str(file_path): {"hash": "old_hash"}}
+                
+                real_stat = os.stat
+                with patch('indexer.os.stat', side_effect=real_stat) as mock_stat, \
+                     patch('pathlib.Path.stat', side_effect=AssertionError("Path.stat called")), \
+                     patch.object(self.indexer, '_save_file_metadata'):
+                    chunks = await self.indexer.index_file(str(file_path))
+                
+                self.assertGreater(chunks, 0)
+                self.assertEqual(mock_stat.call_count, 1)
+                entry = self.indexer.file_metadata[str(file_path)]
+                self.assertEqual(entry["mtime_ns"], real_stat(file_path).st_mtime_ns)
+        
+        asyncio.run(run_test())
+    
+    def test_index_directory_hashes_touched_files_off_loop(self):
+        """Test touched files are hash-checked on the hash pool and only changed ones are stored"""
+        import numpy as np
+        from unittest.mock import AsyncMock
+        
+        async def run_test():
+            self.mock_vectordb.add_documents = AsyncMock(return_value=None)
+            self.mock_vectordb.delete_by_files = AsyncMock(return_value=0)
+            self.mock_embedding_gen.batch_generate = AsyncMock(
+                side_effect=lambda texts: np.zeros((len(texts), 3), dtype=np.float32)
+            )
+            
+            with tempfile.TemporaryDirectory() as temp_dir:
+                root = Path(temp_dir).resolve()
+                (root / "same.py").write_text("x = 1\n")
+                (root / "changed.py").write_text("x = 2\n")
+                # Both were indexed before with a different mtime; only changed.py differs in content
+                self.indexer.file_metadata = {
+                    str(root / "same.py"): {"hash": _digest(b"x = 1\n"), "hash_alg": HASH_ALG, "mtime_ns": 1, "size": 6},
+                    str(root / "changed.py"): {"hash": "old_hash", "mtime_ns": 1, "size": 6},
+                }
+                
+                self.indexer.index_workers = 1
+                with patch.object(self.indexer, '_get_file_hash', side_effect=AssertionError("hashed on the loop")), \
+                     patch.object(self.indexer, '_save_file_metadata'):
+                    stats = await self.indexer.index_directory(temp_dir)
+                
+                self.assertEqual(stats["files_processed"], 1)
+                self.assertEqual(stats["files_skipped"], 1)
+                self.mock_vectordb.delete_by_files.assert_awaited_once_with([str(root / "changed.py")])
+                # The unchanged file's new stat is remembered
+                self.assertNotEqual(self.indexer.file_metadata[str(root / "same.py")]["mtime_ns"], 1)
+        
+        asyncio.run(run_test())
+    
+    def test_index_directory_single_worker_uses_threads(self):
+        """Test index_workers=1 prepares files off the event loop without a process pool"""
+        import numpy as np
+        from unittest.mock import AsyncMock
+        
+        async def run_test():
+            self.mock_vectordb.add_documents = AsyncMock(return_value=None)
+            self.mock_vectordb.delete_by_files = AsyncMock(return_value=0)
+            self.mock_embedding_gen.batch_generate = AsyncMock(
+                side_effect=lambda texts: np.zeros((len(texts), 3), dtype=np.float32)
+            )
+            
+            with tempfile.TemporaryDirectory() as temp_dir:
+                for name in ("a.py", "b.py", "c.py"):
+                    (Path(temp_dir) / name).write_text(f"# {name}\nx = 1\n")
+                
+                self.indexer.index_workers = 1
+                with patch('indexer.ProcessPoolExecutor') as mock_pool_class, \
+                     patch.object(self.indexer, '_save_file_metadata'):
+                    stats = await self.indexer.index_directory(temp_dir)
+                
+                mock_pool_class.assert_not_called()
+                self.assertEqual(stats["files_processed"], 3)
+                self.assertEqual(stats["errors"], 0)
+                self.mock_embedding_gen.batch_generate.assert_awaited_once()
+        
+        asyncio.run(run_test())
+    
+    def test_index_directory_shuts_down_pools(self):
+        """Test the worker pools do not outlive index_directory"""
+        async def run_test():
+            self.mock_vectordb.switch_collection = MagicMock()
+            with tempfile.TemporaryDirectory() as temp_dir:
+                self.indexer.index_workers = 2
+                with patch('indexer.ProcessPoolExecutor') as mock_pool_class:
+                    hash_pool = self.indexer._get_hash_pool()
+                    await self.indexer.index_directory(temp_dir)
+                
+                mock_pool_class.return_value.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+                self.assertIsNone(self.indexer._process_pool)
+                self.assertIsNone(self.indexer._hash_pool)
+                with self.assertRaises(RuntimeError):
+                    hash_pool.submit(int)
+        
+        asyncio.run(run_test())
+    
+    def test_spawned_workers_skip_chromadb_and_embeddings(self):
+        """Test workers spawned under each entry script do not import the heavy modules"""
+        # Spawn re-runs the parent's __main__ file in every worker, so run a real pool
+        # with __main__ pointing at each entry script
+        code = (
+            "import multiprocessing, sys\n"
+            "from concurrent.futures import ProcessPoolExecutor\n"
+            "sys.path.insert(0, sys.argv[1])\n"
+            "sys.modules['__main__'].__file__ = sys.argv[2]\n"
+            "from chunking import _prepare_file\n"
+            "with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:\n"
+            "    pool.submit(_prepare_file, sys.argv[2], 100, 0).result()\n"
+            "    print(pool.submit(eval, \"sorted(m for m in ('chromadb', 'embeddings', 'vectordb', 'indexer', 'mcp') "
+            "if m in __import__('sys').modules)\").result())\n"
+        )
+        root = Path(__file__).parent.parent
+        for entry in ("server.py", "scripts/setup_index.py", "examples/index_directory.py"):
+            with self.subTest(entry=entry):
+                out = subprocess.run(
+                    [sys.executable, "-c", code, str(root / 'src'), str(root / entry)],
+                    capture_output=True, text=True, check=True, timeout=120,
+                )
+                self.assertEqual(out.stdout.strip(), "[]")
+        self.assertEqual(_prepare_file.__module__, "chunking")
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -5,13 +5,171 @@ Unit tests for SearchEngine class
 
 import asyncio
 from pathlib import Path
-from unittest.mock import MagicMock, patch, AsyncMock
+from types import MappingProxyType
+from unittest.mock import AsyncMock, Mock, mock_open, patch
 import unittest
 
-import sys
-sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+try:
+    import uvloop  # optional: pip install ".[dev]"
+except ImportError:
+    uvloop = None
 
-from search import SearchEngine
+try:
+    from search import SearchEngine
+except ImportError:
+    # tests/conftest.py puts src/ on sys.path under pytest; plain unittest runs add it here
+    import sys
+    sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+    from search import SearchEngine
+
+
+def _frozen_results(results):
+    """Read-only search results shared by every test (the engine never mutates them)"""
+    return tuple(
+        MappingProxyType({**r, 'metadata': MappingProxyType(r['metadata'])}) for r in results
+    )
+
+
+# Two chunks from different files
+_BASIC_RESULTS = _frozen_results([
+    {
+        'id': 'chunk1',
+        'content': 'def test_function():\n    pass',
+        'metadata': {
+            'file_path': '/test/file.py',
+            'start_line': 1,
+            'end_line': 2,
+            'chunk_index': 0
+        },
+        'score': 0.9
+    },
+    {
+        'id': 'chunk2',
+        'content': 'class TestClass:\n    pass',
+        'metadata': {
+            'file_path': '/test/class.py',
+            'start_line': 10,
+            'end_line': 11,
+            'chunk_index': 1
+        },
+        'score': 0.75
+    }
+])
+
+
+# Mock results with varying scores
+_SCORE_RESULTS = _frozen_results([
+    {'id': '1', 'content': 'high score', 'metadata': {}, 'score': 0.8},
+    {'id': '2', 'content': 'medium score', 'metadata': {}, 'score': 0.65},
+    {'id': '3', 'content': 'low score', 'metadata': {}, 'score': 0.4},  # Below threshold
+    {'id': '4', 'content': 'very low score', 'metadata': {}, 'score': 0.2}  # Below threshold
+])
+
+
+# Mock results with different file paths
+_PATH_RESULTS = _frozen_results([
+    {
+        'id': '1',
+        'content': 'test content',
+        'metadata': {'file_path': '/src/test.py'},
+        'score': 0.8
+    },
+    {
+        'id': '2',
+        'content': 'test content',
+        'metadata': {'file_path': '/tests/test.py'},
+        'score': 0.75
+    },
+    {
+        'id': '3',
+        'content': 'test content',
+        'metadata': {'file_path': '/src/main.py'},
+        'score': 0.7
+    }
+])
+
+
+# Chunks of two files, one of them twice
+_SIMILAR_RESULTS = _frozen_results([
+    {
+        'id': 'chunk1',
+        'metadata': {'file_path': '/test/similar1.py'},
+        'score': 0.9
+    },
+    {
+        'id': 'chunk2',
+        'metadata': {'file_path': '/test/similar2.py'},
+        'score': 0.85
+    },
+    {
+        'id': 'chunk3',
+        'metadata': {'file_path': '/test/similar1.py'},  # Duplicate file
+        'score': 0.8
+    }
+])
+
+
+# Include source file in results
+_SELF_RESULTS = _frozen_results([
+    {
+        'id': 'chunk1',
+        'metadata': {'file_path': '/test/source.py'},  # Same as source
+        'score': 1.0
+    },
+    {
+        'id': 'chunk2',
+        'metadata': {'file_path': '/test/other.py'},
+        'score': 0.8
+    }
+])
+
+
+# Mock results with duplicate files
+_DEDUP_RESULTS = _frozen_results([
+    {
+        'id': '1',
+        'content': 'chunk 1',
+        'metadata': {
+            'file_path': '/test/file.py',
+            'start_line': 1,
+            'end_line': 10,
+            'chunk_index': 0
+        },
+        'score': 0.9
+    },
+    {
+        'id': '2',
+        'content': 'chunk 2',
+        'metadata': {
+            'file_path': '/test/file.py',
+            'start_line': 8,
+            'end_line': 18,
+            'chunk_index': 1
+        },
+        'score': 0.85
+    },
+    {
+        'id': '3',
+        'content': 'chunk from other file',
+        'metadata': {
+            'file_path': '/test/other.py',
+            'start_line': 1,
+            'end_line': 10,
+            'chunk_index': 0
+        },
+        'score': 0.8
+    }
+])
+
+# Query embedding returned by the default generate() mock
+_EMB_VEC = (0.1, 0.2, 0.3)
+
+# Embedding failure raised by the error-handling test
+_EMB_ERR = RuntimeError("Embedding error")
+
+# File contents served through mock_open by the file-context tests
+_FILE_100_LINES = "".join(f"Line {i}\n" for i in range(1, 101))
+_FILE_20_LINES = "\n".join(f"Line {i}" for i in range(1, 21))
 
 
 class TestSearchEngine(unittest.TestCase):
@@ -25,11 +183,14 @@ class TestSearchEngine(unittest.TestCase):
         }
         
         # Mock dependencies
-        self.mock_vectordb = MagicMock()
-        self.mock_embeddings = MagicMock()
+        self.mock_vectordb = Mock()
+        self.mock_embeddings = Mock()
         
-        with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-            self.search_engine = SearchEngine(self.mock_vectordb, self.config)
+        # Active for the whole test, so engines built inside tests are patched too
+        patcher = patch('search.EmbeddingGenerator', return_value=self.mock_embeddings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.search_engine = SearchEngine(self.mock_vectordb, self.config)
     
     def test_initialization(self):
         """Test SearchEngine initialization"""
@@ -42,409 +203,218 @@ class TestSearchEngine(unittest.TestCase):
         """Test SearchEngine initialization with default values"""
         config = {}
         
-        with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-            search_engine = SearchEngine(self.mock_vectordb, config)
+        search_engine = SearchEngine(self.mock_vectordb, config)
         
         # Should use default values
         self.assertEqual(search_engine.default_limit, 10)
         self.assertEqual(search_engine.similarity_threshold, 0.5)
 
 
-class TestSearchEngineAsync(unittest.TestCase):
+class TestSearchEngineAsync(unittest.IsolatedAsyncioTestCase):
     """Test async methods of SearchEngine"""
     
-    def setUp(self):
-        """Set up test fixtures"""
-        self.config = {
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Run this class's loops on uvloop when available, without leaking the policy to other tests
+        cls._previous_policy = None
+        if uvloop is not None:
+            cls._previous_policy = asyncio.get_event_loop_policy()
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        
+        # SearchEngine holds no per-test state, so one instance serves the whole class
+        cls.config = {
             "search_limit": 5,
             "similarity_threshold": 0.6
         }
-        
-        # Mock dependencies
-        self.mock_vectordb = MagicMock()
-        self.mock_embeddings = MagicMock()
+        # The engine only awaits search() and generate(); tests just swap their results
+        cls._mock_vectordb = Mock()
+        cls._mock_vectordb.search = AsyncMock()
+        cls._mock_embeddings = Mock()
+        cls._mock_embeddings.generate = AsyncMock()
+        cls._emb_patch = patch('search.EmbeddingGenerator', return_value=cls._mock_embeddings)
+        cls._emb_patch.start()
+        cls.search_engine = SearchEngine(cls._mock_vectordb, cls.config)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls._emb_patch.stop()
+        if cls._previous_policy is not None:
+            asyncio.set_event_loop_policy(cls._previous_policy)
+        super().tearDownClass()
+    
+    async def asyncSetUp(self):
+        """Set up test fixtures"""
+        # Clear calls and results left by the previous test
+        self.mock_vectordb = self._mock_vectordb
+        self.mock_vectordb.search.reset_mock(return_value=True, side_effect=True)
+        self.mock_vectordb.search.return_value = []
+        self.mock_embeddings = self._mock_embeddings
+        self.mock_embeddings.generate.reset_mock(return_value=True, side_effect=True)
+        self.mock_embeddings.generate.return_value = list(_EMB_VEC)
     
-    def test_search_basic(self):
+    async def test_search_basic(self):
         """Test basic search functionality"""
-        async def run_test():
-            with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-                search_engine = SearchEngine(self.mock_vectordb, self.config)
-            
-            # Mock embedding generation
-            self.mock_embeddings.generate = AsyncMock(return_value=[0.1, 0.2, 0.3])
-            
-            # Mock vectordb search results
-            mock_results = [
-                {
-                    'id': 'chunk1',
-                    'content': 'def test_function():\n    pass',
-                    'metadata': {
-                        'file_path': '/test/file.py',
-                        'start_line': 1,
-                        'end_line': 2,
-                        'chunk_index': 0
-                    },
-                    'score': 0.9
-                },
-                {
-                    'id': 'chunk2',
-                    'content': 'class TestClass:\n    pass',
-                    'metadata': {
-                        'file_path': '/test/class.py',
-                        'start_line': 10,
-                        'end_line': 11,
-                        'chunk_index': 1
-                    },
-                    'score': 0.75
-                }
-            ]
-            self.mock_vectordb.search = AsyncMock(return_value=mock_results)
-            
-            # Perform search
-            results = await search_engine.search("test function")
-            
-            # Verify embedding was generated
-            self.mock_embeddings.generate.assert_called_once_with("test function")
-            
-            # Verify vectordb search was called
-            self.mock_vectordb.search.assert_called_once_with(
-                query_embedding=[0.1, 0.2, 0.3],
-                limit=5,
-                filter=None
-            )
-            
-            # Verify results
-            self.assertEqual(len(results), 2)
-            self.assertEqual(results[0]['file_path'], '/test/file.py')
-            self.assertEqual(results[0]['score'], 0.9)
-            self.assertEqual(results[1]['file_path'], '/test/class.py')
-            self.assertEqual(results[1]['score'], 0.75)
+        self.mock_vectordb.search.return_value = list(_BASIC_RESULTS)
         
-        asyncio.run(run_test())
-    
-    def test_search_with_custom_limit(self):
-        """Test search with custom limit"""
-        async def run_test():
-            with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-                search_engine = SearchEngine(self.mock_vectordb, self.config)
-            
-            self.mock_embeddings.generate = AsyncMock(return_value=[0.1, 0.2, 0.3])
-            self.mock_vectordb.search = AsyncMock(return_value=[])
-            
-            await search_engine.search("query", limit=20)
-            
-            # Should use custom limit
-            self.mock_vectordb.search.assert_called_once_with(
-                query_embedding=[0.1, 0.2, 0.3],
-                limit=20,
-                filter=None
-            )
+        # Perform search
+        results = await self.search_engine.search("test function")
         
-        asyncio.run(run_test())
-    
-    def test_search_with_file_type_filter(self):
-        """Test search with file type filter"""
-        async def run_test():
-            with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-                search_engine = SearchEngine(self.mock_vectordb, self.config)
-            
-            self.mock_embeddings.generate = AsyncMock(return_value=[0.1, 0.2, 0.3])
-            self.mock_vectordb.search = AsyncMock(return_value=[])
-            
-            await search_engine.search("query", file_type="python")
-            
-            # Should pass file type filter
-            self.mock_vectordb.search.assert_called_once_with(
-                query_embedding=[0.1, 0.2, 0.3],
-                limit=5,
-                filter={'language': 'python'}
-            )
+        # Verify embedding was generated
+        self.mock_embeddings.generate.assert_awaited_once_with("test function")
+        
+        # Verify vectordb search was called
+        self.mock_vectordb.search.assert_awaited_once_with(
+            query_embedding=list(_EMB_VEC),
+            limit=5,
+            filter=None
+        )
         
-        asyncio.run(run_test())
+        # Verify results
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['file_path'], '/test/file.py')
+        self.assertEqual(results[0]['score'], 0.9)
+        self.assertEqual(results[1]['file_path'], '/test/class.py')
+        self.assertEqual(results[1]['score'], 0.75)
     
-    def test_search_filters_by_score(self):
+    async def test_search_parameter_matrix(self):
+        """Test search forwards the default/custom limit and the file type filter"""
+        cases = [
+            ({}, {'limit': 5, 'filter': None}),
+            ({'limit': 20}, {'limit': 20, 'filter': None}),
+            ({'file_type': 'python'}, {'limit': 5, 'filter': {'language': 'python'}}),
+        ]
+        for kwargs, expected in cases:
+            with self.subTest(**kwargs):
+                self.mock_vectordb.search.reset_mock()
+                
+                await self.search_engine.search("query", **kwargs)
+                
+                self.mock_vectordb.search.assert_awaited_once_with(
+                    query_embedding=list(_EMB_VEC),
+                    **expected
+                )
+    
+    async def test_search_filters_by_score(self):
         """Test that search filters results by similarity score"""
-        async def run_test():
-            with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-                search_engine = SearchEngine(self.mock_vectordb, self.config)
-            
-            self.mock_embeddings.generate = AsyncMock(return_value=[0.1, 0.2, 0.3])
-            
-            # Mock results with varying scores
-            mock_results = [
-                {'id': '1', 'content': 'high score', 'metadata': {}, 'score': 0.8},
-                {'id': '2', 'content': 'medium score', 'metadata': {}, 'score': 0.65},
-                {'id': '3', 'content': 'low score', 'metadata': {}, 'score': 0.4},  # Below threshold
-                {'id': '4', 'content': 'very low score', 'metadata': {}, 'score': 0.2}  # Below threshold
-            ]
-            self.mock_vectordb.search = AsyncMock(return_value=mock_results)
-            
-            results = await search_engine.search("query")
-            
-            # Should filter out results below threshold (0.6)
-            self.assertEqual(len(results), 2)
-            self.assertEqual(results[0]['score'], 0.8)
-            self.assertEqual(results[1]['score'], 0.65)
+        self.mock_vectordb.search.return_value = list(_SCORE_RESULTS)
+        
+        results = await self.search_engine.search("query")
         
-        asyncio.run(run_test())
+        # Should filter out results below threshold (0.6)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['score'], 0.8)
+        self.assertEqual(results[1]['score'], 0.65)
     
-    def test_search_with_file_path_pattern(self):
+    async def test_search_with_file_path_pattern(self):
         """Test search with file path pattern filtering"""
-        async def run_test():
-            with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-                search_engine = SearchEngine(self.mock_vectordb, self.config)
-            
-            self.mock_embeddings.generate = AsyncMock(return_value=[0.1, 0.2, 0.3])
-            
-            # Mock results with different file paths
-            mock_results = [
-                {
-                    'id': '1',
-                    'content': 'test content',
-                    'metadata': {'file_path': '/src/test.py'},
-                    'score': 0.8
-                },
-                {
-                    'id': '2',
-                    'content': 'test content',
-                    'metadata': {'file_path': '/tests/test.py'},
-                    'score': 0.75
-                },
-                {
-                    'id': '3',
-                    'content': 'test content',
-                    'metadata': {'file_path': '/src/main.py'},
-                    'score': 0.7
-                }
-            ]
-            self.mock_vectordb.search = AsyncMock(return_value=mock_results)
-            
-            results = await search_engine.search("query", file_path_pattern="/src/")
-            
-            # Should only include files matching pattern
-            self.assertEqual(len(results), 2)
-            self.assertTrue(all('/src/' in r['file_path'] for r in results))
+        self.mock_vectordb.search.return_value = list(_PATH_RESULTS)
+        
+        results = await self.search_engine.search("query", file_path_pattern="/src/")
         
-        asyncio.run(run_test())
+        # Should only include files matching pattern
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all('/src/' in r['file_path'] for r in results))
     
-    def test_get_file_context(self):
+    async def test_get_file_context(self):
         """Test getting context around a specific line"""
-        async def run_test():
-            with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-                search_engine = SearchEngine(self.mock_vectordb, self.config)
+        # Mock file reading
+        with patch('builtins.open', mock_open(read_data=_FILE_100_LINES)):
             
-            # Mock file reading
-            file_lines = [f"Line {i}\n" for i in range(1, 101)]
+            context = await self.search_engine.get_file_context(
+                file_path="/test/file.py",
+                line_number=50,
+                context_lines=5
+            )
             
-            with patch('builtins.open', create=True) as mock_open:
-                mock_open.return_value.__enter__.return_value.readlines.return_value = file_lines
-                
-                context = await search_engine.get_file_context(
-                    file_path="/test/file.py",
-                    line_number=50,
-                    context_lines=5
-                )
-                
-                # Should return context around line 50
-                # line_number=50, context_lines=5 => start_line=45(0-based), end_line=55
-                # but start_line is returned as 1-based (46)
-                self.assertIn("Line 46", context['content'])
-                self.assertIn("Line 50", context['content'])
-                self.assertIn("Line 55", context['content'])
-                self.assertEqual(context['start_line'], 46)  # 1-based
-                self.assertEqual(context['end_line'], 55)
-        
-        asyncio.run(run_test())
+            # Should return context around line 50
+            # line_number=50, context_lines=5 => start_line=45(0-based), end_line=55
+            # but start_line is returned as 1-based (46)
+            self.assertIn("Line 46", context['content'])
+            self.assertIn("Line 50", context['content'])
+            self.assertIn("Line 55", context['content'])
+            self.assertEqual(context['start_line'], 46)  # 1-based
+            self.assertEqual(context['end_line'], 55)
     
-    def test_get_file_context_at_start(self):
+    async def test_get_file_context_at_start(self):
         """Test getting context at the beginning of file"""
-        async def run_test():
-            with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-                search_engine = SearchEngine(self.mock_vectordb, self.config)
+        with patch('builtins.open', mock_open(read_data=_FILE_20_LINES)):
             
-            file_content = "\n".join([f"Line {i}" for i in range(1, 21)])
+            context = await self.search_engine.get_file_context(
+                file_path="/test/file.py",
+                line_number=3,
+                context_lines=5
+            )
             
-            with patch('builtins.open', create=True) as mock_open:
-                mock_open.return_value.__enter__.return_value.readlines.return_value = file_content.split('\n')
+            # Should handle beginning of file correctly
+            self.assertIn("Line 1", context['content'])
+            self.assertIn("Line 3", context['content'])
+            self.assertIn("Line 8", context['content'])
+            self.assertEqual(context['start_line'], 1)
+            self.assertEqual(context['end_line'], 8)
+    
+    async def test_find_similar_files(self):
+        """Test finding similar files"""
+        # Mock file content and embedding
+        with patch('pathlib.Path.exists', return_value=True):
+            with patch('builtins.open', mock_open(read_data="test content")):
+                self.mock_vectordb.search.return_value = list(_SIMILAR_RESULTS)
                 
-                context = await search_engine.get_file_context(
-                    file_path="/test/file.py",
-                    line_number=3,
-                    context_lines=5
+                similar_files = await self.search_engine.find_similar_files(
+                    file_path="/test/source.py",
+                    limit=3
                 )
                 
-                # Should handle beginning of file correctly
-                self.assertIn("Line 1", context['content'])
-                self.assertIn("Line 3", context['content'])
-                self.assertIn("Line 8", context['content'])
-                self.assertEqual(context['start_line'], 1)
-                self.assertEqual(context['end_line'], 8)
-        
-        asyncio.run(run_test())
-    
-    def test_find_similar_files(self):
-        """Test finding similar files"""
-        async def run_test():
-            with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-                search_engine = SearchEngine(self.mock_vectordb, self.config)
-            
-            # Mock file content and embedding
-            with patch('pathlib.Path.exists', return_value=True):
-                with patch('builtins.open', create=True) as mock_open:
-                    mock_open.return_value.__enter__.return_value.read.return_value = "test content"
-                    
-                    self.mock_embeddings.generate = AsyncMock(return_value=[0.1, 0.2, 0.3])
-                    
-                    # Mock search results
-                    mock_results = [
-                        {
-                            'id': 'chunk1',
-                            'metadata': {'file_path': '/test/similar1.py'},
-                            'score': 0.9
-                        },
-                        {
-                            'id': 'chunk2',
-                            'metadata': {'file_path': '/test/similar2.py'},
-                            'score': 0.85
-                        },
-                        {
-                            'id': 'chunk3',
-                            'metadata': {'file_path': '/test/similar1.py'},  # Duplicate file
-                            'score': 0.8
-                        }
-                    ]
-                    self.mock_vectordb.search = AsyncMock(return_value=mock_results)
-                    
-                    similar_files = await search_engine.find_similar_files(
-                        file_path="/test/source.py",
-                        limit=3
-                    )
-                    
-                    # Should return unique files with averaged scores
-                    self.assertEqual(len(similar_files), 2)
-                    self.assertEqual(similar_files[0]['path'], '/test/similar1.py')
-                    # similar1.py appears twice with scores 0.9 and 0.8, average = 0.85
-                    self.assertAlmostEqual(similar_files[0]['similarity'], 0.85, places=2)
-                    self.assertEqual(similar_files[1]['path'], '/test/similar2.py')
-                    self.assertAlmostEqual(similar_files[1]['similarity'], 0.85, places=2)
-        
-        asyncio.run(run_test())
+                # Should return unique files with averaged scores
+                self.assertEqual(len(similar_files), 2)
+                self.assertEqual(similar_files[0]['path'], '/test/similar1.py')
+                # similar1.py appears twice with scores 0.9 and 0.8, average = 0.85
+                self.assertAlmostEqual(similar_files[0]['similarity'], 0.85, places=2)
+                self.assertEqual(similar_files[1]['path'], '/test/similar2.py')
+                self.assertAlmostEqual(similar_files[1]['similarity'], 0.85, places=2)
     
-    def test_find_similar_files_excludes_self(self):
+    async def test_find_similar_files_excludes_self(self):
         """Test that find_similar_files excludes the source file"""
-        async def run_test():
-            with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-                search_engine = SearchEngine(self.mock_vectordb, self.config)
-            
-            with patch('pathlib.Path.exists', return_value=True):
-                with patch('builtins.open', create=True) as mock_open:
-                    mock_open.return_value.__enter__.return_value.read.return_value = "content"
-                    
-                    self.mock_embeddings.generate = AsyncMock(return_value=[0.1, 0.2, 0.3])
-                    
-                    # Include source file in results
-                    mock_results = [
-                        {
-                            'id': 'chunk1',
-                            'metadata': {'file_path': '/test/source.py'},  # Same as source
-                            'score': 1.0
-                        },
-                        {
-                            'id': 'chunk2',
-                            'metadata': {'file_path': '/test/other.py'},
-                            'score': 0.8
-                        }
-                    ]
-                    self.mock_vectordb.search = AsyncMock(return_value=mock_results)
-                    
-                    similar_files = await search_engine.find_similar_files(
-                        file_path="/test/source.py",
-                        limit=5
-                    )
-                    
-                    # Should exclude source file
-                    self.assertEqual(len(similar_files), 1)
-                    self.assertEqual(similar_files[0]['path'], '/test/other.py')
-        
-        asyncio.run(run_test())
+        with patch('pathlib.Path.exists', return_value=True):
+            with patch('builtins.open', mock_open(read_data="content")):
+                self.mock_vectordb.search.return_value = list(_SELF_RESULTS)
+                
+                similar_files = await self.search_engine.find_similar_files(
+                    file_path="/test/source.py",
+                    limit=5
+                )
+                
+                # Should exclude source file
+                self.assertEqual(len(similar_files), 1)
+                self.assertEqual(similar_files[0]['path'], '/test/other.py')
     
-    def test_search_error_handling(self):
+    async def test_search_error_handling(self):
         """Test error handling in search"""
-        async def run_test():
-            with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-                search_engine = SearchEngine(self.mock_vectordb, self.config)
-            
-            # Mock embedding generation failure
-            self.mock_embeddings.generate = AsyncMock(side_effect=Exception("Embedding error"))
-            
-            results = await search_engine.search("query")
-            
-            # Should return empty results on error
-            self.assertEqual(results, [])
+        # Mock embedding generation failure
+        self.mock_embeddings.generate.side_effect = _EMB_ERR
+        
+        results = await self.search_engine.search("query")
         
-        asyncio.run(run_test())
+        # Should return empty results on error
+        self.assertEqual(results, [])
     
-    def test_deduplicate_results(self):
+    async def test_deduplicate_results(self):
         """Test result deduplication by file"""
-        async def run_test():
-            with patch('search.EmbeddingGenerator', return_value=self.mock_embeddings):
-                search_engine = SearchEngine(self.mock_vectordb, self.config)
-            
-            self.mock_embeddings.generate = AsyncMock(return_value=[0.1, 0.2, 0.3])
-            
-            # Mock results with duplicate files
-            mock_results = [
-                {
-                    'id': '1',
-                    'content': 'chunk 1',
-                    'metadata': {
-                        'file_path': '/test/file.py',
-                        'start_line': 1,
-                        'end_line': 10,
-                        'chunk_index': 0
-                    },
-                    'score': 0.9
-                },
-                {
-                    'id': '2',
-                    'content': 'chunk 2',
-                    'metadata': {
-                        'file_path': '/test/file.py',
-                        'start_line': 8,
-                        'end_line': 18,
-                        'chunk_index': 1
-                    },
-                    'score': 0.85
-                },
-                {
-                    'id': '3',
-                    'content': 'chunk from other file',
-                    'metadata': {
-                        'file_path': '/test/other.py',
-                        'start_line': 1,
-                        'end_line': 10,
-                        'chunk_index': 0
-                    },
-                    'score': 0.8
-                }
-            ]
-            self.mock_vectordb.search = AsyncMock(return_value=mock_results)
-            
-            results = await search_engine.search("query")
-            
-            # Check that duplicate chunks are merged
-            file_results = {}
-            for result in results:
-                file_path = result['file_path']
-                if file_path not in file_results:
-                    file_results[file_path] = result
-            
-            # Should have results from both files
-            self.assertEqual(len(file_results), 2)
-            self.assertIn('/test/file.py', file_results)
-            self.assertIn('/test/other.py', file_results)
+        self.mock_vectordb.search.return_value = list(_DEDUP_RESULTS)
+        
+        results = await self.search_engine.search("query")
+        
+        # Check that duplicate chunks are merged
+        file_results = {}
+        for result in results:
+            file_path = result['file_path']
+            if file_path not in file_results:
+                file_results[file_path] = result
         
-        asyncio.run(run_test())
+        # Should have results from both files
+        self.assertEqual(len(file_results), 2)
+        self.assertIn('/test/file.py', file_results)
+        self.assertIn('/test/other.py', file_results)
 
 
 if __name__ == "__main__":
@@ -5,46 +5,81 @@ Unit tests for VectorDB class
 
 import asyncio
 import tempfile
+import threading
 from pathlib import Path
 from unittest.mock import MagicMock, patch, call
+import json
 import unittest
 import shutil
 
-import sys
-sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+import numpy as np
 
-from vectordb import VectorDB
+from chromadb import ClientAPI, Collection
 
+try:
+    import vectordb  # importable after `pip install -e .` (or via tests/conftest.py)
+except ImportError:
+    import sys
+    sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 
-class TestVectorDB(unittest.TestCase):
+import vectordb as vectordb_module
+from vectordb import VectorDB, _file_indexes, _invalidate_query_cache, flush_file_indexes
+
+
+def _reset_module_state(index_path: str) -> None:
+    """Forget caches and sidecars a previous test left under the shared index path"""
+    _invalidate_query_cache()
+    _file_indexes.clear()
+    vectordb_module._dirty_file_indexes.clear()
+    vectordb_module._file_index_flushed_at.clear()
+    vectordb_module._file_index_misses.clear()
+    vectordb_module._sidecar_states.clear()
+    for sidecar in Path(index_path).glob('file_index.*.json'):
+        sidecar.unlink()
+
+
+def _fresh_mocks():
+    """New Chroma client and collection mocks for one test (specced so API drift fails loudly)"""
+    return MagicMock(spec=ClientAPI), MagicMock(spec=Collection)
+
+
+class _PatchedClientMixin:
+    """Builds a VectorDB on the patched PersistentClient returning the test's mocks"""
+    
+    def _install_patched_client(self, mock_chromadb, **kwargs) -> VectorDB:
+        mock_chromadb.return_value = self.mock_client
+        self.mock_client.get_collection.return_value = self.mock_collection
+        return VectorDB(self.config, **kwargs)
+
+
+class TestVectorDB(_PatchedClientMixin, unittest.TestCase):
     """Test VectorDB class"""
     
-    def setUp(self):
-        """Set up test fixtures"""
-        # Create temporary directory for testing
-        self.temp_dir = tempfile.mkdtemp()
-        
-        self.config = {
-            "index_path": self.temp_dir,
+    @classmethod
+    def setUpClass(cls):
+        """Create one index directory for the class (Chroma itself is mocked)"""
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.config = {
+            "index_path": cls.temp_dir,
             "collection_name": "test_collection"
         }
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the shared index directory"""
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        _reset_module_state(self.temp_dir)
         
         # Mock ChromaDB client
-        self.mock_client = MagicMock()
-        self.mock_collection = MagicMock()
-    
-    def tearDown(self):
-        """Clean up test fixtures"""
-        # Remove temporary directory
-        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        self.mock_client, self.mock_collection = _fresh_mocks()
     
     @patch('vectordb.chromadb.PersistentClient')
     def test_initialization(self, mock_chromadb):
         """Test VectorDB initialization"""
-        mock_chromadb.return_value = self.mock_client
-        self.mock_client.get_collection.return_value = self.mock_collection
-        
-        vectordb = VectorDB(self.config)
+        vectordb = self._install_patched_client(mock_chromadb)
         
         # Check that client was created with correct path
         mock_chromadb.assert_called_once()
@@ -79,10 +114,7 @@ class TestVectorDB(unittest.TestCase):
     @patch('vectordb.chromadb.PersistentClient')
     def test_custom_collection_name(self, mock_chromadb):
         """Test using custom collection name"""
-        mock_chromadb.return_value = self.mock_client
-        self.mock_client.get_collection.return_value = self.mock_collection
-        
-        vectordb = VectorDB(self.config, collection_name="custom_collection")
+        vectordb = self._install_patched_client(mock_chromadb, collection_name="custom_collection")
         
         self.assertEqual(vectordb.collection_name, "custom_collection")
         self.mock_client.get_collection.assert_called_with(name="custom_collection")
@@ -125,96 +157,225 @@ class TestVectorDB(unittest.TestCase):
         # Should return cached collection without creating
         self.assertEqual(collection, mock_cached_collection)
         self.mock_client.create_collection.assert_not_called()
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    def test_get_or_create_collection_caches_cold_name(self, mock_chromadb):
+        """Test that a collection looked up once is served from the cache afterwards"""
+        mock_other_collection = MagicMock()
+        vectordb = self._install_patched_client(mock_chromadb)
+        self.mock_client.get_collection.reset_mock()
+        self.mock_client.get_collection.return_value = mock_other_collection
+        
+        first = vectordb.get_or_create_collection("other_collection")
+        second = vectordb.get_or_create_collection("other_collection")
+        
+        self.assertIs(first, mock_other_collection)
+        self.assertIs(second, mock_other_collection)
+        self.mock_client.get_collection.assert_called_once_with(name="other_collection")
 
 
-class TestVectorDBAsync(unittest.TestCase):
+class TestVectorDBAsync(_PatchedClientMixin, unittest.IsolatedAsyncioTestCase):
     """Test async methods of VectorDB"""
     
-    def setUp(self):
-        """Set up test fixtures"""
-        self.temp_dir = tempfile.mkdtemp()
-        self.config = {
-            "index_path": self.temp_dir,
+    @classmethod
+    def setUpClass(cls):
+        """Create one index directory for the class (Chroma itself is mocked)"""
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.config = {
+            "index_path": cls.temp_dir,
             "collection_name": "test_collection"
         }
+        # One VectorDB for tests that never reconfigure the client; see _shared_vectordb()
+        cls.shared_mock_client, cls.shared_mock_collection = _fresh_mocks()
+        cls.shared_mock_client.get_collection.return_value = cls.shared_mock_collection
+        with patch('vectordb.chromadb.PersistentClient', return_value=cls.shared_mock_client):
+            cls.shared_vdb = VectorDB(cls.config)
+        # Built once: large enough to span several max-size batches
+        cls.big_docs = [
+            {'id': f'd{i}', 'content': f'c{i}', 'embedding': [0.0] * 8, 'metadata': {'file_path': f'/f{i}.py'}}
+            for i in range(10000)
+        ]
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the shared index directory"""
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        _reset_module_state(self.temp_dir)
         
-        self.mock_client = MagicMock()
-        self.mock_collection = MagicMock()
+        self.mock_client, self.mock_collection = _fresh_mocks()
     
-    def tearDown(self):
-        """Clean up test fixtures"""
-        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    def _shared_vectordb(self) -> VectorDB:
+        """Class-wide VectorDB with its mocks cleared, installed as this test's mocks"""
+        self.mock_client, self.mock_collection = self.shared_mock_client, self.shared_mock_collection
+        self.mock_client.reset_mock(return_value=True, side_effect=True)
+        self.mock_collection.reset_mock(return_value=True, side_effect=True)
+        self.mock_client.get_collection.return_value = self.mock_collection
+        self.shared_vdb.collection = self.mock_collection
+        self.shared_vdb.collections_cache.clear()
+        return self.shared_vdb
     
     @patch('vectordb.chromadb.PersistentClient')
-    def test_add_documents(self, mock_chromadb):
+    async def test_add_documents(self, mock_chromadb):
         """Test adding documents to collection"""
-        mock_chromadb.return_value = self.mock_client
-        self.mock_client.get_collection.return_value = self.mock_collection
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        documents = [
+            {
+                "id": "doc1",
+                "content": "Test content 1",
+                "embedding": [0.1, 0.2, 0.3],
+                "metadata": {"file_path": "/test/file1.py"}
+            },
+            {
+                "id": "doc2",
+                "content": "Test content 2",
+                "embedding": [0.4, 0.5, 0.6],
+                "metadata": {"file_path": "/test/file2.py"}
+            }
+        ]
         
-        async def run_test():
-            vectordb = VectorDB(self.config)
-            
-            documents = [
-                {
-                    "id": "doc1",
-                    "content": "Test content 1",
-                    "embedding": [0.1, 0.2, 0.3],
-                    "metadata": {"file_path": "/test/file1.py"}
-                },
-                {
-                    "id": "doc2",
-                    "content": "Test content 2",
-                    "embedding": [0.4, 0.5, 0.6],
-                    "metadata": {"file_path": "/test/file2.py"}
-                }
-            ]
-            
-            await vectordb.add_documents(documents)
-            
-            # Check that add was called with correct parameters
-            self.mock_collection.add.assert_called_once()
-            call_args = self.mock_collection.add.call_args[1]
-            
-            self.assertEqual(call_args['ids'], ["doc1", "doc2"])
-            self.assertEqual(call_args['documents'], ["Test content 1", "Test content 2"])
-            self.assertEqual(len(call_args['embeddings']), 2)
-            self.assertEqual(len(call_args['metadatas']), 2)
-        
-        asyncio.run(run_test())
+        await vectordb.add_documents(documents)
+        
+        # Check that upsert was called with correct parameters
+        self.mock_collection.upsert.assert_called_once()
+        call_args = self.mock_collection.upsert.call_args[1]
+        
+        self.assertEqual(call_args['ids'], ["doc1", "doc2"])
+        self.assertEqual(call_args['documents'], ["Test content 1", "Test content 2"])
+        self.assertEqual(len(call_args['embeddings']), 2)
+        self.assertEqual(call_args['embeddings'].dtype, np.float32)
+        self.assertEqual(len(call_args['metadatas']), 2)
     
     @patch('vectordb.chromadb.PersistentClient')
-    def test_add_documents_to_specific_collection(self, mock_chromadb):
+    async def test_add_documents_chunks_over_max_batch(self, mock_chromadb):
+        """Test that writes larger than Chroma's max batch size are split"""
+        self.mock_client.get_max_batch_size.return_value = 2
+        
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        documents = [
+            {"id": f"doc{i}", "content": f"Test {i}", "embedding": [0.1, 0.2], "metadata": {}}
+            for i in range(5)
+        ]
+        
+        await vectordb.add_documents(documents)
+        
+        self.assertEqual(self.mock_collection.upsert.call_count, 3)
+        batches = [c[1]['ids'] for c in self.mock_collection.upsert.call_args_list]
+        self.assertEqual(batches, [["doc0", "doc1"], ["doc2", "doc3"], ["doc4"]])
+        self.mock_client.get_max_batch_size.assert_called_once()
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_add_documents_batched(self, mock_chromadb):
+        """Test that a large add is split into consecutive max-size batches"""
+        self.mock_client.get_max_batch_size.return_value = 2500
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        await vectordb.add_documents(self.big_docs, assume_new=True)
+        
+        self.assertEqual(self.mock_collection.add.call_count, 4)
+        ids = [doc_id for c in self.mock_collection.add.call_args_list for doc_id in c[1]['ids']]
+        self.assertEqual(ids, [doc['id'] for doc in self.big_docs])
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_add_documents_to_specific_collection(self, mock_chromadb):
         """Test adding documents to a specific collection"""
-        mock_chromadb.return_value = self.mock_client
-        self.mock_client.get_collection.return_value = self.mock_collection
         mock_other_collection = MagicMock()
         
-        async def run_test():
-            vectordb = VectorDB(self.config)
-            vectordb.collections_cache["other_collection"] = mock_other_collection
-            
-            documents = [
-                {
-                    "id": "doc1",
-                    "content": "Test content",
-                    "embedding": [0.1, 0.2, 0.3],
-                    "metadata": {"file_path": "/test/file.py"}
-                }
-            ]
-            
-            await vectordb.add_documents(documents, collection_name="other_collection")
-            
-            # Should add to the specified collection, not default
-            mock_other_collection.add.assert_called_once()
-            self.mock_collection.add.assert_not_called()
+        vectordb = self._install_patched_client(mock_chromadb)
+        vectordb.collections_cache["other_collection"] = mock_other_collection
+        
+        documents = [
+            {
+                "id": "doc1",
+                "content": "Test content",
+                "embedding": [0.1, 0.2, 0.3],
+                "metadata": {"file_path": "/test/file.py"}
+            }
+        ]
         
-        asyncio.run(run_test())
+        await vectordb.add_documents(documents, collection_name="other_collection")
+        
+        # Should add to the specified collection, not default
+        mock_other_collection.upsert.assert_called_once()
+        self.mock_collection.upsert.assert_not_called()
     
     @patch('vectordb.chromadb.PersistentClient')
-    def test_search(self, mock_chromadb):
+    async def test_add_documents_upserts_in_single_call(self, mock_chromadb):
+        """Test that new and existing ids go through one upsert call"""
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        documents = [
+            {"id": "doc1", "content": "New", "embedding": [0.1, 0.2], "metadata": {}},
+            {"id": "doc2", "content": "Changed", "embedding": [0.3, 0.4], "metadata": {}}
+        ]
+        
+        await vectordb.add_documents(documents)
+        
+        self.mock_collection.get.assert_not_called()
+        self.mock_collection.update.assert_not_called()
+        self.mock_collection.add.assert_not_called()
+        self.mock_collection.upsert.assert_called_once()
+        self.assertEqual(self.mock_collection.upsert.call_args[1]['ids'], ["doc1", "doc2"])
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_add_documents_assume_new_skips_probe(self, mock_chromadb):
+        """Test that assume_new=True adds directly without probing existing ids"""
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        documents = [
+            {"id": "doc1", "content": "Test", "embedding": [0.1, 0.2], "metadata": {}}
+        ]
+        
+        await vectordb.add_documents(documents, assume_new=True)
+        
+        self.mock_collection.upsert.assert_not_called()
+        self.mock_collection.add.assert_called_once()
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_add_documents_concurrent(self, mock_chromadb):
+        """Test that gathered adds each reach Chroma from worker threads"""
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        await asyncio.gather(
+            vectordb.add_documents([{"id": "a", "content": "A", "embedding": [0.1], "metadata": {}}], assume_new=True),
+            vectordb.add_documents([{"id": "b", "content": "B", "embedding": [0.2], "metadata": {}}], assume_new=True),
+        )
+        
+        self.assertEqual(self.mock_collection.add.call_count, 2)
+        self.assertCountEqual([c[1]['ids'] for c in self.mock_collection.add.call_args_list], [["a"], ["b"]])
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_stats_and_metadata_update_run_off_loop(self, mock_chromadb):
+        """Test that count/get/update reach Chroma from worker threads"""
+        loop_thread = threading.get_ident()
+        seen = {}
+        
+        def record(name, result):
+            def call(*args, **kwargs):
+                seen[name] = threading.get_ident()
+                return result
+            return call
+        
+        self.mock_collection.count.side_effect = record('count', 2)
+        self.mock_collection.get.side_effect = record('get', {'metadatas': [{'language': 'python', 'file_path': '/a.py'}]})
+        self.mock_collection.update.side_effect = record('update', None)
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        stats = await vectordb.get_collection_stats()
+        self.assertTrue(await vectordb.update_metadata("doc1", {"file_path": "/a.py"}))
+        
+        self.assertEqual(stats['total_chunks'], 2)
+        self.assertEqual(stats['file_types'], {'python': 1})
+        self.assertEqual(set(seen), {'count', 'get', 'update'})
+        self.assertNotIn(loop_thread, seen.values())
+    
+    async def test_search(self):
         """Test searching documents"""
-        mock_chromadb.return_value = self.mock_client
-        self.mock_client.get_collection.return_value = self.mock_collection
+        vectordb = self._shared_vectordb()
         
         # Mock query results
         self.mock_collection.query.return_value = {
@@ -224,35 +385,46 @@ class TestVectorDBAsync(unittest.TestCase):
             'distances': [[0.1, 0.2]]
         }
         
-        async def run_test():
-            vectordb = VectorDB(self.config)
-            
-            results = await vectordb.search(
-                query_embedding=[0.1, 0.2, 0.3],
-                limit=5
-            )
-            
-            # Check query was called correctly
-            self.mock_collection.query.assert_called_once_with(
-                query_embeddings=[[0.1, 0.2, 0.3]],
-                n_results=5,
-                where=None
-            )
-            
-            # Check results format
-            self.assertEqual(len(results), 2)
-            self.assertEqual(results[0]['id'], 'doc1')
-            self.assertEqual(results[0]['content'], 'Content 1')
-            self.assertEqual(results[0]['metadata']['file_path'], '/test/file1.py')
-            self.assertEqual(results[0]['score'], 0.9)  # 1 - distance
-        
-        asyncio.run(run_test())
+        results = await vectordb.search(
+            query_embedding=[0.1, 0.2, 0.3],
+            limit=5
+        )
+        
+        # Check query was called correctly
+        self.mock_collection.query.assert_called_once()
+        call_args = self.mock_collection.query.call_args[1]
+        self.assertEqual(call_args['query_embeddings'].dtype, np.float32)
+        np.testing.assert_allclose(call_args['query_embeddings'], [[0.1, 0.2, 0.3]], rtol=1e-6)
+        self.assertEqual(call_args['n_results'], 5)
+        self.assertIsNone(call_args['where'])
+        
+        # Check results format
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['id'], 'doc1')
+        self.assertEqual(results[0]['content'], 'Content 1')
+        self.assertEqual(results[0]['metadata']['file_path'], '/test/file1.py')
+        self.assertEqual(results[0]['score'], 0.9)  # 1 - distance
     
     @patch('vectordb.chromadb.PersistentClient')
-    def test_search_with_filter(self, mock_chromadb):
+    async def test_search_large_result_scores(self, mock_chromadb):
+        """Test that vectorized scoring of large results matches 1 - distance"""
+        distances = [i / 1000 for i in range(300)]
+        self.mock_collection.query.return_value = {
+            'ids': [[f'doc{i}' for i in range(300)]],
+            'documents': [[''] * 300],
+            'metadatas': [[{} for _ in range(300)]],
+            'distances': [distances]
+        }
+        
+        vectordb = self._install_patched_client(mock_chromadb)
+        results = await vectordb.search(query_embedding=[0.1, 0.2, 0.3], limit=300)
+        
+        self.assertEqual([r['score'] for r in results], [1 - d for d in distances])
+        self.assertIsInstance(results[0]['score'], float)
+    
+    async def test_search_with_filter(self):
         """Test searching with metadata filter"""
-        mock_chromadb.return_value = self.mock_client
-        self.mock_client.get_collection.return_value = self.mock_collection
+        vectordb = self._shared_vectordb()
         
         self.mock_collection.query.return_value = {
             'ids': [['doc1']],
@@ -261,71 +433,330 @@ class TestVectorDBAsync(unittest.TestCase):
             'distances': [[0.15]]
         }
         
-        async def run_test():
-            vectordb = VectorDB(self.config)
-            
-            results = await vectordb.search(
-                query_embedding=[0.1, 0.2, 0.3],
-                limit=10,
-                filter={'file_type': 'python'}
-            )
-            
-            # Check filter was passed to query
-            self.mock_collection.query.assert_called_once_with(
-                query_embeddings=[[0.1, 0.2, 0.3]],
-                n_results=10,
-                where={'file_type': 'python'}
-            )
-            
-            self.assertEqual(len(results), 1)
-            self.assertEqual(results[0]['metadata']['file_type'], 'python')
-        
-        asyncio.run(run_test())
+        results = await vectordb.search(
+            query_embedding=[0.1, 0.2, 0.3],
+            limit=10,
+            filter={'file_type': 'python'}
+        )
+        
+        # Check filter was passed to query
+        self.mock_collection.query.assert_called_once()
+        call_args = self.mock_collection.query.call_args[1]
+        np.testing.assert_allclose(call_args['query_embeddings'], [[0.1, 0.2, 0.3]], rtol=1e-6)
+        self.assertEqual(call_args['n_results'], 10)
+        self.assertEqual(call_args['where'], {'file_type': 'python'})
+        
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['metadata']['file_type'], 'python')
     
     @patch('vectordb.chromadb.PersistentClient')
-    def test_delete_by_file(self, mock_chromadb):
+    async def test_search_repeated_query_hits_cache(self, mock_chromadb):
+        """Test that an identical repeat query is served without hitting Chroma"""
+        self.mock_collection.query.return_value = {
+            'ids': [['doc1']],
+            'documents': [['Content 1']],
+            'metadatas': [[{'file_path': '/test/file1.py'}]],
+            'distances': [[0.1]]
+        }
+        
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        first = await vectordb.search(query_embedding=[0.1, 0.2, 0.3], limit=5)
+        second = await vectordb.search(query_embedding=[0.1, 0.2, 0.3], limit=5)
+        
+        self.mock_collection.query.assert_called_once()
+        self.assertEqual(first, second)
+        
+        # A different limit is a different query
+        await vectordb.search(query_embedding=[0.1, 0.2, 0.3], limit=3)
+        self.assertEqual(self.mock_collection.query.call_count, 2)
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_search_cache_returns_copies(self, mock_chromadb):
+        """Test that callers mutating results do not change what later hits return"""
+        self.mock_collection.query.return_value = {
+            'ids': [['doc1']],
+            'documents': [['Content 1']],
+            'metadatas': [[{'file_path': '/test/file1.py'}]],
+            'distances': [[0.1]]
+        }
+        
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        first = await vectordb.search(query_embedding=[0.1, 0.2, 0.3], limit=5)
+        first[0]['score'] = 99
+        first[0]['metadata']['file_path'] = '/changed.py'
+        second = await vectordb.search(query_embedding=[0.1, 0.2, 0.3], limit=5)
+        second[0]['content'] = 'enriched'
+        third = await vectordb.search(query_embedding=[0.1, 0.2, 0.3], limit=5)
+        
+        self.mock_collection.query.assert_called_once()
+        self.assertEqual(third[0]['score'], 0.9)
+        self.assertEqual(third[0]['content'], 'Content 1')
+        self.assertEqual(third[0]['metadata'], {'file_path': '/test/file1.py'})
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_search_cache_entries_expire(self, mock_chromadb):
+        """Test cached results expire, since other processes' writes do not invalidate them"""
+        self.mock_collection.query.return_value = {
+            'ids': [['doc1']], 'documents': [['Content 1']],
+            'metadatas': [[{'file_path': '/test/file1.py'}]], 'distances': [[0.1]]
+        }
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        await vectordb.search(query_embedding=[0.1, 0.2, 0.3], limit=5)
+        await vectordb.search(query_embedding=[0.1, 0.2, 0.3], limit=5)
+        self.mock_collection.query.assert_called_once()
+        
+        # Age the entry past the TTL
+        for key, (stored_at, results) in list(vectordb_module._query_cache.items()):
+            vectordb_module._query_cache[key] = (stored_at - vectordb.query_cache_ttl, results)
+        await vectordb.search(query_embedding=[0.1, 0.2, 0.3], limit=5)
+        self.assertEqual(self.mock_collection.query.call_count, 2)
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_search_cache_invalidated_on_write(self, mock_chromadb):
+        """Test that writes drop cached search results"""
+        self.mock_collection.query.return_value = {
+            'ids': [['doc1']],
+            'documents': [['Content 1']],
+            'metadatas': [[{'file_path': '/test/file1.py'}]],
+            'distances': [[0.1]]
+        }
+        
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        await vectordb.search(query_embedding=[0.1, 0.2, 0.3], limit=5)
+        await vectordb.delete_by_file("/test/file1.py")
+        await vectordb.search(query_embedding=[0.1, 0.2, 0.3], limit=5)
+        
+        self.assertEqual(self.mock_collection.query.call_count, 2)
+    
+    async def test_delete_by_file(self):
         """Test deleting documents by file path"""
-        mock_chromadb.return_value = self.mock_client
-        self.mock_client.get_collection.return_value = self.mock_collection
+        vectordb = self._shared_vectordb()
         
-        async def run_test():
-            vectordb = VectorDB(self.config)
-            
-            await vectordb.delete_by_file("/test/file.py")
-            
-            # Check delete was called with correct filter
-            self.mock_collection.delete.assert_called_once_with(
-                where={"file_path": "/test/file.py"}
-            )
+        await vectordb.delete_by_file("/test/file.py")
         
-        asyncio.run(run_test())
+        # Check delete was called with correct filter
+        self.mock_collection.delete.assert_called_once_with(
+            where={"file_path": "/test/file.py"}
+        )
     
     @patch('vectordb.chromadb.PersistentClient')
-    def test_delete_by_file_specific_collection(self, mock_chromadb):
+    async def test_delete_by_file_specific_collection(self, mock_chromadb):
         """Test deleting documents from specific collection"""
-        mock_chromadb.return_value = self.mock_client
-        self.mock_client.get_collection.return_value = self.mock_collection
         mock_other_collection = MagicMock()
         
-        async def run_test():
-            vectordb = VectorDB(self.config)
-            vectordb.collections_cache["other_collection"] = mock_other_collection
-            
-            await vectordb.delete_by_file("/test/file.py", collection_name="other_collection")
-            
-            # Should delete from specified collection
-            mock_other_collection.delete.assert_called_once_with(
-                where={"file_path": "/test/file.py"}
-            )
-            self.mock_collection.delete.assert_not_called()
+        vectordb = self._install_patched_client(mock_chromadb)
+        vectordb.collections_cache["other_collection"] = mock_other_collection
+        
+        await vectordb.delete_by_file("/test/file.py", collection_name="other_collection")
+        
+        # Should delete from specified collection
+        mock_other_collection.delete.assert_called_once_with(
+            where={"file_path": "/test/file.py"}
+        )
+        self.mock_collection.delete.assert_not_called()
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_delete_by_file_uses_file_index(self, mock_chromadb):
+        """Test that known files are deleted by chunk id and the sidecar is updated"""
+        self.mock_collection.get.return_value = {
+            'ids': ['a', 'b', 'c'],
+            'metadatas': [
+                {'file_path': '/test/x.py'},
+                {'file_path': '/test/x.py'},
+                {'file_path': '/test/y.py'}
+            ]
+        }
+        
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        await vectordb.delete_by_file("/test/x.py")
+        
+        call_args = self.mock_collection.delete.call_args[1]
+        self.assertCountEqual(call_args['ids'], ['a', 'b'])
+        self.assertNotIn('where', call_args)
+        
+        await flush_file_indexes()
+        with open(Path(self.temp_dir) / 'file_index.test_collection.json') as f:
+            self.assertEqual(json.load(f), {'/test/y.py': ['c']})
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_file_index_persisted_lazily(self, mock_chromadb):
+        """Test writes within the flush interval leave no sidecar until it is flushed"""
+        loop_thread = threading.get_ident()
+        get_threads = []
+        page = {
+            'ids': ['a', 'b', 'c'],
+            'metadatas': [{'file_path': '/test/x.py'}, {'file_path': '/test/y.py'}, {'file_path': '/test/z.py'}]
+        }
+        
+        def get(*args, **kwargs):
+            get_threads.append(threading.get_ident())
+            return page
+        
+        self.mock_collection.get.side_effect = get
+        vectordb = self._install_patched_client(mock_chromadb)
+        sidecar = Path(self.temp_dir) / 'file_index.test_collection.json'
+        
+        await vectordb.delete_by_file("/test/x.py")  # rebuild + first flush
+        self.mock_collection.count.return_value = 2
+        with patch('vectordb._write_sidecar') as mock_write:
+            await vectordb.delete_by_file("/test/y.py")
+            mock_write.assert_not_called()
+        
+        # Rebuilding from Chroma ran in a worker thread
+        self.assertTrue(get_threads)
+        self.assertNotIn(loop_thread, get_threads)
+        # Dirty and unflushed: no sidecar that could be trusted after a crash
+        self.assertFalse(sidecar.exists())
+        
+        await flush_file_indexes()
+        with open(sidecar) as f:
+            self.assertEqual(json.load(f), {'/test/z.py': ['c']})
+        self.assertEqual(list(Path(self.temp_dir).glob('*.tmp')), [])
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_delete_by_files_single_call_for_known_files(self, mock_chromadb):
+        """Test known files are deleted together by id; unknown files fall back to a filter"""
+        self.mock_collection.get.return_value = {
+            'ids': ['a', 'b', 'c'],
+            'metadatas': [
+                {'file_path': '/test/x.py'},
+                {'file_path': '/test/y.py'},
+                {'file_path': '/test/z.py'}
+            ]
+        }
+        
+        vectordb = self._install_patched_client(mock_chromadb)
         
-        asyncio.run(run_test())
+        await vectordb.delete_by_files(["/test/x.py", "/test/y.py", "/test/new.py"])
+        
+        self.assertEqual(self.mock_collection.delete.call_count, 2)
+        by_id, by_filter = self.mock_collection.delete.call_args_list
+        self.assertCountEqual(by_id[1]['ids'], ['a', 'b'])
+        self.assertEqual(by_filter[1], {'where': {'file_path': '/test/new.py'}})
+        
+        await flush_file_indexes()
+        with open(Path(self.temp_dir) / 'file_index.test_collection.json') as f:
+            self.assertEqual(json.load(f), {'/test/z.py': ['c']})
     
     @patch('vectordb.chromadb.PersistentClient')
-    def test_get_all_files(self, mock_chromadb):
+    async def test_delete_by_files_batched(self, mock_chromadb):
+        """Test that several unknown files are deleted with one $in filter"""
+        self.mock_collection.get.return_value = {'ids': [], 'metadatas': []}
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        await vectordb.delete_by_files(['/a', '/b', '/c'])
+        
+        self.mock_collection.delete.assert_called_once_with(
+            where={"file_path": {"$in": ['/a', '/b', '/c']}}
+        )
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_file_index_tracks_added_documents(self, mock_chromadb):
+        """Test that ids added after the index is loaded are deleted by id"""
+        self.mock_collection.get.return_value = {'ids': [], 'metadatas': []}
+        
+        vectordb = self._install_patched_client(mock_chromadb)
+        await vectordb.delete_by_file("/test/unknown.py")
+        
+        await vectordb.add_documents([
+            {"id": "doc1", "content": "Test", "embedding": [0.1, 0.2],
+             "metadata": {"file_path": "/test/new.py"}}
+        ])
+        self.mock_collection.count.return_value = 1
+        await vectordb.delete_by_file("/test/new.py")
+        
+        self.assertEqual(self.mock_collection.delete.call_args[1], {'ids': ['doc1']})
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_add_during_file_index_load_is_not_lost(self, mock_chromadb):
+        """Test chunks added while the index loads are still deleted by a later delete"""
+        loading, release = threading.Event(), threading.Event()
+        pages = [
+            {'ids': ['a'], 'metadatas': [{'file_path': '/test/x.py'}]},
+            {'ids': ['a', 'new'], 'metadatas': [{'file_path': '/test/x.py'}, {'file_path': '/test/x.py'}]},
+        ]
+        
+        def get(*args, **kwargs):
+            page = pages.pop(0)
+            if pages:
+                # First load: snapshot taken, then wait for the add to land
+                loading.set()
+                release.wait(5)
+            return page
+        
+        self.mock_collection.get.side_effect = get
+        vectordb = self._install_patched_client(mock_chromadb)
+        
+        delete = asyncio.create_task(vectordb.delete_by_file("/test/x.py"))
+        await asyncio.to_thread(loading.wait, 5)
+        await vectordb.add_documents([
+            {"id": "new", "content": "Test", "embedding": [0.1, 0.2], "metadata": {"file_path": "/test/x.py"}}
+        ])
+        release.set()
+        await delete
+        
+        self.assertCountEqual(self.mock_collection.delete.call_args[1]['ids'], ['a', 'new'])
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_file_index_reloaded_after_other_process_writes(self, mock_chromadb):
+        """Test a sidecar rewritten by another process makes the loaded index reload"""
+        self.mock_collection.get.side_effect = [
+            {'ids': ['a', 'b'], 'metadatas': [{'file_path': '/test/x.py'}, {'file_path': '/test/y.py'}]},
+            # The other process reindexed y.py (same chunk count, new id)
+            {'ids': ['b2'], 'metadatas': [{'file_path': '/test/y.py'}]},
+        ]
+        vectordb = self._install_patched_client(mock_chromadb)
+        sidecar = Path(self.temp_dir) / 'file_index.test_collection.json'
+        
+        await vectordb.delete_by_file("/test/x.py")
+        await flush_file_indexes()
+        self.mock_collection.count.return_value = 1
+        
+        sidecar.write_text(json.dumps({'/test/y.py': ['b2']}) + "\n")
+        await vectordb.delete_by_file("/test/y.py")
+        
+        self.assertEqual(self.mock_collection.delete.call_args[1], {'ids': ['b2']})
+    
+    @patch('vectordb.chromadb.PersistentClient')
+    async def test_rename_file_moves_chunks(self, mock_chromadb):
+        """Test renaming re-keys a file's chunks to the new path with their stored embeddings"""
+        index_page = {
+            'ids': ['/test/old.py:0:aa', '/test/old.py:1:bb'],
+            'metadatas': [{'file_path': '/test/old.py'}, {'file_path': '/test/old.py'}]
+        }
+        chunks = {
+            'ids': ['/test/old.py:0:aa', '/test/old.py:1:bb'],
+            'documents': ['a', 'b'],
+            'embeddings': [[0.1, 0.2], [0.3, 0.4]],
+            'metadatas': [
+                {'file_path': '/test/old.py', 'chunk_index': 0},
+                {'file_path': '/test/old.py', 'chunk_index': 1}
+            ]
+        }
+        self.mock_collection.get.side_effect = [index_page, chunks]
+        
+        vectordb = self._install_patched_client(mock_chromadb)
+        moved = await vectordb.rename_file("/test/old.py", "/test/new.py")
+        
+        self.assertEqual(moved, 2)
+        upsert = self.mock_collection.upsert.call_args[1]
+        self.assertEqual(upsert['ids'], ['/test/new.py:0:aa', '/test/new.py:1:bb'])
+        self.assertEqual(upsert['embeddings'], chunks['embeddings'])
+        self.assertEqual([m['file_path'] for m in upsert['metadatas']], ['/test/new.py', '/test/new.py'])
+        self.mock_collection.delete.assert_called_once_with(ids=chunks['ids'])
+        
+        await flush_file_indexes()
+        with open(Path(self.temp_dir) / 'file_index.test_collection.json') as f:
+            self.assertEqual(json.load(f), {'/test/new.py': ['/test/new.py:0:aa', '/test/new.py:1:bb']})
+    
+    async def test_get_all_files(self):
         """Test getting all indexed files"""
-        mock_chromadb.return_value = self.mock_client
-        self.mock_client.get_collection.return_value = self.mock_collection
+        vectordb = self._shared_vectordb()
         
         # Mock getting all documents
         self.mock_collection.get.return_value = {
@@ -337,37 +768,25 @@ class TestVectorDBAsync(unittest.TestCase):
             ]
         }
         
-        async def run_test():
-            vectordb = VectorDB(self.config)
-            
-            files = await vectordb.get_all_files()
-            
-            # Should return unique file paths
-            self.assertEqual(len(files), 3)
-            self.assertIn('/test/file1.py', files)
-            self.assertIn('/test/file2.py', files)
-            self.assertIn('/test/file3.js', files)
-            
-            # Check that get was called
-            self.mock_collection.get.assert_called_once()
-        
-        asyncio.run(run_test())
+        files = await vectordb.get_all_files()
+        
+        # Should return unique file paths
+        self.assertEqual(len(files), 3)
+        self.assertIn('/test/file1.py', files)
+        self.assertIn('/test/file2.py', files)
+        self.assertIn('/test/file3.js', files)
+        
+        # Check that get was called
+        self.mock_collection.get.assert_called_once()
     
-    @patch('vectordb.chromadb.PersistentClient')
-    def test_clear_collection(self, mock_chromadb):
+    async def test_clear_collection(self):
         """Test clearing a collection"""
-        mock_chromadb.return_value = self.mock_client
-        self.mock_client.get_collection.return_value = self.mock_collection
+        vectordb = self._shared_vectordb()
         
-        async def run_test():
-            vectordb = VectorDB(self.config)
-            
-            await vectordb.clear()
-            
-            # Should delete collection
-            self.mock_client.delete_collection.assert_called_once_with(name="test_collection")
+        await vectordb.clear()
         
-        asyncio.run(run_test())
+        # Should delete collection
+        self.mock_client.delete_collection.assert_called_once_with(name="test_collection")
 
 
 if __name__ == "__main__":